@@ -0,0 +1,424 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import importlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from llm_cache import ResponseCache, response_cache
+from llm_backend import OpenAIBackend, get_backend
+from llm_client import usage_tracker
+from structured_output import exam_response_ok, pitch_response_ok
+from run_example import AGENTS, collect_input_files, load_document
+
+# Config
+BATCH_RUNNER = os.getenv("BATCH_RUNNER", "openai")
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", 60))
+BATCH_LOCAL_WORKERS = int(os.getenv("BATCH_LOCAL_WORKERS", 8))
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+# Batch API limit on requests per input file
+MAX_BATCH_REQUESTS = 50000
+
+# Files kept in a batch's work directory
+REQUESTS_FILE = "requests.jsonl"
+OUTPUT_FILE = "output.jsonl"
+MANIFEST_FILE = "manifest.json"
+
+# Batch lifecycle (as reported by the Batch API)
+COMPLETED = "completed"
+TERMINAL_STATUSES = (COMPLETED, "failed", "expired", "cancelled")
+
+
+def agent_module(agent_type: str):
+    return importlib.import_module(AGENTS[agent_type][0])
+
+
+def chat_request(custom_id: str, system: str, user: str, params: dict) -> dict:
+    """
+    One Batch API line: the chat request the agent would send synchronously.
+    """
+    body = {name: value for name, value in params.items() if value is not None}
+    body["messages"] = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+    return {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+
+
+def custom_ids(paths: List[Path]) -> Dict[str, Path]:
+    """
+    Request ids for the submissions: the student (file stem), made unique
+    with the file's position when two files share a stem.
+    """
+    stems = [path.stem for path in paths]
+    return {
+        (stem if stems.count(stem) == 1 else f"{i}-{stem}"): path
+        for i, (stem, path) in enumerate(zip(stems, paths))
+    }
+
+
+def build_requests(agent_type: str, submissions: Dict[str, Path], questions_file=None, rubric_file=None,
+                   workers: int = 4) -> List[dict]:
+    """
+    Builds the grading request of every submission with the agent's own
+    prompt builder and parameters. Exam answers are extracted here; pitches
+    are transcribed and analyzed here (transcription is not part of the
+    chat batch).
+    """
+    module = agent_module(agent_type)
+    params = module.chat_params()
+
+    if agent_type == "vc":
+        def build(custom_id: str, path: Path) -> dict:
+            wpm, silence, transcript, duration = module.analyze_audio(str(path))
+            prompt = module.build_vc_prompt(transcript, wpm, silence, duration)
+            return chat_request(custom_id, module.SYSTEM_PROMPT, prompt, params)
+    else:
+        questions = load_document(questions_file)
+        rubric = load_document(rubric_file) if rubric_file else None
+        build_prompt = (module.build_tech_grading_prompt if agent_type == "technical"
+                        else module.build_narrative_prompt)
+
+        def build(custom_id: str, path: Path) -> dict:
+            prompts = build_prompt(questions, load_document(path), rubric)
+            return chat_request(custom_id, prompts["system"], prompts["user"], params)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return list(pool.map(build, submissions, submissions.values()))
+
+
+def write_jsonl(path: Path, lines) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def read_jsonl(text: str) -> List[dict]:
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+class OpenAIBatchRunner:
+    """
+    OpenAI Batch API: the request file is uploaded and processed
+    asynchronously (within BATCH_COMPLETION_WINDOW) at the batch discount,
+    on a rate-limit pool separate from interactive traffic.
+    """
+    name = "openai"
+    # Batch responses come from the real model, so they may warm the response cache
+    cacheable = True
+
+    def __init__(self, base_url: Optional[str] = None):
+        self.backend = OpenAIBackend(base_url=base_url or os.getenv("LLM_BASE_URL"))
+
+    def submit(self, requests_file: Path, metadata: Optional[dict] = None) -> str:
+        client = self.backend.client()
+        with open(requests_file, "rb") as f:
+            uploaded = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(input_file_id=uploaded.id, endpoint=BATCH_ENDPOINT,
+                                      completion_window=BATCH_COMPLETION_WINDOW, metadata=metadata)
+        return batch.id
+
+    def status(self, batch_id: str) -> dict:
+        batch = self.backend.client().batches.retrieve(batch_id)
+        counts = batch.request_counts
+        return {
+            "status": batch.status,
+            "completed": counts.completed if counts else 0,
+            "failed": counts.failed if counts else 0,
+            "total": counts.total if counts else 0,
+            "output_file_id": batch.output_file_id,
+            "error_file_id": batch.error_file_id,
+        }
+
+    def results(self, batch_id: str) -> List[dict]:
+        state = self.status(batch_id)
+        lines = []
+        for file_id in (state["output_file_id"], state["error_file_id"]):
+            if file_id:
+                lines += read_jsonl(self.backend.client().files.content(file_id).text)
+        return lines
+
+
+class LocalBatchRunner:
+    """
+    Offline stand-in for the Batch API: processes a request file in a
+    background thread through the configured backend (LLM_BACKEND=fake or
+    local for fully offline runs) and writes output in the Batch API's
+    format next to it. The batch id is the output file's path.
+
+    With a `completion_window` (seconds), requests still unfinished when it
+    closes are dropped and the batch ends "expired", as a Batch API batch
+    that runs past BATCH_COMPLETION_WINDOW does.
+    """
+    name = "local"
+
+    def __init__(self, workers: int = BATCH_LOCAL_WORKERS, completion_window: Optional[float] = None):
+        self.workers = workers
+        self.completion_window = completion_window
+        self.cacheable = get_backend().cacheable
+        self._progress: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, requests_file: Path, metadata: Optional[dict] = None) -> str:
+        requests = read_jsonl(Path(requests_file).read_text(encoding="utf-8"))
+        output = Path(requests_file).with_name(f"{Path(requests_file).stem}.{uuid.uuid4().hex[:8]}.output.jsonl")
+        batch_id = str(output)
+        self._progress[batch_id] = {"status": "in_progress", "completed": 0, "failed": 0, "total": len(requests)}
+        # Everything is queued now, and neither the workers nor the writer
+        # are daemons, so a process that only submits finishes the batch
+        # before it exits.
+        pool = ThreadPoolExecutor(max_workers=max(1, self.workers), thread_name_prefix="local-batch")
+        futures = [pool.submit(self._complete, batch_id, request) for request in requests]
+        pool.shutdown(wait=False)
+        threading.Thread(target=self._write, args=(batch_id, futures, output), name="local-batch-writer").start()
+        return batch_id
+
+    def _write(self, batch_id: str, futures: list, output: Path) -> None:
+        done, unfinished = wait(futures, timeout=self.completion_window)
+        for future in unfinished:
+            future.cancel()
+        lines = [future.result() for future in futures if future in done]
+        partial = output.with_suffix(".part")
+        write_jsonl(partial, lines)
+        partial.replace(output)
+        with self._lock:
+            self._progress[batch_id].update(status="expired" if unfinished else COMPLETED, output_file_id=batch_id)
+
+    def _complete(self, batch_id: str, request: dict) -> dict:
+        body = dict(request["body"])
+        messages = body.pop("messages")
+        backend = get_backend()
+        model = backend.resolve_model(body.pop("model"))
+        line = {"id": f"batch_req_{uuid.uuid4().hex}", "custom_id": request["custom_id"],
+                "response": None, "error": None}
+        try:
+            content, usage = backend.chat(messages, model, body.pop("temperature"), **body)
+        except Exception as e:
+            line["error"] = {"code": type(e).__name__, "message": str(e)}
+        else:
+            line["response"] = {"status_code": 200, "body": {
+                "object": "chat.completion",
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                             "finish_reason": "stop"}],
+                "usage": _usage_dict(usage),
+            }}
+        with self._lock:
+            self._progress[batch_id]["failed" if line["error"] else "completed"] += 1
+        return line
+
+    def status(self, batch_id: str) -> dict:
+        with self._lock:
+            if batch_id in self._progress:
+                return dict(self._progress[batch_id])
+        if Path(batch_id).exists():
+            return {"status": COMPLETED, "output_file_id": batch_id}
+        # Submitted by a process that exited before finishing the batch
+        return {"status": "failed", "error": f"No output at {batch_id}"}
+
+    def results(self, batch_id: str) -> List[dict]:
+        return read_jsonl(Path(batch_id).read_text(encoding="utf-8"))
+
+
+def _usage_dict(usage) -> Optional[dict]:
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": getattr(details, "cached_tokens", 0) or 0}}
+
+
+def create_runner(kind: Optional[str] = None):
+    kind = kind or BATCH_RUNNER
+    if kind == "openai":
+        return OpenAIBatchRunner()
+    if kind == "local":
+        return LocalBatchRunner()
+    raise ValueError(f"Unknown batch runner: {kind}")
+
+
+def wait_for_batch(runner, batch_id: str, poll_seconds: float = BATCH_POLL_SECONDS) -> dict:
+    """
+    Polls a batch until it reaches a terminal status, reporting progress on stderr.
+    """
+    while True:
+        state = runner.status(batch_id)
+        progress = (f" ({state['completed']}/{state['total']} done, {state['failed']} failed)"
+                    if state.get("total") else "")
+        print(f"Batch {batch_id}: {state['status']}{progress}", file=sys.stderr)
+        if state["status"] in TERMINAL_STATUSES:
+            return state
+        time.sleep(poll_seconds)
+
+
+def map_results(agent_type: str, manifest: dict, requests: List[dict], lines: List[dict],
+                cache_responses: bool = False, status: str = COMPLETED) -> List[dict]:
+    """
+    Turns Batch API output lines into one record per submission, parsing
+    each response with the agent's parse_llm_response. With
+    `cache_responses`, responses that validate as they are also go into the
+    response cache under the key of the equivalent synchronous request, so
+    regrading a submission interactively costs nothing. Submissions missing
+    from the output are errors, noting the batch `status` if it didn't
+    complete.
+    """
+    parse = agent_module(agent_type).parse_llm_response
+    response_ok = pitch_response_ok if agent_type == "vc" else exam_response_ok
+    requests_by_id = {request["custom_id"]: request for request in requests}
+    lines_by_id = {line["custom_id"]: line for line in lines}
+
+    records = []
+    for custom_id, file in manifest["submissions"].items():
+        record = {"student": Path(file).stem, "file": file}
+        line = lines_by_id.get(custom_id)
+        response = (line or {}).get("response") or {}
+        if line is None:
+            record["error"] = ("No result in the batch output" if status == COMPLETED
+                               else f"No result in the batch output (batch {status})")
+        elif line.get("error") or response.get("status_code") != 200:
+            error = line.get("error") or response.get("body", {}).get("error") or response
+            record["error"] = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+        else:
+            body = response["body"]
+            content = body["choices"][0]["message"]["content"]
+            if body.get("usage"):
+                usage = body["usage"]
+                usage_tracker.record(SimpleNamespace(
+                    prompt_tokens=usage.get("prompt_tokens"),
+                    completion_tokens=usage.get("completion_tokens"),
+                    prompt_tokens_details=SimpleNamespace(**(usage.get("prompt_tokens_details") or {}))))
+            if cache_responses and response_ok(content):
+                _cache_response(requests_by_id[custom_id], content)
+            record["result"] = parse(content)
+            if record["result"] is None:
+                record["error"] = "Could not parse LLM response"
+        records.append(record)
+    return records
+
+
+def _cache_response(request: dict, content: str) -> None:
+    params = dict(request["body"])
+    messages = params.pop("messages")
+    model = params.pop("model")
+    temperature = params.pop("temperature")
+    seed = params.pop("seed", None)
+    response_cache.put(ResponseCache.make_key(model, messages, temperature, seed, **params), model, content)
+
+
+def submit_batch(agent_type: str, batch: str, workdir: Path, questions_file=None, rubric_file=None,
+                 runner=None, workers: int = 4) -> dict:
+    """
+    Builds the request file for a cohort in `workdir`, submits it and saves
+    a manifest (agent, runner, batch id, request id -> file) that `collect`
+    uses later, possibly from another process.
+    """
+    input_files = collect_input_files(batch, "audio" if agent_type == "vc" else "text")
+    if not input_files:
+        raise ValueError(f"No gradable files found for --batch {batch}")
+    if len(input_files) > MAX_BATCH_REQUESTS:
+        raise ValueError(f"{len(input_files)} submissions exceed the Batch API limit of {MAX_BATCH_REQUESTS}")
+
+    workdir.mkdir(parents=True, exist_ok=True)
+    submissions = custom_ids(input_files)
+    write_jsonl(workdir / REQUESTS_FILE,
+                build_requests(agent_type, submissions, questions_file, rubric_file, workers))
+
+    runner = runner or create_runner()
+    batch_id = runner.submit(workdir / REQUESTS_FILE, metadata={"agent": agent_type, "batch": batch})
+    manifest = {
+        "agent": agent_type,
+        "runner": runner.name,
+        "batch_id": batch_id,
+        "submitted": time.time(),
+        "submissions": {custom_id: str(path) for custom_id, path in submissions.items()},
+    }
+    (workdir / MANIFEST_FILE).write_text(json.dumps(manifest, indent=2), encoding="utf-8")
+    return manifest
+
+
+def collect_batch(workdir: Path, output=None, wait: bool = True, runner=None,
+                  poll_seconds: float = BATCH_POLL_SECONDS) -> Optional[List[dict]]:
+    """
+    Fetches a submitted batch's output (waiting for it with `wait`) and
+    writes one JSONL record per student, like run_example.py --batch.
+    Returns None if the batch hasn't finished.
+    """
+    manifest = json.loads((workdir / MANIFEST_FILE).read_text(encoding="utf-8"))
+    runner = runner or create_runner(manifest["runner"])
+    state = (wait_for_batch(runner, manifest["batch_id"], poll_seconds) if wait
+             else runner.status(manifest["batch_id"]))
+    if state["status"] not in TERMINAL_STATUSES:
+        print(f"Batch {manifest['batch_id']} is still {state['status']}.", file=sys.stderr)
+        return None
+
+    # An expired or cancelled batch still has output for the requests that
+    # finished before it stopped; only the rest are reported as errors
+    has_output = bool(state["status"] == COMPLETED or state.get("output_file_id") or state.get("error_file_id"))
+    lines = runner.results(manifest["batch_id"]) if has_output else []
+    write_jsonl(workdir / OUTPUT_FILE, lines)
+    requests = read_jsonl((workdir / REQUESTS_FILE).read_text(encoding="utf-8"))
+    records = map_results(manifest["agent"], manifest, requests, lines, cache_responses=runner.cacheable,
+                          status=state["status"])
+
+    out = open(output, "w", encoding="utf-8") if output else sys.stdout
+    try:
+        for record in records:
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+    finally:
+        if output:
+            out.close()
+
+    print(json.dumps({"batch": {"batch_id": manifest["batch_id"], **state},
+                      "graded": sum(record.get("result") is not None for record in records),
+                      "failed": sum(record.get("result") is None for record in records),
+                      "usage": usage_tracker.summary()}), file=sys.stderr)
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grade a cohort offline through the Batch API")
+    parser.add_argument("command", choices=["submit", "status", "collect", "run"],
+                        help="run = submit, wait for completion and collect")
+    parser.add_argument("--workdir", type=Path, required=True,
+                        help="Directory holding the batch's requests, manifest and output")
+    parser.add_argument("--agent", choices=list(AGENTS), help="Grading agent (submit/run)")
+    parser.add_argument("--questions", type=Path, help="Path to exam questions (PDF or text)")
+    parser.add_argument("--rubric", type=Path, help="Optional path to rubric (PDF or text)")
+    parser.add_argument("--batch", help="Directory or glob of answer files (or audio files for vc)")
+    parser.add_argument("--runner", choices=["openai", "local"], default=BATCH_RUNNER,
+                        help="Batch API, or the local stand-in that uses LLM_BACKEND")
+    parser.add_argument("--workers", type=int, default=4, help="Submissions prepared at once")
+    parser.add_argument("--output", type=Path, help="Write per-student results as JSONL (default: stdout)")
+    parser.add_argument("--poll-seconds", type=float, default=BATCH_POLL_SECONDS)
+    args = parser.parse_args()
+
+    if args.command in ("submit", "run"):
+        if not args.agent or not args.batch:
+            raise ValueError(f"{args.command} requires --agent and --batch")
+        if args.agent != "vc" and not args.questions:
+            raise ValueError("Batch grading with the technical/narrative agents requires --questions")
+        runner = create_runner(args.runner)
+        manifest = submit_batch(args.agent, args.batch, args.workdir, args.questions, args.rubric,
+                                runner, args.workers)
+        print(f"Submitted {len(manifest['submissions'])} requests as batch {manifest['batch_id']}", file=sys.stderr)
+        if args.command == "run":
+            collect_batch(args.workdir, args.output, wait=True, runner=runner, poll_seconds=args.poll_seconds)
+    elif args.command == "status":
+        manifest = json.loads((args.workdir / MANIFEST_FILE).read_text(encoding="utf-8"))
+        print(json.dumps(create_runner(manifest["runner"]).status(manifest["batch_id"])))
+    else:
+        collect_batch(args.workdir, args.output, wait=True, poll_seconds=args.poll_seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional
+
+from utils import PDF_TABLE_MODES, extract_pdf_to_markdown, pdf_page_count
+from llm_backend import FakeBackend, OpenAICompatibleBackend, estimate_tokens, get_backend, set_backend
+from fake_openai_server import start_fake_server
+
+# Bundled corpus, found next to this file whatever the working directory
+ROOT = Path(__file__).resolve().parent
+NARRATIVE_DIR = ROOT / "narrative_agent" / "test_input_files"
+TECHNICAL_DIR = ROOT / "technical_agent" / "test_input_files"
+AUDIO_DIR = ROOT / "vc_pitch_agent" / "test_input_files" / "audio"
+TECHNICAL_EXAM = TECHNICAL_DIR / "CRA_Final_Examen_Gener_2025_CATALÀ.pdf"
+TECHNICAL_RUBRIC = TECHNICAL_DIR / "CRA_Final_Examen_Rubric.pdf"
+TECHNICAL_ANSWERS = TECHNICAL_DIR / "Respostes_MD.md"
+NARRATIVE_RUBRIC = NARRATIVE_DIR / "exams" / "rubric.txt"
+
+BENCHMARKS = ("extraction", "tables", "audio", "prompts", "grading")
+
+# Metrics where a larger value is better; for every other metric smaller is better
+HIGHER_IS_BETTER = ("per_second",)
+# Benchmark settings and corpus sizes, reported but not compared
+SETTINGS = ("files", "pages", "audio_seconds", "submissions", "concurrency", "server_latency")
+
+
+def require_corpus(files: list, description: str) -> list:
+    if not files:
+        raise FileNotFoundError(f"No bundled {description} found under {ROOT}")
+    return files
+
+
+def corpus_pdfs() -> List[Path]:
+    return require_corpus(sorted(ROOT.glob("*_agent/test_input_files/**/*.pdf")), "PDFs")
+
+
+def narrative_submissions() -> List[tuple]:
+    """
+    (exam questions file, answer PDF) for every bundled student answer.
+    """
+    submissions = []
+    for answer in sorted((NARRATIVE_DIR / "student_answers").glob("exam*_student*.pdf")):
+        exam = NARRATIVE_DIR / "exams" / f"{answer.stem.split('_')[0]}.txt"
+        submissions.append((exam, answer))
+    return require_corpus(submissions, "narrative answers")
+
+
+def count_tokens(text: str) -> int:
+    try:
+        import tiktoken
+    except ImportError:
+        return estimate_tokens(text)
+    return len(tiktoken.get_encoding("cl100k_base").encode(text))
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def best_of(repeat: int, fn: Callable[[], None]) -> float:
+    """
+    Fastest wall time of `repeat` runs of `fn`.
+    """
+    timings = []
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def bench_extraction(repeat: int) -> dict:
+    """
+    pdfplumber extraction of every bundled PDF, bypassing the markdown cache.
+    """
+    pdfs = corpus_pdfs()
+    pages = sum(pdf_page_count(str(pdf)) for pdf in pdfs)
+    seconds = best_of(repeat, lambda: [extract_pdf_to_markdown(str(pdf), use_cache=False) for pdf in pdfs])
+    return {"files": len(pdfs), "pages": pages, "seconds": seconds, "pages_per_second": pages / seconds}
+
+
+def bench_tables(repeat: int) -> dict:
+    """
+    Extraction time under each PDF_TABLE_MODE, and whether the "auto" fast
+    path produces exactly the same markdown as always running extract_tables.
+    """
+    pdfs = corpus_pdfs()
+    results = {}
+    outputs = {}
+    for mode in PDF_TABLE_MODES:
+        outputs[mode] = [extract_pdf_to_markdown(str(pdf), use_cache=False, table_mode=mode) for pdf in pdfs]
+        results[f"{mode}_seconds"] = best_of(
+            repeat, lambda: [extract_pdf_to_markdown(str(pdf), use_cache=False, table_mode=mode) for pdf in pdfs])
+    mismatches = [pdf.name for pdf, auto, always in zip(pdfs, outputs["auto"], outputs["always"]) if auto != always]
+    results["auto_mismatched_files"] = len(mismatches)
+    if mismatches:
+        print(f"Table mode 'auto' differs from 'always' on: {', '.join(mismatches)}", file=sys.stderr)
+    return results
+
+
+def bench_audio(repeat: int) -> dict:
+    """
+    analyze_audio on every bundled pitch with the offline fake backend and an
+    empty transcript store, so each run decodes and analyzes the audio.
+    """
+    import soundfile
+    from vc_pitch_agent import vc_grader_agent
+    from vc_pitch_agent.transcript_store import TranscriptStore
+
+    recordings = require_corpus(sorted(AUDIO_DIR.glob("*.mp3")), "pitch recordings")
+    audio_seconds = sum(soundfile.info(str(path)).duration for path in recordings)
+
+    def run():
+        with tempfile.TemporaryDirectory() as store_dir:
+            vc_grader_agent.transcript_store = TranscriptStore(store_dir)
+            for path in recordings:
+                vc_grader_agent.analyze_audio(str(path))
+
+    previous_store, previous_backend = vc_grader_agent.transcript_store, get_backend()
+    set_backend(FakeBackend())
+    try:
+        seconds = best_of(repeat, run)
+    finally:
+        vc_grader_agent.transcript_store = previous_store
+        set_backend(previous_backend)
+    return {"files": len(recordings), "audio_seconds": audio_seconds, "seconds": seconds,
+            "audio_seconds_per_second": audio_seconds / seconds}
+
+
+def bench_prompts() -> dict:
+    """
+    Size of the grading prompts (system + user) built for the bundled inputs.
+    """
+    from technical_agent.tech_grader_agent import build_tech_grading_prompt
+    from narrative_agent.narrative_grader_agent import build_narrative_prompt
+    from vc_pitch_agent.vc_grader_agent import build_vc_prompt
+    from llm_backend import FAKE_TRANSCRIPT
+
+    def size(prompts: dict) -> int:
+        return count_tokens(prompts["system"]) + count_tokens(prompts["user"])
+
+    technical = size(build_tech_grading_prompt(extract_pdf_to_markdown(str(TECHNICAL_EXAM)),
+                                               TECHNICAL_ANSWERS.read_text(encoding="utf-8"),
+                                               extract_pdf_to_markdown(str(TECHNICAL_RUBRIC))))
+    rubric = NARRATIVE_RUBRIC.read_text(encoding="utf-8")
+    narrative = [size(build_narrative_prompt(exam.read_text(encoding="utf-8"),
+                                             extract_pdf_to_markdown(str(answer)), rubric))
+                 for exam, answer in narrative_submissions()]
+    # The transcript varies per pitch; this is the fixed template overhead
+    vc_template = count_tokens(build_vc_prompt(FAKE_TRANSCRIPT, 140.0, 0.1, 180.0))
+    try:
+        import tiktoken  # noqa: F401
+        tokenizer = "cl100k_base"
+    except ImportError:
+        tokenizer = "estimate"
+
+    return {
+        "tokenizer": tokenizer,
+        "technical_tokens": technical,
+        "narrative_mean_tokens": sum(narrative) / len(narrative),
+        "narrative_max_tokens": max(narrative),
+        "vc_template_tokens": vc_template,
+    }
+
+
+def bench_grading(concurrency: int, server_latency: float, repeat: int) -> dict:
+    """
+    End-to-end narrative grading of every bundled answer against a local
+    fake OpenAI server: prompt building, HTTP round-trip, parsing. Answers
+    are extracted beforehand so this measures the grading path only.
+    """
+    from narrative_agent.narrative_grader_agent import grade_exam
+
+    rubric = NARRATIVE_RUBRIC.read_text(encoding="utf-8")
+    work = [(exam.read_text(encoding="utf-8"), extract_pdf_to_markdown(str(answer)))
+            for exam, answer in narrative_submissions()] * max(1, repeat)
+
+    server = start_fake_server(latency=server_latency)
+    backend = OpenAICompatibleBackend(server.base_url)
+    # Every request must reach the server rather than the response cache
+    backend.cacheable = False
+    previous_backend = get_backend()
+    set_backend(backend)
+
+    latencies = []
+
+    def grade_one(item):
+        start = time.perf_counter()
+        result = grade_exam(item[0], item[1], rubric)
+        latencies.append(time.perf_counter() - start)
+        return result
+
+    try:
+        # Untimed warm-up: imports the SDK and opens the client's connection pool
+        grade_exam(*work[0], rubric)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            results = list(pool.map(grade_one, work))
+        seconds = time.perf_counter() - start
+    finally:
+        set_backend(previous_backend)
+        server.shutdown()
+        server.server_close()
+
+    return {
+        "submissions": len(work),
+        "failed": sum(result is None for result in results),
+        "concurrency": concurrency,
+        "server_latency": server_latency,
+        "seconds": seconds,
+        "submissions_per_second": len(work) / seconds,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_max": max(latencies),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(selected, repeat: int, concurrency: int, server_latency: float) -> dict:
+    results = {"meta": {"commit": git_commit(), "timestamp": time.time(), "python": platform.python_version(),
+                        "platform": platform.platform(), "cpus": os.cpu_count(), "repeat": repeat}}
+    for name in selected:
+        print(f"Running {name} benchmark...", file=sys.stderr)
+        if name == "extraction":
+            results[name] = bench_extraction(repeat)
+        elif name == "tables":
+            results[name] = bench_tables(repeat)
+        elif name == "audio":
+            results[name] = bench_audio(repeat)
+        elif name == "prompts":
+            results[name] = bench_prompts()
+        elif name == "grading":
+            results[name] = bench_grading(concurrency, server_latency, repeat)
+    return results
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> List[str]:
+    """
+    Prints every numeric metric next to its baseline and returns the ones
+    that got worse by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for section, metrics in current.items():
+        if section == "meta" or section not in baseline:
+            continue
+        for name, value in metrics.items():
+            old = baseline[section].get(name)
+            if name in SETTINGS or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or not old:
+                continue
+            change = (value - old) / old
+            higher_is_better = name.endswith(HIGHER_IS_BETTER)
+            worse = -change if higher_is_better else change
+            flag = "REGRESSION" if worse > tolerance else ""
+            if flag:
+                regressions.append(f"{section}.{name}")
+            print(f"{section + '.' + name:45} {old:12.4g} -> {value:12.4g}  {change:+7.1%}  {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks over the bundled test inputs")
+    parser.add_argument("--only", default=",".join(BENCHMARKS),
+                        help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per timed benchmark (best is kept)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Submissions graded at once")
+    parser.add_argument("--server-latency", type=float, default=0.05,
+                        help="Seconds the fake LLM server waits before each response")
+    parser.add_argument("--output", type=Path, help="Save results as JSON")
+    parser.add_argument("--compare", type=Path, help="Baseline results JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Relative slowdown reported as a regression in --compare")
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.only.split(",") if name.strip()]
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(selected, args.repeat, args.concurrency, args.server_latency)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        print(f"\nCompared with {args.compare} (commit {baseline.get('meta', {}).get('commit')}):")
+        regressions = compare(baseline, results, args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+import re
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
+
+# Question headings as they appear in exams, answer sheets and rubrics:
+# "Question 3 (...)", "Pregunta 3", "Exercici 3", "Q3", "#### 3. Title", "**3.**",
+# or a numbered title carrying its points, "3. Prolog (3 punts)"
+QUESTION_HEADING = re.compile(
+    r"^[ \t]*(?:"
+    r"(?:#{1,6}[ \t]*)?(?:\*\*)?"
+    r"(?:question|pregunta|qüestió|exercici|ejercicio|exercise|problem|problema)[ \t]*(\d+)\b"
+    r"|(?:#{1,6}[ \t]*)?(?:\*\*)?[QP](\d+)\b"
+    r"|(?:#{1,6}[ \t]*(?:\*\*)?|\*\*)(\d+)[ \t]*[.)]"
+    r"|(\d+)[ \t]*[.)][^\n]{0,120}\([ \t]*\d+(?:[.,]\d+)?\s*(?:pts?|points?|punts?|puntos?)\b"
+    r")",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_RETRIES = 1
+
+
+def split_into_questions(text: str) -> Tuple[str, Dict[int, str]]:
+    """
+    Splits an exam, answer sheet or rubric into per-question sections.
+    Returns the preamble before the first question heading and a dict of
+    question number -> section text, in document order.
+    """
+    matches = list(QUESTION_HEADING.finditer(text))
+    if not matches:
+        return text.strip(), {}
+
+    preamble = text[:matches[0].start()].strip()
+    sections: Dict[int, str] = {}
+    for i, match in enumerate(matches):
+        number = int(next(group for group in match.groups() if group))
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        section = text[match.start():end].strip()
+        # A number repeated later (e.g. a continuation) belongs to the same question
+        sections[number] = f"{sections[number]}\n\n{section}" if number in sections else section
+    return preamble, sections
+
+
+def _question_entry(result: Optional[dict]) -> Optional[dict]:
+    """
+    Pulls the single question's grade out of a one-question grading result.
+    """
+    if not isinstance(result, dict):
+        return None
+    for key, value in result.items():
+        if key.startswith("question_") and isinstance(value, dict) and "score" in value:
+            return value
+    return None
+
+
+def grade_by_question(questions: str, answers: str, rubric: Optional[str],
+                      grade_unit: Callable[..., Optional[dict]],
+                      max_workers: int = DEFAULT_MAX_WORKERS,
+                      retries: int = DEFAULT_RETRIES) -> Optional[dict]:
+    """
+    Grades an exam one question at a time, with the units graded concurrently.
+
+    `grade_unit(question, answer, rubric)` is the agent's own single-request
+    grader. Each unit only carries its question (plus the exam preamble), the
+    matching answer section and the matching rubric slice; a rubric without
+    per-question sections is attached whole. Failed units are retried on their
+    own, bypassing the response cache (`grade_unit(..., use_cache=False)`).
+    Totals are computed locally.
+
+    Returns None when the exam can't be split into questions, or when a
+    question still fails after its retries, so the caller can fall back to
+    whole-exam grading.
+    """
+    preamble, question_sections = split_into_questions(questions)
+    numbers = list(question_sections)
+    # A gap in the numbering means a heading was missed and two questions
+    # would be graded as one; leave those exams to whole-exam grading.
+    if len(numbers) < 2 or numbers != list(range(numbers[0], numbers[0] + len(numbers))):
+        return None
+
+    _, answer_sections = split_into_questions(answers)
+    if not answer_sections:
+        return None
+    _, rubric_sections = split_into_questions(rubric) if rubric else ("", {})
+
+    def grade_one(number: int) -> Optional[dict]:
+        question = f"{preamble}\n\n{question_sections[number]}".strip()
+        answer = answer_sections.get(number, "No answer provided.")
+        rubric_slice = rubric_sections.get(number, rubric) if rubric_sections else rubric
+        entry = _question_entry(grade_unit(question, answer, rubric_slice))
+        for _ in range(retries):
+            if entry is not None:
+                break
+            # The same request again would just replay a cached response
+            entry = _question_entry(grade_unit(question, answer, rubric_slice, use_cache=False))
+        return entry
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(numbers)))) as pool:
+        entries = list(pool.map(grade_one, numbers))
+
+    failed = [number for number, entry in zip(numbers, entries) if entry is None]
+    if failed:
+        print(f"Warning: could not grade question(s) {failed} on their own; grading the whole exam instead.",
+              file=sys.stderr)
+        return None
+
+    result = {f"question_{number}": entry for number, entry in zip(numbers, entries)}
+    result["total_score"] = sum(entry.get("score") or 0 for entry in entries)
+    result["total_max_score"] = sum(entry.get("max_score") or 0 for entry in entries)
+    return result
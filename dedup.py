@@ -0,0 +1,144 @@
+import re
+import zlib
+from typing import Dict, List, Optional, Set, Tuple
+
+# Word shingles of this length are compared between submissions
+SHINGLE_SIZE = 5
+# Submissions with fewer shingles than this (blank scans, one-line answers)
+# are too short to tell copying from coincidence and are never indexed
+MIN_SHINGLES = 10
+# MinHash signature length, split into LSH bands of NUM_PERM / LSH_BANDS rows.
+# 32 bands of 4 rows make pairs above ~0.5 Jaccard similarity candidates with
+# high probability; candidates are then checked exactly.
+NUM_PERM = 128
+LSH_BANDS = 32
+MERSENNE_PRIME = (1 << 31) - 1
+SEED = 1
+
+# Page markers added by extract_pdf_to_markdown say nothing about the answer
+_PAGE_MARKER = re.compile(r"^## Page \d+$", re.MULTILINE)
+_WORD = re.compile(r"\w+")
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[int]:
+    """
+    Hashed word n-grams of a normalized answer (case, punctuation, layout
+    and page markers ignored). Very short texts yield a single shingle.
+    """
+    words = _WORD.findall(_PAGE_MARKER.sub(" ", text).lower())
+    if len(words) < size:
+        return {zlib.crc32(" ".join(words).encode("utf-8"))} if words else set()
+    return {zlib.crc32(" ".join(words[i:i + size]).encode("utf-8")) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: Set[int], b: Set[int]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class NearDuplicateIndex:
+    """
+    MinHash/LSH index of the submissions to one exam.
+
+    `add` returns the already indexed submissions whose shingle sets have a
+    Jaccard similarity of at least `threshold` with the new one (LSH finds
+    the candidates, the exact similarity confirms them). `clusters` groups
+    submissions connected by such matches. Submissions with fewer than
+    `min_shingles` shingles are not indexed and never match.
+    """
+
+    def __init__(self, threshold: float = 0.9, num_perm: int = NUM_PERM, bands: int = LSH_BANDS,
+                 min_shingles: int = MIN_SHINGLES):
+        import numpy as np
+
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.min_shingles = min_shingles
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(SEED)
+        self._a = rng.integers(1, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._buckets: List[Dict[tuple, List[str]]] = [{} for _ in range(bands)]
+        self._shingles: Dict[str, Set[int]] = {}
+        self.matches: List[Tuple[str, str, float]] = []
+
+    def signature(self, shingle_set: Set[int]):
+        import numpy as np
+
+        if not shingle_set:
+            return np.full(len(self._a), MERSENNE_PRIME, dtype=np.uint64)
+        values = np.fromiter(shingle_set, dtype=np.uint64, count=len(shingle_set))
+        # Values are < 2**32 and coefficients < 2**31, so the products fit in 64 bits
+        return ((np.outer(self._a, values) + self._b[:, None]) % MERSENNE_PRIME).min(axis=1)
+
+    def add(self, key: str, text: str) -> List[Tuple[str, float]]:
+        shingle_set = shingles(text)
+        if len(shingle_set) < self.min_shingles:
+            return []
+        signature = self.signature(shingle_set)
+
+        candidates = set()
+        for band, buckets in enumerate(self._buckets):
+            bucket = tuple(signature[band * self.rows:(band + 1) * self.rows].tolist())
+            members = buckets.setdefault(bucket, [])
+            candidates.update(members)
+            members.append(key)
+
+        found = []
+        for other in candidates:
+            similarity = jaccard(shingle_set, self._shingles[other])
+            if similarity >= self.threshold:
+                found.append((other, similarity))
+                self.matches.append((other, key, similarity))
+        self._shingles[key] = shingle_set
+        return sorted(found, key=lambda match: -match[1])
+
+    def clusters(self) -> List[List[str]]:
+        """
+        Groups of two or more near-duplicate submissions, in insertion order.
+        """
+        parent = {key: key for key in self._shingles}
+
+        def find(key: str) -> str:
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for first, second, _ in self.matches:
+            parent[find(second)] = find(first)
+
+        groups: Dict[str, List[str]] = {}
+        for key in self._shingles:
+            groups.setdefault(find(key), []).append(key)
+        return [members for members in groups.values() if len(members) > 1]
+
+    def similarity(self, first: str, second: str) -> Optional[float]:
+        if first not in self._shingles or second not in self._shingles:
+            return None
+        return jaccard(self._shingles[first], self._shingles[second])
+
+
+def duplicate_clusters(texts: Dict[str, str], threshold: float = 0.9) -> List[dict]:
+    """
+    Indexes `texts` (submission -> answer markdown) and returns its clusters
+    of near-duplicates as `{"representative", "members"}`. The representative
+    is the first submission of the cluster; each member carries its own
+    similarity to the representative, which can fall below `threshold` when
+    the member only joined through another near-duplicate. Submissions
+    below MIN_SHINGLES are left out.
+    """
+    index = NearDuplicateIndex(threshold)
+    for key, text in texts.items():
+        index.add(key, text)
+    return [
+        {
+            "representative": cluster[0],
+            "members": [{"file": key, "similarity": round(index.similarity(cluster[0], key), 3)}
+                        for key in cluster[1:]],
+        }
+        for cluster in index.clusters()
+    ]
@@ -0,0 +1,209 @@
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+from llm_backend import FAKE_STREAM_CHUNK_CHARS, FAKE_TRANSCRIPT, fake_completion, load_recordings
+from llm_cache import ResponseCache
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI-compatible endpoint for /v1/chat/completions and
+    /v1/audio/transcriptions, with x-ratelimit-* headers and optional
+    latency and 429 injection (see FakeOpenAIServer).
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server: FakeOpenAIServer = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        server.count_request()
+
+        if server.latency:
+            time.sleep(server.latency)
+        if server.fail_rate and random.random() < server.fail_rate:
+            self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests",
+                                            "code": "rate_limit_exceeded"}},
+                            {"retry-after-ms": "50", "x-ratelimit-remaining-requests": "0",
+                             "x-ratelimit-reset-requests": "50ms"})
+            return
+
+        if self.path.endswith("/chat/completions"):
+            request = json.loads(body or b"{}")
+            content = server.respond(request)
+            prompt_tokens = sum(len(m.get("content") or "") for m in request.get("messages", [])) // 4
+            completion_tokens = len(content) // 4
+            usage = {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+                "prompt_tokens_details": {"cached_tokens": 0},
+            }
+            if request.get("stream"):
+                include_usage = (request.get("stream_options") or {}).get("include_usage")
+                self._send_stream(request, content, usage if include_usage else None)
+                return
+            self._send_json(200, {
+                "id": f"chatcmpl-fake-{server.requests}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            }, self._rate_limit_headers())
+        elif self.path.endswith("/audio/transcriptions"):
+            if re.search(rb'name="response_format"\r\n\r\nverbose_json', body):
+                self._send_json(200, {
+                    "task": "transcribe",
+                    "language": "english",
+                    "duration": 1.0,
+                    "text": FAKE_TRANSCRIPT,
+                    "segments": [{"id": 0, "seek": 0, "start": 0.0, "end": 1.0, "text": FAKE_TRANSCRIPT,
+                                  "tokens": [], "temperature": 0.0, "avg_logprob": 0.0,
+                                  "compression_ratio": 1.0, "no_speech_prob": 0.0}],
+                }, self._rate_limit_headers())
+                return
+            payload = FAKE_TRANSCRIPT.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in self._rate_limit_headers().items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def _send_stream(self, request: dict, content: str, usage: Optional[dict]):
+        """
+        Streams the completion as server-sent events, FAKE_STREAM_CHUNK_CHARS
+        characters per chunk, `chunk_latency` seconds apart.
+        """
+        server: FakeOpenAIServer = self.server
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in self._rate_limit_headers().items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        base = {"id": f"chatcmpl-fake-{server.requests}", "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": request.get("model", "fake")}
+        deltas = [{"role": "assistant", "content": ""}]
+        deltas += [{"content": content[i:i + FAKE_STREAM_CHUNK_CHARS]}
+                   for i in range(0, len(content), FAKE_STREAM_CHUNK_CHARS)]
+        for delta in deltas:
+            if server.chunk_latency:
+                time.sleep(server.chunk_latency)
+            self._send_event({**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+        self._send_event({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        if usage is not None:
+            self._send_event({**base, "choices": [], "usage": usage})
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+    def _send_event(self, payload: dict):
+        self._send_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    def _send_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _rate_limit_headers(self) -> dict:
+        return {
+            "x-ratelimit-limit-requests": "10000",
+            "x-ratelimit-remaining-requests": "9999",
+            "x-ratelimit-reset-requests": "6ms",
+            "x-ratelimit-limit-tokens": "10000000",
+            "x-ratelimit-remaining-tokens": "9999000",
+            "x-ratelimit-reset-tokens": "6ms",
+        }
+
+    def _send_json(self, status: int, payload: dict, headers: Optional[dict] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency: float = 0.0, fail_rate: float = 0.0,
+                 replay_file: Optional[str] = None, chunk_latency: float = 0.0):
+        super().__init__(address, FakeOpenAIHandler)
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.chunk_latency = chunk_latency
+        self.recordings = load_recordings(replay_file)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def respond(self, request: dict) -> str:
+        """
+        Replays the recorded response for this exact request if there is one,
+        otherwise answers deterministically.
+        """
+        messages = request.get("messages", [])
+        params = {k: v for k, v in request.items()
+                  if k not in ("model", "messages", "temperature", "seed", "stream", "stream_options")}
+        key = ResponseCache.make_key(request.get("model"), messages, request.get("temperature"),
+                                     request.get("seed"), **params)
+        return self.recordings.get(key) or fake_completion(messages)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_fake_server(port: int = 0, latency: float = 0.0, fail_rate: float = 0.0,
+                      replay_file: Optional[str] = None, chunk_latency: float = 0.0) -> FakeOpenAIServer:
+    """
+    Starts the fake server on a background thread. Point the agents at it
+    with LLM_BACKEND=local LLM_BASE_URL=server.base_url.
+    """
+    server = FakeOpenAIServer(("127.0.0.1", port), latency=latency, fail_rate=fail_rate,
+                              replay_file=replay_file, chunk_latency=chunk_latency)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local fake OpenAI API for offline testing")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests answered with a 429")
+    parser.add_argument("--replay", help="JSONL of recorded responses (LLM_RECORD_FILE) to replay")
+    parser.add_argument("--chunk-latency", type=float, default=0.0,
+                        help="Seconds between streamed chunks, to emulate generation speed")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(("127.0.0.1", args.port), latency=args.latency, fail_rate=args.fail_rate,
+                              replay_file=args.replay, chunk_latency=args.chunk_latency)
+    print(f"Fake OpenAI API listening on {server.base_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from utils import extract_pdf_to_markdown, pdf_cache_key, pdf_markdown_cache
+from llm_cache import response_cache
+from llm_backend import get_backend
+from llm_client import usage_tracker
+from run_example import AGENTS, load_grader
+
+# Config
+GRADING_SERVER_WORKERS = int(os.getenv("GRADING_SERVER_WORKERS", 16))
+GRADING_SERVER_EXTRACT_WORKERS = int(os.getenv("GRADING_SERVER_EXTRACT_WORKERS", os.cpu_count() or 1))
+GRADING_SERVER_MAX_JOBS = int(os.getenv("GRADING_SERVER_MAX_JOBS", 10000))
+MAX_POLL_WAIT_SECONDS = 60
+
+# Job lifecycle
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+def _warm_extraction_worker():
+    # Pay the pdfplumber import once per worker instead of once per file
+    import pdfplumber  # noqa: F401
+
+
+def _extract_in_worker(pdf_path: str) -> str:
+    return extract_pdf_to_markdown(pdf_path, workers=1, use_cache=False)
+
+
+class GradingService:
+    """
+    Long-lived grading service shared by all HTTP requests.
+
+    Grading runs on a thread pool in this process, so every request reuses
+    the same LLM backend (one client with keep-alive connections), the
+    in-memory PDF and response caches, and the already-imported agents.
+    PDF extraction, the CPU-heavy step, goes to a pool of warm worker
+    processes; its results land in the shared markdown cache.
+
+    Jobs are kept in memory (the oldest finished ones are dropped past
+    GRADING_SERVER_MAX_JOBS); use run_example.py --job-db for durable runs.
+    """
+
+    def __init__(self, workers: int = GRADING_SERVER_WORKERS,
+                 extract_workers: int = GRADING_SERVER_EXTRACT_WORKERS,
+                 max_jobs: int = GRADING_SERVER_MAX_JOBS):
+        self.graders = {agent: load_grader(agent) for agent in AGENTS}
+        self.grade_pitches = load_grader("vc", "grade_pitches")
+        get_backend()
+        self.workers = max(1, workers)
+        self.grading_pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="grade")
+        # Spawned, not forked: workers start on demand from request threads
+        self.extract_pool = ProcessPoolExecutor(max_workers=max(1, extract_workers),
+                                                mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=_warm_extraction_worker)
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def load_document(self, payload: dict, field: str) -> Optional[str]:
+        """
+        Reads `field` from a submission: inline text, or a `<field>_file`
+        path on the server (PDFs are extracted by the worker processes).
+        """
+        if payload.get(field) is not None:
+            return payload[field]
+        path = payload.get(f"{field}_file")
+        if not path:
+            return None
+        if Path(path).suffix.lower() != ".pdf":
+            return Path(path).read_text(encoding="utf-8")
+
+        key = pdf_cache_key(path)
+        markdown = pdf_markdown_cache.get(key)
+        if markdown is None:
+            markdown = self.extract_pool.submit(_extract_in_worker, path).result()
+            pdf_markdown_cache.put(key, markdown)
+        return markdown
+
+    def validate(self, agent: str, payload) -> None:
+        """
+        Rejects a submission that can't be graded, before it becomes a job:
+        raises ValueError naming the problem.
+        """
+        if agent not in AGENTS:
+            raise ValueError(f"Unknown agent: {agent}")
+        if not isinstance(payload, dict):
+            raise ValueError("A submission must be a JSON object")
+        job_id = payload.get("id")
+        if job_id is not None and not isinstance(job_id, str):
+            raise ValueError("id must be a string")
+        with self._lock:
+            if job_id in self.jobs:
+                raise ValueError(f"Job {job_id} already exists")
+        fields = ("audio",) if agent == "vc" else ("questions", "answers", "rubric")
+        for field in fields:
+            path = payload.get(f"{field}_file")
+            if path is not None and (not isinstance(path, str) or not Path(path).is_file()):
+                raise ValueError(f"{field}_file not found: {path}")
+        if agent == "vc":
+            if not payload.get("audio_file"):
+                raise ValueError("VC grading requires audio_file")
+        elif any(payload.get(field) is None and not payload.get(f"{field}_file")
+                 for field in ("questions", "answers")):
+            raise ValueError("Technical/Narrative grading requires questions and answers")
+
+    def grade(self, agent: str, payload: dict) -> Optional[dict]:
+        if agent == "vc":
+            audio = payload.get("audio_file")
+            if not audio:
+                raise ValueError("VC grading requires audio_file")
+            return self.graders["vc"](audio)
+
+        questions = self.load_document(payload, "questions")
+        answers = self.load_document(payload, "answers")
+        if questions is None or answers is None:
+            raise ValueError("Technical/Narrative grading requires questions and answers")
+        rubric = self.load_document(payload, "rubric")
+        return self.graders[agent](questions, answers, rubric, per_question=bool(payload.get("per_question")))
+
+    def submit(self, agent: str, payload: dict) -> str:
+        self.validate(agent, payload)
+        job_id = self._register(agent, payload)
+        future = self.grading_pool.submit(self._run, job_id, agent, payload)
+        with self._lock:
+            self._futures[job_id] = future
+        return job_id
+
+    def submit_pitches(self, payloads: list) -> list:
+        """
+        Submits a batch of VC pitches as one run of the agent's stage
+        pipeline (grade_pitches), so transcription, audio analysis and
+        grading of different pitches overlap. Each pitch is still its own job.
+        """
+        for payload in payloads:
+            self.validate("vc", payload)
+        job_ids = []
+        jobs_by_audio = {}
+        for payload in payloads:
+            job_id = self._register("vc", payload)
+            future = Future()
+            with self._lock:
+                self._futures[job_id] = future
+            job_ids.append(job_id)
+            jobs_by_audio.setdefault(payload["audio_file"], []).append((job_id, future))
+
+        def run():
+            for job_id, _ in (job for jobs in jobs_by_audio.values() for job in jobs):
+                self._set(job_id, status=RUNNING, started=time.time())
+            try:
+                for audio, result, error in self.grade_pitches(list(jobs_by_audio), grading_workers=self.workers):
+                    if error is None and result is None:
+                        error = "Could not parse LLM response"
+                    for job_id, future in jobs_by_audio.pop(audio):
+                        if error:
+                            job = self._set(job_id, status=FAILED, error=error, finished=time.time())
+                        else:
+                            job = self._set(job_id, status=DONE, result=result, finished=time.time())
+                        future.set_result(job)
+            except Exception as e:
+                # Whatever the pipeline didn't get to fails instead of hanging its waiters
+                for job_id, future in (job for jobs in jobs_by_audio.values() for job in jobs):
+                    future.set_result(self._set(job_id, status=FAILED, error=f"{type(e).__name__}: {e}",
+                                                finished=time.time()))
+
+        if jobs_by_audio:
+            threading.Thread(target=run, name="pitch-pipeline", daemon=True).start()
+        return job_ids
+
+    def _register(self, agent: str, payload: dict) -> str:
+        job_id = payload.get("id") or uuid.uuid4().hex
+        with self._lock:
+            if job_id in self.jobs:
+                raise ValueError(f"Job {job_id} already exists")
+            self.jobs[job_id] = {"job_id": job_id, "agent": agent, "status": QUEUED,
+                                 "submitted": time.time()}
+            self._drop_old_jobs()
+        return job_id
+
+    def _run(self, job_id: str, agent: str, payload: dict) -> dict:
+        self._set(job_id, status=RUNNING, started=time.time())
+        try:
+            result = self.grade(agent, payload)
+        except Exception as e:
+            return self._set(job_id, status=FAILED, error=f"{type(e).__name__}: {e}", finished=time.time())
+        if result is None:
+            return self._set(job_id, status=FAILED, error="Could not parse LLM response", finished=time.time())
+        return self._set(job_id, status=DONE, result=result, finished=time.time())
+
+    def _set(self, job_id: str, **fields) -> dict:
+        with self._lock:
+            job = self.jobs.setdefault(job_id, {"job_id": job_id})
+            job.update(fields)
+            return dict(job)
+
+    def _drop_old_jobs(self) -> None:
+        while len(self.jobs) > self.max_jobs:
+            oldest = next((job_id for job_id, job in self.jobs.items() if job["status"] in (DONE, FAILED)), None)
+            if oldest is None:
+                break
+            del self.jobs[oldest]
+            self._futures.pop(oldest, None)
+
+    def get(self, job_id: str, wait: float = 0) -> Optional[dict]:
+        """
+        Current state of a job; with `wait`, blocks up to that many seconds
+        for it to finish (long polling).
+        """
+        with self._lock:
+            future: Optional[Future] = self._futures.get(job_id)
+        if wait and future is not None:
+            try:
+                future.result(timeout=min(wait, MAX_POLL_WAIT_SECONDS))
+            except Exception:
+                pass
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def as_completed(self, job_ids):
+        """
+        Yields the final state of each job as it finishes. Jobs that are no
+        longer known (dropped past max_jobs) are reported as failed first.
+        """
+        with self._lock:
+            futures = [self._futures[job_id] for job_id in job_ids if job_id in self._futures]
+            unknown = [job_id for job_id in job_ids if job_id not in self._futures]
+        for job_id in unknown:
+            yield {"job_id": job_id, "status": FAILED, "error": f"Unknown job {job_id}"}
+        for future in as_completed(futures):
+            yield future.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            statuses = {}
+            for job in self.jobs.values():
+                statuses[job["status"]] = statuses.get(job["status"], 0) + 1
+        return {"jobs": statuses, "usage": usage_tracker.summary(), "response_cache": response_cache.stats(),
+                "requests": get_backend().metrics()}
+
+    def shutdown(self) -> None:
+        self.grading_pool.shutdown(wait=False, cancel_futures=True)
+        self.extract_pool.shutdown(wait=False, cancel_futures=True)
+
+
+class GradingRequestHandler(BaseHTTPRequestHandler):
+    """
+    JSON API:
+
+      POST /grade/<agent>          submit one submission, returns {"job_id"} (202)
+      POST /grade/<agent>?wait=1   same, but answers with the finished job
+      GET  /jobs/<job_id>[?wait=s] poll a job (optionally long-polling)
+      POST /batch/<agent>          grade {"submissions": [...]} sharing top-level
+                                   questions/rubric; streams one NDJSON line per
+                                   submission as it finishes
+      GET  /health                 job counts, token usage and cache stats
+
+    A submission gives questions, answers and rubric either inline or as
+    server-side paths (questions_file, answers_file, rubric_file), or
+    audio_file for the vc agent.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def service(self) -> GradingService:
+        return self.server.service
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        if parts == ["health"]:
+            self._send_json(200, self.service.stats())
+        elif len(parts) == 2 and parts[0] == "jobs":
+            job = self.service.get(parts[1], wait=float(query.get("wait", [0])[0]))
+            if job is None:
+                self._send_json(404, {"error": f"Unknown job {parts[1]}"})
+            else:
+                self._send_json(200, job)
+        else:
+            self._send_json(404, {"error": f"Unknown endpoint {url.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path.strip("/").split("/")
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        except json.JSONDecodeError as e:
+            self._send_json(400, {"error": f"Invalid JSON: {e}"})
+            return
+        if not isinstance(payload, dict):
+            self._send_json(400, {"error": "Expected a JSON object"})
+            return
+
+        if len(parts) != 2 or parts[0] not in ("grade", "batch"):
+            self._send_json(404, {"error": f"Unknown endpoint {url.path}"})
+            return
+        if parts[1] not in AGENTS:
+            self._send_json(400, {"error": f"Unknown agent: {parts[1]}"})
+            return
+
+        if parts[0] == "grade":
+            try:
+                job_id = self.service.submit(parts[1], payload)
+            except ValueError as e:
+                self._send_json(400, {"error": str(e)})
+                return
+            if query.get("wait"):
+                self._send_json(200, self.service.get(job_id, wait=MAX_POLL_WAIT_SECONDS))
+            else:
+                self._send_json(202, {"job_id": job_id})
+        else:
+            self._stream_batch(parts[1], payload)
+
+    def _stream_batch(self, agent: str, payload: dict):
+        shared = {k: v for k, v in payload.items() if k != "submissions"}
+        submissions = payload.get("submissions")
+        if not isinstance(submissions, list) or not all(isinstance(s, dict) for s in submissions):
+            self._send_json(400, {"error": "submissions must be a list of JSON objects"})
+            return
+        submissions = [{**shared, **submission} for submission in submissions]
+        ids = [submission["id"] for submission in submissions if submission.get("id")]
+        try:
+            if len(ids) != len(set(ids)):
+                raise ValueError("Duplicate submission ids")
+            # Every submission is checked before any of them is queued
+            for submission in submissions:
+                self.service.validate(agent, submission)
+            if agent == "vc":
+                job_ids = self.service.submit_pitches(submissions)
+            else:
+                job_ids = [self.service.submit(agent, submission) for submission in submissions]
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for job in self.service.as_completed(job_ids):
+            self._write_chunk((json.dumps(job, ensure_ascii=False) + "\n").encode("utf-8"))
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class GradingServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], service: GradingService):
+        super().__init__(address, GradingRequestHandler)
+        self.service = service
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON grading service with warm workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=GRADING_SERVER_WORKERS,
+                        help="Submissions graded at once (bounded by the LLM, not the CPU)")
+    parser.add_argument("--extract-workers", type=int, default=GRADING_SERVER_EXTRACT_WORKERS,
+                        help="Warm processes for PDF extraction")
+    args = parser.parse_args()
+
+    service = GradingService(workers=args.workers, extract_workers=args.extract_workers)
+    server = GradingServer((args.host, args.port), service)
+    print(f"Grading service listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == "__main__":
+    main()
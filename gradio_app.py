@@ -1,40 +1,56 @@
 import gradio as gr
+import os
 import json
+import asyncio
 import tempfile
 from pathlib import Path
 
-from technical_agent.tech_grader_agent import grade_exam as grade_tech
-from narrative_agent.narrative_grader_agent import grade_exam as grade_narrative
-from vc_pitch_agent.vc_grader_agent import grade_pitch as grade_vc
-from utils import extract_pdf_to_markdown
+from run_example import load_grader
+from utils import iter_pdf_markdown, pdf_cache_key, pdf_page_count, pdf_markdown_cache
+
+# Queue settings: users grading at once per tab, submissions graded at once
+# within one multi-file upload, and requests allowed to wait in the queue
+EXAM_CONCURRENCY = int(os.getenv("GRADIO_EXAM_CONCURRENCY", 4))
+VC_CONCURRENCY = int(os.getenv("GRADIO_VC_CONCURRENCY", 2))
+EXAM_BATCH_CONCURRENCY = int(os.getenv("GRADIO_EXAM_BATCH_CONCURRENCY", 4))
+QUEUE_MAX_SIZE = int(os.getenv("GRADIO_QUEUE_MAX_SIZE", 64))
 
 
 def load_text_file(file_path: Path) -> str:
     return Path(file_path).read_text(encoding="utf-8")
 
 
-def load_file_as_markdown(file_path: Path) -> str:
-    if file_path.suffix == ".pdf":
-        return extract_pdf_to_markdown(str(file_path))
-    return load_text_file(file_path)
+def load_file_as_markdown(file_path: Path, progress=None, label: str = "") -> str:
+    """
+    Loads a PDF page by page (reporting progress per page) or a text file.
+    Extracted PDFs go through the shared content-hash cache.
+    """
+    if file_path.suffix != ".pdf":
+        return load_text_file(file_path)
 
+    key = pdf_cache_key(str(file_path))
+    markdown = pdf_markdown_cache.get(key)
+    if markdown is not None:
+        return markdown
 
-def handle_exam(exam_file, rubric_file, response_file, exam_type):
-    if not exam_file or not response_file:
-        return "Error: Exam and student response are required.", None, None
+    total = pdf_page_count(str(file_path))
+    chunks = []
+    for page_number, chunk in enumerate(iter_pdf_markdown(str(file_path)), start=1):
+        chunks.append(chunk)
+        if progress is not None:
+            progress((page_number, total), desc=f"Extracting {label or file_path.name}", unit="pages")
 
-    questions = load_file_as_markdown(Path(exam_file.name))
-    answers = load_file_as_markdown(Path(response_file.name))
-    rubric = load_file_as_markdown(Path(rubric_file.name)) if rubric_file else None
+    markdown = "".join(chunks).strip()
+    pdf_markdown_cache.put(key, markdown)
+    return markdown
 
-    if exam_type == "technical":
-        result = grade_tech(questions, answers, rubric)
-    else:
-        result = grade_narrative(questions, answers, rubric)
 
-    json_output = json.dumps(result, indent=2)
+def _file_path(file) -> Path:
+    # gr.File gives a tempfile wrapper on Gradio 3 and a path string on Gradio 4
+    return Path(getattr(file, "name", file))
 
-    # Save outputs
+
+def _save_outputs(json_output: str):
     json_path = tempfile.NamedTemporaryFile(delete=False, suffix=".json").name
     with open(json_path, "w") as f:
         f.write(json_output)
@@ -42,24 +58,99 @@ def handle_exam(exam_file, rubric_file, response_file, exam_type):
     pdf_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
     # You could implement PDF generation here if needed
 
-    return json_output, json_path, pdf_path
-
-
-def handle_vc_pitch(audio_file):
+    return json_path, pdf_path
+
+
+async def handle_exam(exam_file, rubric_file, response_files, exam_type, progress=gr.Progress()):
+    """
+    Grades one student response, or several uploaded at once. Blocking work
+    (extraction, LLM calls) runs in worker threads so the event loop keeps
+    serving other users; batch results are streamed back as they complete.
+    """
+    if not exam_file or not response_files or not exam_type:
+        yield "Error: Exam, exam type and student response are required.", None, None
+        return
+    if not isinstance(response_files, list):
+        response_files = [response_files]
+
+    progress(0, desc="Extracting exam")
+    questions = await asyncio.to_thread(load_file_as_markdown, _file_path(exam_file), progress, "exam")
+    rubric = None
+    if rubric_file:
+        rubric = await asyncio.to_thread(load_file_as_markdown, _file_path(rubric_file), progress, "rubric")
+    grade_exam = load_grader(exam_type)
+
+    if len(response_files) == 1:
+        answers = await asyncio.to_thread(load_file_as_markdown, _file_path(response_files[0]), progress,
+                                          "student response")
+        # Each question's grade is shown as soon as the model has produced it
+        progress(0.5, desc="Grading")
+        graded = {}
+        stream = load_grader(exam_type, "grade_exam_stream")(questions, answers, rubric)
+        while (event := await asyncio.to_thread(next, stream, None)) is not None:
+            key, value = event
+            if key == "result":
+                json_output = json.dumps(value, indent=2)
+                yield json_output, *_save_outputs(json_output)
+                return
+            graded[key] = value
+            yield json.dumps(graded, indent=2), None, None
+
+    semaphore = asyncio.Semaphore(EXAM_BATCH_CONCURRENCY)
+
+    async def grade_one(file) -> dict:
+        path = _file_path(file)
+        record = {"student": path.stem}
+        async with semaphore:
+            try:
+                answers = await asyncio.to_thread(load_file_as_markdown, path)
+                record["result"] = await asyncio.to_thread(grade_exam, questions, answers, rubric)
+            except Exception as e:
+                record["error"] = f"{type(e).__name__}: {e}"
+        return record
+
+    records = []
+    progress((0, len(response_files)), desc="Grading submissions", unit="submissions")
+    for next_record in asyncio.as_completed([grade_one(file) for file in response_files]):
+        records.append(await next_record)
+        progress((len(records), len(response_files)), desc="Grading submissions", unit="submissions")
+        json_output = "\n".join(json.dumps(record, ensure_ascii=False) for record in records)
+        if len(records) < len(response_files):
+            yield json_output, None, None
+    yield json_output, *_save_outputs(json.dumps(records, indent=2, ensure_ascii=False))
+
+
+async def handle_vc_pitch(audio_file, progress=gr.Progress()):
+    """
+    Grades a pitch recording, reporting when the transcription and the audio
+    analysis (which run concurrently) each finish.
+    """
     if not audio_file:
-        return "Error: Please upload an audio file.", None, None
-
-    result = grade_vc(audio_file)
+        yield "Error: Please upload an audio file.", None, None
+        return
+
+    from vc_pitch_agent import vc_grader_agent
+
+    progress(0.1, desc="Transcribing and analyzing audio")
+    done = {}
+    status = []
+    stages = vc_grader_agent.analysis_stages(audio_file)
+    while (event := await asyncio.to_thread(next, stages, None)) is not None:
+        stage, value = event
+        done[stage] = value
+        if stage == "transcript":
+            status.append(f"Transcription complete ({len(value.split())} words)")
+        else:
+            status.append(f"Audio analysis complete ({value['duration'] / 60:.1f} min)")
+        progress(0.1 + 0.3 * len(done), desc=status[-1])
+        yield "\n".join(status), None, None
+
+    metrics = vc_grader_agent.pitch_metrics(done["transcript"], done["profile"])
+    progress(0.7, desc="Grading")
+    result = await asyncio.to_thread(vc_grader_agent.grade_from_metrics, *metrics)
     json_output = json.dumps(result, indent=2)
 
-    json_path = tempfile.NamedTemporaryFile(delete=False, suffix=".json").name
-    with open(json_path, "w") as f:
-        f.write(json_output)
-
-    pdf_path = tempfile.NamedTemporaryFile(delete=False, suffix=".pdf").name
-    # You could implement PDF generation here if needed
-
-    return json_output, json_path, pdf_path
+    yield json_output, *_save_outputs(json_output)
 
 
 ### 🎯 Gradio Interface
@@ -69,7 +160,7 @@ exam_tab = gr.Interface(
     inputs=[
         gr.File(label="Exam PDF"),
         gr.File(label="Rubric PDF (optional)"),
-        gr.File(label="Student Response (.txt, .md, .pdf)"),
+        gr.File(label="Student Response(s) (.txt, .md, .pdf)", file_count="multiple"),
         gr.Radio(["narrative", "technical"], label="Exam Type")
     ],
     outputs=[
@@ -77,7 +168,8 @@ exam_tab = gr.Interface(
         gr.File(label="Download JSON"),
         gr.File(label="Download PDF")
     ],
-    title="Narrative & Technical Exam Grader"
+    title="Narrative & Technical Exam Grader",
+    concurrency_limit=EXAM_CONCURRENCY,
 )
 
 vc_tab = gr.Interface(
@@ -88,10 +180,14 @@ vc_tab = gr.Interface(
         gr.File(label="Download JSON"),
         gr.File(label="Download PDF")
     ],
-    title="VC Pitch Grader"
+    title="VC Pitch Grader",
+    concurrency_limit=VC_CONCURRENCY,
 )
 
-gr.TabbedInterface(
+demo = gr.TabbedInterface(
     [exam_tab, vc_tab],
     ["Text-based Exams", "VC Pitch Grading"]
-).launch()
+)
+
+if __name__ == "__main__":
+    demo.queue(max_size=QUEUE_MAX_SIZE).launch()
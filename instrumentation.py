@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Config: spans are recorded only when tracing is enabled (a trace file is
+# set or a summary was requested with --profile), so they cost nothing otherwise
+EXAMINER_TRACE_FILE = os.getenv("EXAMINER_TRACE_FILE")
+MAX_KEPT_SPANS = 100000
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """
+    Peak resident memory of this process so far, in MB.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class Span:
+    """
+    One timed stage. Attributes (token counts, cache hit/miss, file, ...)
+    are attached with `set`.
+    """
+    __slots__ = ("name", "attributes")
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **attributes) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Records spans around the pipeline stages: wall time, CPU time of the
+    calling thread (work handed to other processes is not included), the
+    process's peak RSS at the end of the span and how much the span raised
+    it, plus whatever attributes the stage sets.
+
+    Finished spans are appended to a JSONL trace file if one is configured,
+    and kept in memory for summary().
+    """
+
+    def __init__(self, trace_file: Optional[str] = EXAMINER_TRACE_FILE):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+        self.spans = deque(maxlen=MAX_KEPT_SPANS)
+        self.trace_file = None
+        self.enabled = False
+        if trace_file:
+            self.enable(trace_file)
+
+    def enable(self, trace_file: Optional[str] = None) -> None:
+        with self._lock:
+            self.enabled = True
+            if trace_file:
+                self.trace_file = trace_file
+
+    def reset(self) -> None:
+        with self._lock:
+            self.spans.clear()
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            yield _NULL_SPAN
+            return
+
+        span = Span(name, attributes)
+        stack = self._local.__dict__.setdefault("stack", [])
+        span_id = next(self._ids)
+        parent = stack[-1] if stack else None
+        stack.append(span_id)
+        rss_before = _peak_rss_mb()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            # A generator's span may be closed from another thread than the one that opened it
+            if span_id in stack:
+                stack.remove(span_id)
+            rss_after = _peak_rss_mb()
+            record = {
+                "span": span_id,
+                "parent": parent,
+                "name": name,
+                "start": time.time() - wall,
+                "wall_seconds": wall,
+                "cpu_seconds": cpu,
+                "peak_rss_mb": rss_after,
+                "peak_rss_growth_mb": rss_after - rss_before if rss_after is not None else None,
+                "thread": threading.current_thread().name,
+                **span.attributes,
+            }
+            if error:
+                record["error"] = error
+            self._finish(record)
+
+    def _finish(self, record: dict) -> None:
+        with self._lock:
+            self.spans.append(record)
+            if self.trace_file:
+                with open(self.trace_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+    def summary(self) -> dict:
+        """
+        Per-stage totals: span count, wall and CPU seconds (total, mean, p95),
+        memory, tokens, cache hits/misses and errors.
+
+        Memory comes from the process-wide ru_maxrss: `peak_rss_mb` is the
+        highest peak seen when one of the stage's spans ended (including
+        what other stages had allocated), and `peak_rss_growth_mb` how much
+        the stage's spans raised that peak in total. Stages running
+        concurrently share the growth of whichever span was open at the time.
+        """
+        with self._lock:
+            spans = list(self.spans)
+
+        stages = {}
+        for record in spans:
+            stages.setdefault(record["name"], []).append(record)
+
+        summary = {}
+        for name, records in stages.items():
+            walls = sorted(r["wall_seconds"] for r in records)
+            stage = {
+                "count": len(records),
+                "wall_seconds": sum(walls),
+                "wall_mean": sum(walls) / len(walls),
+                "wall_p95": walls[min(len(walls) - 1, int(len(walls) * 0.95))],
+                "cpu_seconds": sum(r["cpu_seconds"] for r in records),
+                "peak_rss_mb": max((r["peak_rss_mb"] or 0) for r in records),
+                "peak_rss_growth_mb": sum((r["peak_rss_growth_mb"] or 0) for r in records),
+            }
+            for field in ("prompt_tokens", "completion_tokens"):
+                total = sum(r.get(field) or 0 for r in records)
+                if total:
+                    stage[field] = total
+            cache = [r["cache"] for r in records if "cache" in r]
+            if cache:
+                stage["cache_hits"] = cache.count("hit")
+                stage["cache_misses"] = cache.count("miss")
+            errors = sum("error" in r for r in records)
+            if errors:
+                stage["errors"] = errors
+            summary[name] = stage
+        return summary
+
+    def format_summary(self) -> str:
+        lines = [f"{'stage':22} {'count':>6} {'wall s':>9} {'mean s':>8} {'p95 s':>8} {'cpu s':>8} "
+                 f"{'peak MB':>9} {'+MB':>8} {'tokens in/out':>15} {'cache hit/miss':>15}"]
+        for name, stage in sorted(self.summary().items(), key=lambda item: -item[1]["wall_seconds"]):
+            tokens = (f"{stage.get('prompt_tokens', 0)}/{stage.get('completion_tokens', 0)}"
+                      if "prompt_tokens" in stage or "completion_tokens" in stage else "")
+            cache = f"{stage['cache_hits']}/{stage['cache_misses']}" if "cache_hits" in stage else ""
+            lines.append(f"{name:22} {stage['count']:>6} {stage['wall_seconds']:>9.3f} {stage['wall_mean']:>8.3f} "
+                         f"{stage['wall_p95']:>8.3f} {stage['cpu_seconds']:>8.3f} {stage['peak_rss_mb']:>9.1f} "
+                         f"{stage['peak_rss_growth_mb']:>8.1f} {tokens:>15} {cache:>15}")
+        return "\n".join(lines)
+
+
+tracer = Tracer()
+
+
+def span(name: str, **attributes):
+    """
+    `with span("stage", key=value) as s: ... s.set(more=...)` on the shared tracer.
+    """
+    return tracer.span(name, **attributes)
@@ -0,0 +1,145 @@
+import os
+import json
+import time
+import sqlite3
+from threading import Lock
+from typing import List, Optional
+
+from utils import file_digest
+
+# Submission lifecycle
+PENDING = "pending"
+EXTRACTED = "extracted"
+GRADED = "graded"
+FAILED = "failed"
+
+
+class JobStore:
+    """
+    SQLite-backed record of cohort grading jobs.
+
+    Every submission of a job is tracked through pending -> extracted -> graded
+    (or failed), together with its extracted markdown and parsed result, so an
+    interrupted run can be resumed without redoing completed work. A
+    submission whose file content changed since it was recorded starts over.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                agent TEXT NOT NULL,
+                config TEXT NOT NULL,
+                created REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS submissions (
+                job_id TEXT NOT NULL,
+                file TEXT NOT NULL,
+                student TEXT NOT NULL,
+                file_hash TEXT NOT NULL,
+                status TEXT NOT NULL,
+                markdown TEXT,
+                result TEXT,
+                error TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated REAL NOT NULL,
+                PRIMARY KEY (job_id, file)
+            );
+        """)
+        self._conn.commit()
+
+    def create_job(self, job_id: str, agent: str, config: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO jobs (job_id, agent, config, created) VALUES (?, ?, ?, ?)",
+                (job_id, agent, json.dumps(config, sort_keys=True), time.time()),
+            )
+            self._conn.commit()
+
+    def add_submissions(self, job_id: str, files: List[str]) -> None:
+        """
+        Registers submissions as pending. Already-known files keep their
+        progress unless their content has changed.
+        """
+        now = time.time()
+        with self._lock:
+            for file in files:
+                file_hash = file_digest(file)
+                row = self._conn.execute(
+                    "SELECT file_hash FROM submissions WHERE job_id = ? AND file = ?", (job_id, file)
+                ).fetchone()
+                if row is None:
+                    self._conn.execute(
+                        "INSERT INTO submissions (job_id, file, student, file_hash, status, updated) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (job_id, file, os.path.splitext(os.path.basename(file))[0], file_hash, PENDING, now),
+                    )
+                elif row[0] != file_hash:
+                    self._conn.execute(
+                        "UPDATE submissions SET file_hash = ?, status = ?, markdown = NULL, result = NULL, "
+                        "error = NULL, attempts = 0, updated = ? WHERE job_id = ? AND file = ?",
+                        (file_hash, PENDING, now, job_id, file),
+                    )
+            self._conn.commit()
+
+    def get(self, job_id: str, file: str) -> Optional[dict]:
+        with self._lock:
+            cursor = self._conn.execute(
+                "SELECT * FROM submissions WHERE job_id = ? AND file = ?", (job_id, file)
+            )
+            row = cursor.fetchone()
+            return self._row_to_dict(cursor, row) if row else None
+
+    def submissions(self, job_id: str, statuses: Optional[List[str]] = None) -> List[dict]:
+        query = "SELECT * FROM submissions WHERE job_id = ?"
+        params: list = [job_id]
+        if statuses:
+            query += f" AND status IN ({', '.join('?' * len(statuses))})"
+            params += statuses
+        with self._lock:
+            cursor = self._conn.execute(query + " ORDER BY file", params)
+            return [self._row_to_dict(cursor, row) for row in cursor.fetchall()]
+
+    def mark_extracted(self, job_id: str, file: str, markdown: str) -> None:
+        self._update(job_id, file, status=EXTRACTED, markdown=markdown)
+
+    def mark_graded(self, job_id: str, file: str, result: dict) -> None:
+        self._update(job_id, file, status=GRADED, result=json.dumps(result, ensure_ascii=False),
+                     error=None, count_attempt=True)
+
+    def mark_failed(self, job_id: str, file: str, error: str) -> None:
+        self._update(job_id, file, status=FAILED, error=error, count_attempt=True)
+
+    def counts(self, job_id: str) -> dict:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM submissions WHERE job_id = ? GROUP BY status", (job_id,)
+            ).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _update(self, job_id: str, file: str, count_attempt: bool = False, **fields) -> None:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        if count_attempt:
+            assignments += ", attempts = attempts + 1"
+        with self._lock:
+            self._conn.execute(
+                f"UPDATE submissions SET {assignments}, updated = ? WHERE job_id = ? AND file = ?",
+                (*fields.values(), time.time(), job_id, file),
+            )
+            self._conn.commit()
+
+    @staticmethod
+    def _row_to_dict(cursor, row) -> dict:
+        record = {column[0]: value for column, value in zip(cursor.description, row)}
+        if record.get("result"):
+            record["result"] = json.loads(record["result"])
+        return record
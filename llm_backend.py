@@ -0,0 +1,344 @@
+import os
+import json
+import threading
+from types import SimpleNamespace
+from typing import Iterator, Optional, Tuple
+
+from chunked_grading import split_into_questions
+from llm_cache import ResponseCache
+from request_scheduler import RequestScheduler
+
+# Allowance added to the prompt estimate when reserving tokens-per-minute,
+# for requests that don't set max_tokens
+COMPLETION_TOKEN_ALLOWANCE = 1024
+# Characters per delta when the fake backend streams a response
+FAKE_STREAM_CHUNK_CHARS = 16
+
+FAKE_TRANSCRIPT = "This is a fake transcript of a startup pitch used for offline testing."
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token count (about 4 characters per token) for rate-limit budgeting.
+    """
+    return len(text) // 4 + 1
+
+
+def fake_completion(messages: list) -> str:
+    """
+    Deterministic stand-in for a grading completion: a VC score card when the
+    prompt asks for one, otherwise one graded entry per question found in the
+    prompt (at least one), keyed by student for a packed prompt.
+    """
+    # Imported here: packed_grading depends on this module
+    from packed_grading import SUBMISSION_LABEL
+
+    prompt = "\n".join(message.get("content") or "" for message in messages)
+    if '"Problem"' in prompt:
+        return json.dumps({
+            "Problem": 7, "Market": 6, "Solution": 7, "Delivery": 8,
+            "Feedback": "Quantify the market and close with a clearer ask.",
+        })
+
+    _, sections = split_into_questions(messages[-1].get("content") or "")
+    numbers = list(sections) or [1]
+    result = {
+        f"question_{n}": {"score": 7, "max_score": 10, "feedback": "Solid answer; add a concrete example."}
+        for n in numbers
+    }
+    result["total_score"] = 7 * len(numbers)
+    result["total_max_score"] = 10 * len(numbers)
+    labels = SUBMISSION_LABEL.findall(messages[-1].get("content") or "")
+    if labels:
+        return json.dumps({label: result for label in labels})
+    return json.dumps(result)
+
+
+def load_recordings(path: Optional[str]) -> dict:
+    """
+    Reads a JSONL file of {"key": ..., "response": ...} lines (as written
+    with LLM_RECORD_FILE) into a key -> response dict.
+    """
+    recordings = {}
+    if path and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    recordings[entry["key"]] = entry["response"]
+    return recordings
+
+
+class LLMBackend:
+    """
+    Interface of the model providers the agents talk to.
+
+    `chat` returns the completion text and the provider's usage block (or
+    None); `chat_stream` yields `(delta, usage)` pairs as the completion is
+    generated, with usage only on the last one; `transcribe` returns what
+    the OpenAI SDK would for the given response_format.
+    """
+    name = "base"
+    # Whether responses may be stored in the persistent response cache
+    cacheable = True
+
+    def resolve_model(self, model: str) -> str:
+        return model
+
+    def chat(self, messages: list, model: str, temperature: float, **params) -> Tuple[Optional[str], object]:
+        raise NotImplementedError
+
+    def chat_stream(self, messages: list, model: str, temperature: float,
+                    **params) -> Iterator[Tuple[Optional[str], object]]:
+        # Backends without streaming deliver the whole completion as one delta
+        yield self.chat(messages, model, temperature, **params)
+
+    def transcribe(self, audio_path: str, model: str, response_format: str = "text"):
+        raise NotImplementedError
+
+    def metrics(self) -> dict:
+        return {}
+
+
+class OpenAIBackend(LLMBackend):
+    """
+    OpenAI API through the rate-limit-aware RequestScheduler. The client is
+    created on first use (so importing an agent never needs credentials) and
+    reused, keeping its HTTP connections alive between requests.
+    """
+    name = "openai"
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None,
+                 scheduler: Optional[RequestScheduler] = None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.scheduler = scheduler or RequestScheduler()
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                import openai
+
+                api_key = self.api_key or os.getenv("OPENAI_API_KEY")
+                if not api_key:
+                    raise RuntimeError("Missing OPENAI_API_KEY in environment")
+                # Retries are disabled at the SDK level: the scheduler owns them
+                self._client = openai.OpenAI(api_key=api_key, base_url=self.base_url,
+                                             max_retries=0, timeout=self.scheduler.timeout)
+            return self._client
+
+    def chat(self, messages: list, model: str, temperature: float, **params):
+        estimated = (sum(estimate_tokens(m.get("content") or "") for m in messages)
+                     + (params.get("max_tokens") or COMPLETION_TOKEN_ALLOWANCE))
+        response = self.scheduler.call(
+            lambda timeout: self.client().chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                timeout=timeout,
+                **params
+            ),
+            estimated_tokens=estimated,
+        )
+        return response.choices[0].message.content, getattr(response, "usage", None)
+
+    def chat_stream(self, messages: list, model: str, temperature: float, **params):
+        # Throttling and retries cover opening the stream; once tokens flow
+        # a dropped connection surfaces to the caller.
+        estimated = (sum(estimate_tokens(m.get("content") or "") for m in messages)
+                     + (params.get("max_tokens") or COMPLETION_TOKEN_ALLOWANCE))
+        stream = self.scheduler.call(
+            lambda timeout: self.client().chat.completions.with_raw_response.create(
+                model=model,
+                messages=messages,
+                temperature=temperature,
+                timeout=timeout,
+                stream=True,
+                stream_options={"include_usage": True},
+                **params
+            ),
+            estimated_tokens=estimated,
+        )
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            yield delta, getattr(chunk, "usage", None)
+
+    def transcribe(self, audio_path: str, model: str, response_format: str = "text"):
+        # The file is reopened on every attempt so retries upload it from the start
+        def send(timeout):
+            with open(audio_path, "rb") as f:
+                return self.client().audio.transcriptions.with_raw_response.create(
+                    model=model,
+                    file=f,
+                    response_format=response_format,
+                    timeout=timeout
+                )
+
+        return self.scheduler.call(send)
+
+    def metrics(self) -> dict:
+        return self.scheduler.metrics()
+
+
+class OpenAICompatibleBackend(OpenAIBackend):
+    """
+    Any server speaking the OpenAI chat API (vLLM, llama.cpp, Ollama, ...).
+    `model`, if given, replaces the model names the agents ask for.
+    """
+    name = "local"
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None, model: Optional[str] = None,
+                 scheduler: Optional[RequestScheduler] = None):
+        super().__init__(base_url=base_url, api_key=api_key or "not-needed", scheduler=scheduler)
+        self.model = model
+
+    def resolve_model(self, model: str) -> str:
+        return self.model or model
+
+
+class FakeBackend(LLMBackend):
+    """
+    Deterministic in-process backend for offline runs, load tests and
+    benchmarks: replays recorded responses by request key and otherwise
+    synthesizes a well-formed grading response (see fake_completion).
+    """
+    name = "fake"
+    cacheable = False
+
+    def __init__(self, replay_file: Optional[str] = None):
+        self.recordings = load_recordings(replay_file)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.replayed = 0
+
+    def chat(self, messages: list, model: str, temperature: float, **params):
+        seed = params.pop("seed", None)
+        key = ResponseCache.make_key(model, messages, temperature, seed, **params)
+        content = self.recordings.get(key)
+        with self._lock:
+            self.calls += 1
+            self.replayed += content is not None
+        if content is None:
+            content = fake_completion(messages)
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") for m in messages)
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=estimate_tokens(content),
+                                prompt_tokens_details=SimpleNamespace(cached_tokens=0))
+        return content, usage
+
+    def chat_stream(self, messages: list, model: str, temperature: float, **params):
+        content, usage = self.chat(messages, model, temperature, **params)
+        for start in range(0, len(content), FAKE_STREAM_CHUNK_CHARS):
+            yield content[start:start + FAKE_STREAM_CHUNK_CHARS], None
+        yield None, usage
+
+    def transcribe(self, audio_path: str, model: str, response_format: str = "text"):
+        if response_format == "verbose_json":
+            segment = SimpleNamespace(start=0.0, end=1.0, text=FAKE_TRANSCRIPT)
+            return SimpleNamespace(text=FAKE_TRANSCRIPT, segments=[segment])
+        return FAKE_TRANSCRIPT
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "replayed": self.replayed}
+
+
+class RecordingBackend(LLMBackend):
+    """
+    Wraps another backend and appends every chat response to a JSONL file
+    that FakeBackend can replay.
+    """
+
+    def __init__(self, inner: LLMBackend, record_file: str):
+        self.inner = inner
+        self.record_file = record_file
+        self.name = inner.name
+        self.cacheable = inner.cacheable
+        self._lock = threading.Lock()
+
+    def resolve_model(self, model: str) -> str:
+        return self.inner.resolve_model(model)
+
+    def chat(self, messages: list, model: str, temperature: float, **params):
+        content, usage = self.inner.chat(messages, model, temperature, **params)
+        self._record(messages, model, temperature, params, content)
+        return content, usage
+
+    def chat_stream(self, messages: list, model: str, temperature: float, **params):
+        deltas = []
+        for delta, usage in self.inner.chat_stream(messages, model, temperature, **params):
+            if delta:
+                deltas.append(delta)
+            yield delta, usage
+        self._record(messages, model, temperature, params, "".join(deltas))
+
+    def _record(self, messages: list, model: str, temperature: float, params: dict, content: str) -> None:
+        recorded = dict(params)
+        seed = recorded.pop("seed", None)
+        entry = {"key": ResponseCache.make_key(model, messages, temperature, seed, **recorded),
+                 "response": content}
+        with self._lock:
+            with open(self.record_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def transcribe(self, audio_path: str, model: str, response_format: str = "text"):
+        return self.inner.transcribe(audio_path, model, response_format)
+
+    def metrics(self) -> dict:
+        return self.inner.metrics()
+
+
+def create_backend(kind: Optional[str] = None) -> LLMBackend:
+    """
+    Builds a backend from the environment (and .env file):
+    LLM_BACKEND selects "openai" (default), "local" (any OpenAI-compatible
+    endpoint at LLM_BASE_URL, optionally with LLM_API_KEY and an LLM_MODEL
+    override) or "fake" (deterministic, replaying LLM_REPLAY_FILE).
+    LLM_RECORD_FILE records every chat response for later replay.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    kind = kind or os.getenv("LLM_BACKEND", "openai")
+    base_url = os.getenv("LLM_BASE_URL")
+
+    if kind == "openai":
+        backend = OpenAIBackend(base_url=base_url)
+    elif kind == "local":
+        if not base_url:
+            raise ValueError("LLM_BACKEND=local requires LLM_BASE_URL")
+        backend = OpenAICompatibleBackend(base_url, api_key=os.getenv("LLM_API_KEY"), model=os.getenv("LLM_MODEL"))
+    elif kind == "fake":
+        backend = FakeBackend(os.getenv("LLM_REPLAY_FILE"))
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND: {kind}")
+
+    record_file = os.getenv("LLM_RECORD_FILE")
+    if record_file:
+        backend = RecordingBackend(backend, record_file)
+    return backend
+
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_backend() -> LLMBackend:
+    """
+    The process-wide backend, created from the environment on first use.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = create_backend()
+        return _backend
+
+
+def set_backend(backend: LLMBackend) -> None:
+    """
+    Replaces the process-wide backend (e.g. with a FakeBackend in benchmarks).
+    """
+    global _backend
+    with _backend_lock:
+        _backend = backend
@@ -0,0 +1,135 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from threading import Lock
+from typing import Optional
+
+from utils import CACHE_ROOT
+
+# Config
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(CACHE_ROOT, "llm_responses.sqlite"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 50000))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+
+# Eviction runs every N writes rather than on every put
+EVICT_EVERY = 50
+
+
+class ResponseCache:
+    """
+    Persistent cache of chat completions, shared by all grading agents.
+
+    Entries are keyed on the request (model, messages, temperature, seed and any
+    other sampling parameters) and stored in a local SQLite file. Entries older
+    than `ttl_seconds` are ignored and purged; beyond `max_entries` the least
+    recently used ones are evicted.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, ttl_seconds: float = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = Lock()
+        self._conn = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily so importing an agent never touches the filesystem.
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def make_key(model: str, messages: list, temperature: float, seed: Optional[int], **params) -> str:
+        """
+        Stable hash of everything that determines a completion.
+        """
+        payload = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "seed": seed,
+            "params": params,
+        }
+        encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, model: str, response: str) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, response, created, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, model, response, now, now),
+            )
+            conn.commit()
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 1:
+                self._evict(conn, now)
+
+    def evict(self) -> None:
+        """
+        Drops expired entries, then the least recently used beyond max_entries.
+        """
+        with self._lock:
+            self._evict(self._connection(), time.time())
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "  SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?"
+            ")",
+            (self.max_entries,),
+        )
+        conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM responses")
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+response_cache = ResponseCache()
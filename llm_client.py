@@ -0,0 +1,162 @@
+import os
+import time
+import threading
+from typing import Callable, Iterator, Optional
+
+from instrumentation import span
+from llm_backend import get_backend
+from llm_cache import LLM_CACHE_ENABLED, ResponseCache, response_cache
+
+
+class UsageTracker:
+    """
+    Accumulates token usage reported by the API across all calls in this
+    process, including how many prompt tokens were served from the
+    provider's prompt cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.prompt_tokens = 0
+            self.cached_prompt_tokens = 0
+            self.completion_tokens = 0
+
+    def record(self, usage) -> dict:
+        """
+        Records the `usage` block of a chat completion response.
+        """
+        details = getattr(usage, "prompt_tokens_details", None)
+        entry = {
+            "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "cached_prompt_tokens": getattr(details, "cached_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        }
+        with self._lock:
+            self.calls += 1
+            self.prompt_tokens += entry["prompt_tokens"]
+            self.cached_prompt_tokens += entry["cached_prompt_tokens"]
+            self.completion_tokens += entry["completion_tokens"]
+        self._local.last = entry
+        return entry
+
+    def last(self) -> Optional[dict]:
+        """
+        Usage of the most recent API call made on the current thread.
+        """
+        return getattr(self._local, "last", None)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_prompt_tokens": self.cached_prompt_tokens,
+                "completion_tokens": self.completion_tokens,
+                "prompt_cache_hit_rate": (
+                    self.cached_prompt_tokens / self.prompt_tokens if self.prompt_tokens else 0.0
+                ),
+            }
+
+
+usage_tracker = UsageTracker()
+
+
+def chat_completion(system: str, user: str, model: str, temperature: float,
+                    seed: Optional[int] = None, use_cache: bool = LLM_CACHE_ENABLED,
+                    accept: Optional[Callable[[str], bool]] = None, **params) -> str:
+    """
+    Sends a system/user exchange to the configured chat backend (see
+    llm_backend) and returns the message content. Identical requests are
+    served from the shared response cache instead of being re-billed.
+
+    With `accept`, a response is only cached if accept(content) is true, so
+    a malformed one isn't replayed to every later attempt at the same prompt.
+    """
+    backend = get_backend()
+    model = backend.resolve_model(model)
+    # Unset optional parameters (e.g. no response_format for this model) are not sent
+    params = {name: value for name, value in params.items() if value is not None}
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user}
+    ]
+
+    use_cache = use_cache and backend.cacheable
+    key = ResponseCache.make_key(model, messages, temperature, seed, **params)
+    with span("llm.chat", model=model) as stage:
+        if use_cache:
+            cached = response_cache.get(key)
+            if cached is not None:
+                stage.set(cache="hit")
+                return cached
+            stage.set(cache="miss")
+
+        if seed is not None:
+            params["seed"] = seed
+        content, usage = backend.chat(messages, model, temperature, **params)
+        if usage is not None:
+            stage.set(**usage_tracker.record(usage))
+
+    if use_cache and content is not None and (accept is None or accept(content)):
+        response_cache.put(key, model, content)
+    return content
+
+
+def chat_completion_stream(system: str, user: str, model: str, temperature: float,
+                           seed: Optional[int] = None, use_cache: bool = LLM_CACHE_ENABLED,
+                           accept: Optional[Callable[[str], bool]] = None, **params) -> Iterator[str]:
+    """
+    Like chat_completion, but yields the message content as it is generated.
+    A cached response is yielded in one piece; a completed stream is stored
+    in the cache like any other response (subject to `accept`).
+    """
+    backend = get_backend()
+    model = backend.resolve_model(model)
+    params = {name: value for name, value in params.items() if value is not None}
+    messages = [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user}
+    ]
+
+    use_cache = use_cache and backend.cacheable
+    key = ResponseCache.make_key(model, messages, temperature, seed, **params)
+    # The span covers the whole stream, including time the consumer spends between pieces
+    with span("llm.chat_stream", model=model) as stage:
+        if use_cache:
+            cached = response_cache.get(key)
+            if cached is not None:
+                stage.set(cache="hit")
+                yield cached
+                return
+            stage.set(cache="miss")
+
+        if seed is not None:
+            params["seed"] = seed
+        started = time.perf_counter()
+        deltas = []
+        for delta, usage in backend.chat_stream(messages, model, temperature, **params):
+            if usage is not None:
+                stage.set(**usage_tracker.record(usage))
+            if delta:
+                if not deltas:
+                    stage.set(first_token_seconds=time.perf_counter() - started)
+                deltas.append(delta)
+                yield delta
+
+    content = "".join(deltas)
+    if use_cache and deltas and (accept is None or accept(content)):
+        response_cache.put(key, model, content)
+
+
+def transcribe(audio_path: str, model: str = "whisper-1", response_format: str = "text"):
+    """
+    Transcribes an audio file with the configured backend.
+    """
+    with span("llm.transcribe", model=model, file=os.path.basename(str(audio_path))):
+        return get_backend().transcribe(audio_path, model, response_format)
@@ -1,15 +1,10 @@
-import os
-import json
-from typing import Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
-import openai
-from dotenv import load_dotenv
-
-# Load API key
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-assert api_key, "Missing OPENAI_API_KEY in environment"
-openai.api_key = api_key
+from llm_client import chat_completion, chat_completion_stream
+from structured_output import exam_response_ok, parse_exam_response, response_format_for, stream_exam_result
+from chunked_grading import grade_by_question
+from packed_grading import PACK_TOKEN_BUDGET, grade_pack, plan_packs
+from prompt_layout import assemble_prompt
 
 # Config
 DEFAULT_MODEL = "gpt-4o-mini"
@@ -77,55 +72,110 @@ Use only numeric values for all scores.
 Return only raw JSON in your response. Do not include any formatting, markdown, or explanations.
 """
 
-    if rubric and rubric.strip():
-        system_prompt = base_instructions + "\nA rubric is provided. Use it for assigning scores."
-        user_prompt = f"Rubric:\n{rubric}\n\nQuestions:\n{questions}\n\nStudent Responses:\n{responses}"
-    else:
-        system_prompt = base_instructions + "\nNo rubric is provided. Use a default max score of 10 per question."
-        user_prompt = f"Questions:\n{questions}\n\nStudent Responses:\n{responses}"
+    # The system prompt and the rubric/questions prefix are identical for every
+    # student in a cohort, so the provider can serve them from its prompt cache.
+    system_prompt = base_instructions + (
+        "\nIf a rubric is provided, use it for assigning scores. "
+        "Otherwise use a default max score of 10 per question."
+    )
+    has_rubric = bool(rubric and rubric.strip())
+    user_prompt = assemble_prompt(
+        shared=[
+            ("Rubric:", rubric if has_rubric else "No rubric is provided."),
+            ("Questions:", questions),
+        ],
+        per_submission=[("Student Responses:", responses)],
+    )
 
     return {
         "system": system_prompt.strip(),
-        "user": user_prompt.strip()
+        "user": user_prompt
     }
 
 
+def chat_params() -> dict:
+    """
+    Model and sampling parameters of every grading request (also used to
+    build Batch API requests, see batch_api).
+    """
+    return {
+        "model": DEFAULT_MODEL,
+        "temperature": DEFAULT_TEMPERATURE,
+        "seed": DEFAULT_SEED,
+        "response_format": response_format_for(DEFAULT_MODEL),
+    }
 
-def call_openai_chat(system: str, user: str) -> str:
+
+def call_openai_chat(system: str, user: str, stream: bool = False, **options):
     """
-    Calls OpenAI's chat API with the given prompts.
+    Calls OpenAI's chat API with the given prompts. With `stream`, returns
+    an iterator over the response text as it is generated.
+    `options` (use_cache, accept) go to llm_client; by default only
+    responses that validate as they are get cached.
     """
-    response = openai.chat.completions.create(
-        model=DEFAULT_MODEL,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user}
-        ],
-        temperature=DEFAULT_TEMPERATURE,
-        seed=DEFAULT_SEED
-    )
-    return response.choices[0].message.content
+    send = chat_completion_stream if stream else chat_completion
+    return send(system, user, **{"accept": exam_response_ok, **options}, **chat_params())
 
 
 def parse_llm_response(content: str) -> Optional[dict]:
     """
-    Parses JSON response content safely.
+    Parses and validates the LLM output (see structured_output), with one
+    repair-only retry if it is malformed.
     """
-    if content.startswith("```"):
-        content = content.split("```")[1].strip()
+    return parse_exam_response(content)
 
-    try:
-        return json.loads(content)
-    except json.JSONDecodeError:
-        print("Error: Failed to parse JSON from LLM response.")
-        print("Raw response:", content)
-        return None
 
+def grade_single_request(questions: str, responses: str, rubric: Optional[str] = None,
+                         **options) -> Optional[dict]:
+    """
+    Grades everything it is given in one LLM request (`options` as for
+    call_openai_chat).
+    """
+    prompts = build_narrative_prompt(questions, responses, rubric)
+    raw_response = call_openai_chat(prompts["system"], prompts["user"], **options)
+    return parse_llm_response(raw_response)
 
-def grade_exam(questions: str, responses: str, rubric: Optional[str] = None) -> Optional[dict]:
+
+def grade_exam(questions: str, responses: str, rubric: Optional[str] = None,
+               per_question: bool = False) -> Optional[dict]:
     """
     Main grading function for narrative exams.
+    With `per_question`, each question is graded in its own concurrent request
+    (falling back to a single request if the exam can't be split).
+    """
+    if per_question:
+        result = grade_by_question(questions, responses, rubric, grade_single_request)
+        if result is not None:
+            return result
+    return grade_single_request(questions, responses, rubric)
+
+
+def grade_exam_stream(questions: str, responses: str,
+                      rubric: Optional[str] = None) -> Iterator[Tuple[str, Optional[dict]]]:
+    """
+    Streaming variant of grade_exam: yields `(question_N, entry)` as soon as
+    each question's grade has been generated, then `("result", result)` with
+    the complete, validated result.
     """
     prompts = build_narrative_prompt(questions, responses, rubric)
-    raw_response = call_openai_chat(prompts["system"], prompts["user"])
-    return parse_llm_response(raw_response)
+    yield from stream_exam_result(call_openai_chat(prompts["system"], prompts["user"], stream=True))
+
+
+def pack_submissions(questions: str, submissions: Dict[str, str], rubric: Optional[str] = None,
+                     pack_size: int = 4, token_budget: Optional[int] = PACK_TOKEN_BUDGET) -> List[List[str]]:
+    """
+    Groups submissions (key -> answers) into packs for grade_exams_packed,
+    sized for DEFAULT_MODEL's context window.
+    """
+    return plan_packs(questions, submissions, rubric, build_narrative_prompt, pack_size, DEFAULT_MODEL, token_budget)
+
+
+def grade_exams_packed(questions: str, submissions: Dict[str, str],
+                       rubric: Optional[str] = None) -> Dict[str, Optional[dict]]:
+    """
+    Grades a pack of submissions (key -> answers) in one request, so the
+    instructions, rubric and questions are sent once for all of them.
+    Submissions the packed response doesn't grade validly are graded alone.
+    """
+    return grade_pack(questions, submissions, rubric, build_narrative_prompt, call_openai_chat,
+                      grade_single_request)
@@ -0,0 +1,144 @@
+import os
+import re
+import sys
+from collections import Counter
+from typing import Callable, Dict, List, Optional
+
+from chunked_grading import split_into_questions
+from llm_backend import COMPLETION_TOKEN_ALLOWANCE, estimate_tokens
+from structured_output import QUESTION_KEY, model_info, parse_packed_response
+
+# Config
+# Optional cap on a pack's prompt tokens, below what the model's context allows
+PACK_TOKEN_BUDGET = int(os.getenv("PACK_TOKEN_BUDGET", 0)) or None
+# Completion tokens reserved per student for each question's grade and feedback
+PACK_TOKENS_PER_QUESTION = 200
+
+# Submissions in a packed prompt are labelled student_1..student_K rather
+# than by name or file, so the model never sees who wrote an answer.
+SUBMISSION_HEADING = "### {label}"
+SUBMISSION_LABEL = re.compile(r"^### (student_\d+)$", re.MULTILINE)
+
+PACKED_INSTRUCTIONS = """
+
+Several students' responses are included, each under its own "### student_N" heading.
+Grade each student independently, exactly as if their responses had been sent alone.
+Return one JSON object with one key per student ID, each holding that student's result in the format above:
+
+{"student_1": {"question_1": {...}, ..., "total_score": Z, "total_max_score": T}, "student_2": {...}, ...}
+"""
+
+
+def completion_allowance(questions: str) -> int:
+    """
+    Completion tokens reserved for one student's share of a packed response:
+    PACK_TOKENS_PER_QUESTION per question, and at least COMPLETION_TOKEN_ALLOWANCE.
+    """
+    _, sections = split_into_questions(questions)
+    return max(COMPLETION_TOKEN_ALLOWANCE, PACK_TOKENS_PER_QUESTION * len(sections))
+
+
+def plan_packs(questions: str, submissions: Dict[str, str], rubric: Optional[str],
+               build_prompt: Callable[[str, str, Optional[str]], dict], pack_size: int, model: str,
+               token_budget: Optional[int] = PACK_TOKEN_BUDGET) -> List[List[str]]:
+    """
+    Groups submissions, in order, into packs of at most `pack_size` that fit
+    `model`'s context window: the shared instructions, rubric and questions
+    counted once, plus every answer and completion_allowance() per student
+    for its share of the response. With `token_budget`, the prompt
+    is also kept within that many tokens. A submission too large to share a
+    request gets a pack of its own.
+    """
+    shared = packed_prompt(build_prompt, questions, [], rubric)
+    shared_tokens = estimate_tokens(shared["system"]) + estimate_tokens(shared["user"])
+    window = model_info(model)["context_window"]
+    allowance = completion_allowance(questions)
+
+    packs = []
+    current, tokens = [], shared_tokens
+    for key, answers in submissions.items():
+        size = estimate_tokens(answers)
+        completion = allowance * (len(current) + 1)
+        if current and (len(current) >= pack_size or tokens + size + completion > window
+                        or (token_budget and tokens + size > token_budget)):
+            packs.append(current)
+            current, tokens = [], shared_tokens
+        current.append(key)
+        tokens += size
+    if current:
+        packs.append(current)
+    return packs
+
+
+def packed_prompt(build_prompt: Callable[[str, str, Optional[str]], dict], questions: str,
+                  answers: List[str], rubric: Optional[str]) -> dict:
+    """
+    The agent's own prompt with every submission's answers, each under its
+    label, in place of a single student's. The rubric and questions prefix
+    is unchanged, so it still hits the provider's prompt cache.
+    """
+    responses = "\n\n".join(f"{SUBMISSION_HEADING.format(label=f'student_{i}')}\n{text}"
+                            for i, text in enumerate(answers, start=1))
+    prompts = build_prompt(questions, responses, rubric)
+    return {"system": prompts["system"] + PACKED_INSTRUCTIONS.rstrip(), "user": prompts["user"]}
+
+
+def _consistent(results: Dict[str, Optional[dict]]) -> Dict[str, Optional[dict]]:
+    """
+    Drops results graded against a different set of questions than the
+    rest of the pack, a sign that the model mixed students up.
+    """
+    question_sets = {label: frozenset(key for key in result if QUESTION_KEY.match(key))
+                     for label, result in results.items() if result is not None}
+    if len(set(question_sets.values())) <= 1:
+        return results
+    expected, _ = Counter(question_sets.values()).most_common(1)[0]
+    return {label: result if question_sets.get(label) == expected else None
+            for label, result in results.items()}
+
+
+def grade_pack(questions: str, submissions: Dict[str, str], rubric: Optional[str],
+               build_prompt: Callable[[str, str, Optional[str]], dict],
+               send: Callable[..., Optional[str]],
+               grade_one: Callable[[str, str, Optional[str]], Optional[dict]]) -> Dict[str, Optional[dict]]:
+    """
+    Grades several submissions in one request.
+
+    `build_prompt` and `send` are the agent's prompt builder and chat call
+    (taking an `accept` check for the response cache and `max_tokens`);
+    `grade_one(questions, answers, rubric)` is its single-submission grader.
+    The keyed response is validated per student, and any submission without
+    a valid result (missing, malformed, inconsistent with the pack, or the
+    whole request failing) is graded on its own.
+    """
+    keys = list(submissions)
+    if len(keys) == 1:
+        return {keys[0]: grade_one(questions, submissions[keys[0]], rubric)}
+
+    labels = [f"student_{i}" for i in range(1, len(keys) + 1)]
+    prompts = packed_prompt(build_prompt, questions, list(submissions.values()), rubric)
+
+    def accept(content: str) -> bool:
+        # Only a response that grades every student validly is worth caching
+        by_label = _consistent(parse_packed_response(content, labels, warn=False))
+        return all(result is not None for result in by_label.values())
+
+    try:
+        # The completion is capped at what plan_packs reserved for it
+        content = send(prompts["system"], prompts["user"], accept=accept,
+                       max_tokens=completion_allowance(questions) * len(keys))
+        by_label = _consistent(parse_packed_response(content, labels))
+    except Exception as e:
+        print(f"Warning: packed request failed ({type(e).__name__}: {e}); grading individually.", file=sys.stderr)
+        by_label = {label: None for label in labels}
+
+    results = {}
+    for key, label in zip(keys, labels):
+        result = by_label[label]
+        if result is None:
+            try:
+                result = grade_one(questions, submissions[key], rubric)
+            except Exception as e:
+                print(f"Error: grading {key} failed ({type(e).__name__}: {e}).", file=sys.stderr)
+        results[key] = result
+    return results
@@ -0,0 +1,30 @@
+from typing import Iterable, Optional, Tuple
+
+Section = Tuple[str, Optional[str]]
+
+
+def normalize_section(text: Optional[str]) -> str:
+    """
+    Canonical form of a prompt section: LF line endings, no trailing
+    whitespace on any line, no leading/trailing blank lines. The same
+    document loaded from a PDF, the cache or a text file renders identically.
+    """
+    if not text:
+        return ""
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def assemble_prompt(shared: Iterable[Section], per_submission: Iterable[Section]) -> str:
+    """
+    Builds a user prompt with every cohort-invariant section (rubric, questions)
+    first and the per-submission sections (student answers) last.
+
+    Provider-side prompt caching matches on the longest identical prefix, so
+    the shared part must be byte-for-byte stable across a cohort: sections are
+    normalized and joined with fixed separators, and nothing that varies per
+    student is allowed before them.
+    """
+    parts = [f"{heading}\n{normalize_section(body)}" for heading, body in shared]
+    parts += [f"{heading}\n{normalize_section(body)}" for heading, body in per_submission]
+    return "\n\n".join(parts)
@@ -0,0 +1,220 @@
+import os
+import re
+import time
+import random
+import threading
+from collections import deque
+from typing import Callable, Optional
+
+# Config (0 = no fixed limit; rely on the limits the API reports in its headers)
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", 0))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", 0))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 6))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", 120))
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def retryable_errors() -> tuple:
+    """
+    Errors worth retrying: throttling, timeouts, dropped connections and 5xx.
+    """
+    import openai
+
+    return (
+        openai.RateLimitError,
+        openai.APITimeoutError,
+        openai.APIConnectionError,
+        openai.InternalServerError,
+    )
+
+
+def parse_reset_duration(value: Optional[str]) -> Optional[float]:
+    """
+    Parses OpenAI's reset headers ("20ms", "1s", "6m0s") into seconds.
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    """
+    Continuously refilling bucket holding up to `rate_per_minute` units.
+    A rate of 0 means unlimited until the API reports a limit.
+    """
+
+    def __init__(self, rate_per_minute: float = 0):
+        self._lock = threading.Lock()
+        self.rate_per_minute = rate_per_minute
+        self._available = rate_per_minute
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if self.rate_per_minute:
+            elapsed = now - self._updated
+            self._available = min(self.rate_per_minute,
+                                  self._available + elapsed * self.rate_per_minute / 60)
+        self._updated = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """
+        Blocks until `amount` units are available and takes them.
+        Returns the number of seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self._blocked_until:
+                    delay = self._blocked_until - now
+                elif not self.rate_per_minute:
+                    return waited
+                else:
+                    # Requests larger than the whole bucket wait for a full bucket
+                    amount = min(amount, self.rate_per_minute)
+                    if self._available >= amount:
+                        self._available -= amount
+                        return waited
+                    delay = (amount - self._available) * 60 / self.rate_per_minute
+            time.sleep(delay)
+            waited += delay
+
+    def observe(self, limit: Optional[float], remaining: Optional[float], reset_seconds: Optional[float]) -> None:
+        """
+        Aligns the bucket with the rate-limit state reported by the API.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            # An unlimited bucket has no balance of its own to compare with
+            known = bool(self.rate_per_minute)
+            if limit:
+                self.rate_per_minute = limit
+            if remaining is not None:
+                if known:
+                    self._available = min(self._available, remaining)
+                else:
+                    self._available = min(remaining, self.rate_per_minute) if self.rate_per_minute else remaining
+                if remaining <= 0 and reset_seconds:
+                    self._blocked_until = max(self._blocked_until, time.monotonic() + reset_seconds)
+
+
+class RequestScheduler:
+    """
+    Shared gatekeeper for OpenAI calls.
+
+    Throttles requests and tokens per minute with token buckets (seeded from
+    config and updated from the API's x-ratelimit-* headers), applies a
+    per-request timeout, and retries throttling/transient errors with jittered
+    exponential backoff, honouring Retry-After. Per-call latencies are kept
+    for metrics().
+    """
+
+    def __init__(self, requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+                 max_retries: int = LLM_MAX_RETRIES, timeout: float = LLM_TIMEOUT_SECONDS):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=10000)
+        self._calls = 0
+        self._retries = 0
+        self._failures = 0
+        self._throttled_seconds = 0.0
+
+    def call(self, send: Callable[[float], object], estimated_tokens: int = 0):
+        """
+        Runs `send(timeout)`, which must perform one API request via
+        `with_raw_response` and return the raw response. Returns the parsed
+        response body.
+        """
+        retryable = retryable_errors()
+        attempt = 0
+        while True:
+            waited = self.requests.acquire(1) + self.tokens.acquire(estimated_tokens)
+            start = time.perf_counter()
+            try:
+                raw = send(self.timeout)
+            except retryable as e:
+                with self._lock:
+                    self._throttled_seconds += waited
+                if attempt >= self.max_retries:
+                    with self._lock:
+                        self._failures += 1
+                    raise
+                headers = getattr(getattr(e, "response", None), "headers", None)
+                if headers is not None:
+                    self._observe_headers(headers)
+                time.sleep(self._backoff(attempt, headers))
+                attempt += 1
+                with self._lock:
+                    self._retries += 1
+                continue
+            except Exception:
+                with self._lock:
+                    self._failures += 1
+                raise
+
+            latency = time.perf_counter() - start
+            self._observe_headers(raw.headers)
+            with self._lock:
+                self._calls += 1
+                self._throttled_seconds += waited
+                self._latencies.append(latency)
+            return raw.parse()
+
+    def _backoff(self, attempt: int, headers) -> float:
+        delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+        if headers is not None:
+            retry_after_ms = headers.get("retry-after-ms")
+            retry_after = headers.get("retry-after")
+            if retry_after_ms:
+                delay = max(delay, float(retry_after_ms) / 1000)
+            elif retry_after:
+                delay = max(delay, parse_reset_duration(retry_after) or 0)
+        return delay
+
+    def _observe_headers(self, headers) -> None:
+        for bucket, kind in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = headers.get(f"x-ratelimit-limit-{kind}")
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            bucket.observe(
+                float(limit) if limit else None,
+                float(remaining) if remaining else None,
+                parse_reset_duration(headers.get(f"x-ratelimit-reset-{kind}")),
+            )
+
+    def metrics(self) -> dict:
+        """
+        Call counts and latency percentiles (seconds) of successful requests.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+            metrics = {
+                "calls": self._calls,
+                "retries": self._retries,
+                "failures": self._failures,
+                "throttled_seconds": round(self._throttled_seconds, 3),
+            }
+        if latencies:
+            metrics.update({
+                "latency_p50": latencies[len(latencies) // 2],
+                "latency_p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "latency_max": latencies[-1],
+            })
+        return metrics
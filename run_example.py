@@ -1,16 +1,35 @@
 import os
+import sys
+import glob
 import argparse
 import json
+import hashlib
+import importlib
 from pathlib import Path
+from typing import Optional
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 
 from utils import extract_pdf_to_markdown
+from llm_cache import response_cache
+from llm_backend import get_backend
+from llm_client import usage_tracker
+from job_store import GRADED, JobStore
+from dedup import duplicate_clusters
+from instrumentation import span, tracer
 
-# Import agents
-from technical_agent.tech_grader_agent import grade_exam as grade_tech
-from narrative_agent.narrative_grader_agent import grade_exam as grade_narrative
-from vc_pitch_agent.vc_grader_agent import grade_pitch as grade_vc
+# Agents are imported on demand so a run only loads the one it uses
+AGENTS = {
+    "technical": ("technical_agent.tech_grader_agent", "grade_exam"),
+    "narrative": ("narrative_agent.narrative_grader_agent", "grade_exam"),
+    "vc": ("vc_pitch_agent.vc_grader_agent", "grade_pitch"),
+}
 
 
+def load_grader(agent_type: str, function_name: Optional[str] = None):
+    """Import the agent's module and return its grading function (or `function_name`)."""
+    module_name, default_name = AGENTS[agent_type]
+    return getattr(importlib.import_module(module_name), function_name or default_name)
+
 
 def load_text_file(file_path: Path) -> str:
     """Load plain text from .txt or .md file."""
@@ -35,34 +54,253 @@ def detect_input_type(file_path: Path) -> str:
         raise ValueError(f"Unsupported file type: {file_path}")
 
 
-def run_tech_or_narrative(agent_type: str, questions_file, answers_file, rubric_file=None):
+def load_document(file_path: Path) -> str:
+    """Load a PDF as markdown, or a .txt/.md file as plain text."""
+    return load_pdf_as_markdown(file_path) if file_path.suffix == ".pdf" else load_text_file(file_path)
+
+
+def run_tech_or_narrative(agent_type: str, questions_file, answers_file, rubric_file=None, per_question=False,
+                          stream=False):
     """Run either the tech or narrative grading agent."""
     # Load content
-    questions = load_pdf_as_markdown(questions_file) if questions_file.suffix == ".pdf" else load_text_file(questions_file)
-    answers = load_pdf_as_markdown(answers_file) if answers_file.suffix == ".pdf" else load_text_file(answers_file)
-    rubric = (
-        load_pdf_as_markdown(rubric_file)
-        if rubric_file and rubric_file.suffix == ".pdf"
-        else load_text_file(rubric_file) if rubric_file
-        else None
-    )
+    questions = load_document(questions_file)
+    answers = load_document(answers_file)
+    rubric = load_document(rubric_file) if rubric_file else None
 
+    if stream:
+        # One JSON line per question as it is graded, then the full result
+        for key, value in load_grader(agent_type, "grade_exam_stream")(questions, answers, rubric):
+            if key == "result":
+                print(json.dumps(value, indent=2))
+            else:
+                print(json.dumps({key: value}, ensure_ascii=False), flush=True)
+        return
 
     # Grade
-    if agent_type == "technical":
-        result = grade_tech(questions, answers, rubric)
-    else:
-        result = grade_narrative(questions, answers, rubric)
+    grade_exam = load_grader(agent_type)
+    with span("grade", agent=agent_type, file=Path(answers_file).name):
+        result = grade_exam(questions, answers, rubric, per_question=per_question)
 
     print(json.dumps(result, indent=2))
 
 
 def run_vc(audio_file):
     """Run VC agent with audio input."""
-    result = grade_vc(audio_file)
+    grade_pitch = load_grader("vc")
+    with span("grade", agent="vc", file=Path(audio_file).name):
+        result = grade_pitch(audio_file)
     print(json.dumps(result, indent=2))
 
 
+def collect_input_files(pattern: str, input_type: str) -> list:
+    """
+    Expands a directory or glob pattern into a sorted list of gradable files.
+    Files whose type doesn't match the agent's input type are skipped.
+    """
+    if os.path.isdir(pattern):
+        candidates = [p for p in Path(pattern).iterdir() if p.is_file()]
+    else:
+        candidates = [Path(p) for p in glob.glob(pattern, recursive=True)]
+
+    files = []
+    for path in sorted(candidates):
+        try:
+            file_type = detect_input_type(path)
+        except ValueError:
+            continue
+        if input_type == "audio":
+            if file_type == "audio":
+                files.append(path)
+        elif file_type in ("text", "pdf"):
+            files.append(path)
+    return files
+
+
+def run_batch(agent_type: str, input_files, questions_file=None, rubric_file=None,
+              concurrency: int = 4, output=None, per_question=False,
+              job_store: Optional[JobStore] = None, job_id: Optional[str] = None,
+              dedup_threshold: Optional[float] = None, pack_size: int = 1):
+    """
+    Grades a cohort of submissions concurrently against one questions/rubric pair.
+
+    Questions and rubric are loaded once. Submissions are graded on a thread pool
+    (the work is dominated by blocking LLM round-trips), and one JSONL line is
+    written per student as soon as its grade is available. Pitches go through
+    the VC agent's stage pipeline (grade_pitches), with `concurrency` chat
+    requests at a time.
+
+    With a `job_store`, each submission's progress and result are checkpointed
+    under `job_id`: re-running the same job skips graded submissions (their
+    stored results are emitted first) and reuses already-extracted answers.
+
+    With a `dedup_threshold` (technical/narrative only), every answer is
+    extracted first and near-duplicates are clustered (see dedup.py). Only
+    one submission per cluster is graded; members at least that similar to
+    it get a copy of its grade, marked with `duplicate_of`. The clusters are
+    reported in the summary as a plagiarism signal.
+
+    With a `pack_size` above 1 (technical/narrative only), answers are also
+    extracted first and graded up to `pack_size` per request (see
+    packed_grading.py), falling back to one request per submission for any
+    that the packed response doesn't grade validly.
+    """
+    def load_answers(path: Path) -> str:
+        if job_store is None:
+            return load_document(path)
+        record = job_store.get(job_id, str(path))
+        if record and record["markdown"] is not None:
+            return record["markdown"]
+        markdown = load_document(path)
+        job_store.mark_extracted(job_id, str(path), markdown)
+        return markdown
+
+    extracted = {}
+    packing = pack_size > 1 and agent_type != "vc"
+    if agent_type == "vc":
+        grade_pitches = load_grader(agent_type, "grade_pitches")
+    else:
+        grade_fn = load_grader(agent_type)
+        questions = load_document(questions_file)
+        rubric = load_document(rubric_file) if rubric_file else None
+
+        def answers_for(path: Path) -> str:
+            # Answers extracted up front are used once; a blank one is not extracted again
+            return extracted.pop(path) if path in extracted else load_answers(path)
+
+        def grade_one(path: Path):
+            with span("grade", agent=agent_type, file=path.name):
+                answers = answers_for(path)
+                return grade_fn(questions, answers, rubric, per_question=per_question)
+
+        if packing:
+            pack_submissions = load_grader(agent_type, "pack_submissions")
+            grade_packed = load_grader(agent_type, "grade_exams_packed")
+
+            def grade_pack(paths: list):
+                with span("grade.pack", agent=agent_type, submissions=len(paths)):
+                    results = grade_packed(questions, {str(path): answers_for(path) for path in paths}, rubric)
+                return [results[str(path)] for path in paths]
+
+    def grade_alone(path: Path) -> list:
+        return [grade_one(path)]
+
+    out = open(output, "w", encoding="utf-8") if output else sys.stdout
+
+    def emit(record: dict):
+        out.write(json.dumps(record, ensure_ascii=False) + "\n")
+        out.flush()
+
+    to_grade = list(input_files)
+    if job_store is not None:
+        job_store.add_submissions(job_id, [str(path) for path in input_files])
+        graded = job_store.submissions(job_id, [GRADED])
+        for record in graded:
+            emit({"student": record["student"], "file": record["file"], "result": record["result"],
+                  "resumed": True})
+        graded_files = {record["file"] for record in graded}
+        to_grade = [path for path in to_grade if str(path) not in graded_files]
+
+    def finish(path: Path, record: dict):
+        if job_store is not None:
+            if record.get("result") is not None:
+                job_store.mark_graded(job_id, str(path), record["result"])
+            else:
+                job_store.mark_failed(job_id, str(path), record.get("error", "Could not parse LLM response"))
+        emit(record)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    clusters = []
+    # representative file -> [(member path, similarity)] that reuse its grade
+    copies = {}
+    try:
+        if (dedup_threshold is not None or packing) and agent_type != "vc":
+            extracted.update(zip(to_grade, pool.map(load_answers, to_grade)))
+        if dedup_threshold is not None and agent_type != "vc":
+            with span("dedup", submissions=len(to_grade)) as stage:
+                paths = {str(path): path for path in to_grade}
+                clusters = duplicate_clusters({str(path): text for path, text in extracted.items()},
+                                              dedup_threshold)
+                for cluster in clusters:
+                    copies[cluster["representative"]] = [
+                        (paths[member["file"]], member["similarity"]) for member in cluster["members"]
+                        if member["similarity"] >= dedup_threshold]
+                reused = {str(path) for members in copies.values() for path, _ in members}
+                to_grade = [path for path in to_grade if str(path) not in reused]
+                stage.set(clusters=len(clusters), reused=len(reused))
+
+        if agent_type == "vc":
+            paths = {str(path): path for path in to_grade}
+            for file, result, error in grade_pitches(list(paths), grading_workers=max(1, concurrency)):
+                record = {"student": paths[file].stem, "file": file}
+                if error:
+                    record["error"] = error
+                else:
+                    record["result"] = result
+                finish(paths[file], record)
+
+        # Each future grades a list of submissions: a pack, or a single one
+        futures = {}
+        if packing:
+            packs = pack_submissions(questions, {str(path): extracted[path] for path in to_grade}, rubric, pack_size)
+            paths = {str(path): path for path in to_grade}
+            for pack in packs:
+                pack_paths = [paths[key] for key in pack]
+                futures[pool.submit(grade_pack, pack_paths)] = pack_paths
+        elif agent_type != "vc":
+            for path in to_grade:
+                futures[pool.submit(grade_alone, path)] = [path]
+
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                pack_paths = futures.pop(future)
+                try:
+                    results, error = future.result(), None
+                except Exception as e:
+                    results, error = [None] * len(pack_paths), f"{type(e).__name__}: {e}"
+
+                for path, result in zip(pack_paths, results):
+                    record = {"student": path.stem, "file": str(path)}
+                    if error:
+                        record["error"] = error
+                    else:
+                        record["result"] = result
+                    finish(path, record)
+
+                    for member, similarity in copies.pop(str(path), []):
+                        if result is None:
+                            # Nothing to reuse, so the duplicates are graded on their own
+                            futures[pool.submit(grade_alone, member)] = [member]
+                            continue
+                        finish(member, {"student": member.stem, "file": str(member), "result": result,
+                                        "duplicate_of": str(path), "similarity": similarity})
+    except KeyboardInterrupt:
+        # Queued submissions are dropped; anything not yet graded stays
+        # pending/extracted in the job store and is picked up on resume.
+        pool.shutdown(wait=False, cancel_futures=True)
+        if job_store is not None:
+            print(f"Interrupted. Resume with the same --job-db to continue job {job_id}.", file=sys.stderr)
+        raise
+    finally:
+        pool.shutdown(wait=True)
+        if output:
+            out.close()
+
+    summary = {"usage": usage_tracker.summary(), "response_cache": response_cache.stats(),
+               "requests": get_backend().metrics()}
+    if job_store is not None:
+        summary["job"] = {"job_id": job_id, **job_store.counts(job_id)}
+    if dedup_threshold is not None:
+        summary["duplicates"] = clusters
+    print(json.dumps(summary), file=sys.stderr)
+
+
+def default_job_id(agent_type: str, batch: str, questions_file=None, rubric_file=None) -> str:
+    """Stable job id for a cohort run, so re-running the same command resumes it."""
+    key = json.dumps([agent_type, batch, str(questions_file), str(rubric_file)])
+    return f"{agent_type}-{hashlib.sha256(key.encode()).hexdigest()[:12]}"
+
+
 def main():
     parser = argparse.ArgumentParser(description="Universal Exam Agent Tester")
     parser.add_argument("--agent", required=True, choices=["technical", "narrative", "vc"],
@@ -71,17 +309,69 @@ def main():
     parser.add_argument("--answers", type=Path, help="Path to student answers (text)")
     parser.add_argument("--rubric", type=Path, help="Path to rubric (PDF or text)")
     parser.add_argument("--audio", type=Path, help="Path to VC pitch audio file (mp3/wav)")
+    parser.add_argument("--per-question", action="store_true",
+                        help="Grade each question in its own concurrent request (technical/narrative)")
+    parser.add_argument("--stream", action="store_true",
+                        help="Print each question's grade as soon as it is generated (technical/narrative)")
+    parser.add_argument("--batch", help="Directory or glob of answer files (or audio files for vc) to grade as a cohort")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="Maximum number of submissions graded at once in batch mode")
+    parser.add_argument("--output", type=Path, help="Write batch results as JSONL to this file (default: stdout)")
+    parser.add_argument("--job-db", type=Path,
+                        help="SQLite job store for checkpointing batch runs; re-running resumes the job")
+    parser.add_argument("--job-id", help="Name of the batch job in --job-db (default: derived from the inputs)")
+    parser.add_argument("--dedup-threshold", type=float,
+                        help="In batch mode, reuse one grade for answers at least this similar (0-1 Jaccard "
+                             "similarity of word shingles) and report the duplicate clusters")
+    parser.add_argument("--pack", type=int, default=1,
+                        help="In batch mode, grade up to this many technical/narrative submissions per request "
+                             "(as many as fit the agent model's context window, see packed_grading.py)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Print per-stage timing, CPU, memory, token and cache statistics to stderr")
+    parser.add_argument("--trace", type=Path, help="Append one JSON line per pipeline stage to this file")
 
     args = parser.parse_args()
+    if args.stream and (args.per_question or args.batch):
+        parser.error("--stream grades a single submission in one request; "
+                     "it can't be combined with --per-question or --batch")
+    if args.profile or args.trace:
+        tracer.enable(str(args.trace) if args.trace else None)
 
-    if args.agent == "vc":
+    if args.batch:
+        input_type = "audio" if args.agent == "vc" else "text"
+        if input_type == "text" and not args.questions:
+            raise ValueError("Batch grading with the technical/narrative agents requires --questions")
+        if args.pack > 1 and args.per_question:
+            raise ValueError("--pack grades whole submissions and can't be combined with --per-question")
+        input_files = collect_input_files(args.batch, input_type)
+        if not input_files:
+            raise ValueError(f"No gradable files found for --batch {args.batch}")
+        job_store = JobStore(str(args.job_db)) if args.job_db else None
+        job_id = None
+        if job_store is not None:
+            job_id = args.job_id or default_job_id(args.agent, args.batch, args.questions, args.rubric)
+            job_store.create_job(job_id, args.agent, {
+                "batch": args.batch,
+                "questions": str(args.questions),
+                "rubric": str(args.rubric),
+                "per_question": args.per_question,
+                "dedup_threshold": args.dedup_threshold,
+                "pack": args.pack,
+            })
+        run_batch(args.agent, input_files, args.questions, args.rubric, args.concurrency, args.output,
+                  args.per_question, job_store, job_id, args.dedup_threshold, args.pack)
+    elif args.agent == "vc":
         if not args.audio:
             raise ValueError("VC agent requires --audio")
         run_vc(args.audio)
     else:
         if not args.questions or not args.answers:
             raise ValueError("Technical/Narrative agents require --questions and --answers")
-        run_tech_or_narrative(args.agent, args.questions, args.answers, args.rubric)
+        run_tech_or_narrative(args.agent, args.questions, args.answers, args.rubric, args.per_question,
+                              args.stream)
+
+    if args.profile:
+        print(tracer.format_summary(), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,411 @@
+import os
+import re
+import sys
+import json
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+from instrumentation import span
+from llm_client import chat_completion
+
+# Config
+# "auto" picks the strongest response_format the model supports; "off" sends
+# none (for OpenAI-compatible servers that reject the parameter)
+LLM_RESPONSE_FORMAT = os.getenv("LLM_RESPONSE_FORMAT", "auto")
+LLM_REPAIR_MODEL = os.getenv("LLM_REPAIR_MODEL", "gpt-4o-mini")
+
+# What each model family supports, by name prefix (the longest matching
+# prefix wins): the strongest response_format it accepts and its context
+# window in tokens (prompt plus completion). Unknown models get neither
+# format and the smallest window.
+MODELS = {
+    "gpt-5": {"response_format": "json_schema", "context_window": 400000},
+    "gpt-4.1": {"response_format": "json_schema", "context_window": 1047576},
+    "gpt-4o": {"response_format": "json_schema", "context_window": 128000},
+    "o3": {"response_format": "json_schema", "context_window": 200000},
+    "o4": {"response_format": "json_schema", "context_window": 200000},
+    "gpt-4-turbo": {"response_format": "json_object", "context_window": 128000},
+    "gpt-4-1106": {"response_format": "json_object", "context_window": 128000},
+    "gpt-4-0125": {"response_format": "json_object", "context_window": 128000},
+    "gpt-4-32k": {"response_format": None, "context_window": 32768},
+    "gpt-4": {"response_format": None, "context_window": 8192},
+    "gpt-3.5-turbo": {"response_format": "json_object", "context_window": 16385},
+}
+UNKNOWN_MODEL = {"response_format": None, "context_window": 8192}
+
+# Totals are compared with this tolerance (scores may be halves or tenths)
+TOTAL_TOLERANCE = 1e-6
+
+Score = Union[int, float]
+
+QUESTION_KEY = re.compile(r"^question_\d+$")
+
+
+class QuestionGrade(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
+    score: Score
+    max_score: Score
+    feedback: str = ""
+
+
+class PitchGrade(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+
+    Problem: Score = Field(ge=1, le=10)
+    Market: Score = Field(ge=1, le=10)
+    Solution: Score = Field(ge=1, le=10)
+    Delivery: Score = Field(ge=1, le=10)
+    Feedback: str
+
+
+# Strict structured-output schema for the VC score card. Exam results have
+# one key per question, which strict schemas can't express, so exams use
+# json_object mode and are validated here instead.
+PITCH_JSON_SCHEMA = {
+    "name": "pitch_grade",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "Problem": {"type": "integer"},
+            "Market": {"type": "integer"},
+            "Solution": {"type": "integer"},
+            "Delivery": {"type": "integer"},
+            "Feedback": {"type": "string"},
+        },
+        "required": ["Problem", "Market", "Solution", "Delivery", "Feedback"],
+        "additionalProperties": False,
+    },
+}
+
+
+class ResultError(ValueError):
+    """
+    A model response that could not be parsed or failed validation.
+    """
+
+
+def model_info(model: str) -> dict:
+    """
+    The MODELS entry for `model`.
+    """
+    matches = [prefix for prefix in MODELS if model.startswith(prefix)]
+    return MODELS[max(matches, key=len)] if matches else UNKNOWN_MODEL
+
+
+def response_format_for(model: str, json_schema: Optional[dict] = None) -> Optional[dict]:
+    """
+    The response_format to request from `model`: a strict JSON schema when
+    one is given and the model supports it, otherwise JSON mode, or None for
+    models that support neither.
+    """
+    if LLM_RESPONSE_FORMAT == "off":
+        return None
+    supported = model_info(model)["response_format"] if LLM_RESPONSE_FORMAT == "auto" else LLM_RESPONSE_FORMAT
+    if json_schema and supported == "json_schema":
+        return {"type": "json_schema", "json_schema": json_schema}
+    if supported in ("json_schema", "json_object"):
+        return {"type": "json_object"}
+    return None
+
+
+def strip_fences(content: str) -> str:
+    """
+    Drops a markdown code fence wrapping the whole response and any prose
+    around the outermost JSON object. Fences inside the JSON (e.g. code in
+    the feedback) are left alone.
+    """
+    content = content.strip()
+    fenced = re.match(r"^```(?:json)?\s*(.*?)\s*(?:```)?$", content, re.DOTALL)
+    if fenced:
+        content = fenced.group(1)
+    start = content.find("{")
+    end = content.rfind("}")
+    if start == -1:
+        return content
+    return content[start:end + 1] if end > start else content[start:]
+
+
+def _commas(text: str) -> List[int]:
+    """
+    Positions of the commas in JSON-ish text that are outside strings.
+    """
+    commas = []
+    in_string = False
+    escape = False
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+            continue
+        if ch == '"':
+            in_string = True
+        elif ch == ",":
+            commas.append(i)
+    return commas
+
+
+def _without_trailing_commas(text: str) -> str:
+    chars = list(text)
+    for i in _commas(text):
+        rest = text[i + 1:].lstrip()
+        if rest[:1] in ("}", "]"):
+            chars[i] = ""
+    return "".join(chars)
+
+
+def loads_lenient(content: str):
+    """
+    Parses a complete model response as JSON, tolerating code fences,
+    surrounding prose, raw newlines inside strings and trailing commas.
+    Raises ResultError if it still isn't JSON.
+    """
+    content = content or ""
+    try:
+        return json.loads(content, strict=False)
+    except json.JSONDecodeError:
+        pass
+    text = strip_fences(content)
+    for candidate in (text, _without_trailing_commas(text)):
+        try:
+            return json.loads(candidate, strict=False)
+        except json.JSONDecodeError as e:
+            error = e
+    raise ResultError(f"Invalid JSON: {error}")
+
+
+class QuestionStreamParser:
+    """
+    Incremental parser for a grading result arriving in pieces. `feed`
+    returns the `(question_N, entry)` pairs whose objects closed in that
+    piece, each validated like a question of a complete result. Anything
+    before the opening brace (such as a code fence) is skipped.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None
+        self._key = None
+        self._object_start = None
+
+    def feed(self, delta: str) -> List[Tuple[str, dict]]:
+        self.text += delta
+        closed = []
+        text = self.text
+        for i in range(self._position, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start:i + 1]
+                continue
+            if ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch == ":" and self._depth == 1:
+                # An unquoted key leaves no string to read; the complete
+                # response is still parsed (or repaired) at the end
+                self._key = json.loads(self._last_string, strict=False) if self._last_string else None
+                self._last_string = None
+            elif ch in "{[":
+                self._depth += 1
+                if self._depth == 2:
+                    self._object_start = i
+            elif ch in "}]" and self._depth:
+                self._depth -= 1
+                if self._depth == 1 and self._key and QUESTION_KEY.match(self._key):
+                    entry = self._question(text[self._object_start:i + 1])
+                    if entry is not None:
+                        closed.append((self._key, entry))
+        self._position = len(text)
+        return closed
+
+    @staticmethod
+    def _question(fragment: str) -> Optional[dict]:
+        try:
+            return QuestionGrade.model_validate(json.loads(fragment, strict=False)).model_dump()
+        except (json.JSONDecodeError, ValidationError):
+            return None
+
+
+def stream_exam_result(deltas: Iterable[str], repair: bool = True) -> Iterator[Tuple[str, Optional[dict]]]:
+    """
+    Consumes a streamed grading response. Yields `(question_N, entry)` as
+    soon as each question's object is complete, then `("result", result)`
+    with the full validated result (None if it couldn't be parsed, see
+    parse_exam_response).
+    """
+    parser = QuestionStreamParser()
+    for delta in deltas:
+        yield from parser.feed(delta)
+    yield "result", parse_exam_response(parser.text, repair)
+
+
+def validate_exam_result(data) -> dict:
+    """
+    Checks a grading result: every question_N entry has a numeric score,
+    max_score and feedback, and total_score / total_max_score equal the sums
+    of the question scores. Totals that don't add up fail like any other
+    error: the model may have mis-scored a question rather than mis-added.
+    """
+    if not isinstance(data, dict):
+        raise ResultError("Expected a JSON object")
+    questions = {key: value for key, value in data.items() if QUESTION_KEY.match(key)}
+    if not questions:
+        raise ResultError("No question_N entries in the result")
+
+    result = {}
+    try:
+        for key, value in data.items():
+            if key in questions:
+                result[key] = QuestionGrade.model_validate(value).model_dump()
+            elif key not in ("total_score", "total_max_score"):
+                result[key] = value
+    except ValidationError as e:
+        raise ResultError(f"Invalid question entry {key}: {e.errors()[0]['msg']}")
+
+    for total_key, field in (("total_score", "score"), ("total_max_score", "max_score")):
+        expected = sum(result[key][field] for key in questions)
+        reported = data.get(total_key)
+        if not isinstance(reported, (int, float)) or isinstance(reported, bool):
+            raise ResultError(f"Missing or non-numeric {total_key}")
+        if abs(reported - expected) > TOTAL_TOLERANCE:
+            raise ResultError(f"{total_key} {reported} != sum of the questions' {field}s {expected}")
+        result[total_key] = reported
+    return result
+
+
+def validate_pitch_result(data) -> dict:
+    """
+    Checks a VC score card: four 1-10 scores and a feedback string.
+    """
+    try:
+        return PitchGrade.model_validate(data).model_dump()
+    except ValidationError as e:
+        error = e.errors()[0]
+        raise ResultError(f"Invalid score card field {error['loc']}: {error['msg']}")
+
+
+def response_ok(content: Optional[str], validate: Callable[[object], dict]) -> bool:
+    """
+    Whether a response is valid as it stands (no repair needed); only such
+    responses are stored in the response cache.
+    """
+    try:
+        validate(loads_lenient(content or ""))
+    except ResultError:
+        return False
+    return True
+
+
+def exam_response_ok(content: Optional[str]) -> bool:
+    return response_ok(content, validate_exam_result)
+
+
+def pitch_response_ok(content: Optional[str]) -> bool:
+    return response_ok(content, validate_pitch_result)
+
+
+def repair_json(content: str, error: str, expected: str,
+                accept: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+    """
+    Asks a small model to fix only the formatting of a malformed response.
+    The prompt carries just the broken output, never the exam or transcript,
+    so it costs a fraction of re-running the grading call. Like any other
+    response, the repair is only cached if `accept` passes it.
+    """
+    system = (
+        "You repair malformed JSON produced by another model. Return only the corrected JSON object. "
+        "Keep every score and feedback exactly as given; only fix syntax, structure and any total "
+        "that doesn't equal the sum of its parts."
+    )
+    user = f"Expected format: {expected}\nProblem: {error}\n\nMalformed output:\n{content}"
+    return chat_completion(system, user, model=LLM_REPAIR_MODEL, temperature=0, accept=accept,
+                           response_format=response_format_for(LLM_REPAIR_MODEL) or {"type": "json_object"})
+
+
+def parse_result(content: Optional[str], validate: Callable[[object], dict], expected: str,
+                 repair: bool = True) -> Optional[dict]:
+    """
+    Parses and validates a model response. A response that fails gets one
+    repair-only retry (see repair_json) before giving up with None.
+    """
+    if content is None:
+        print("Error: The LLM returned no content.", file=sys.stderr)
+        return None
+    with span("llm.parse", chars=len(content)) as stage:
+        try:
+            return validate(loads_lenient(content))
+        except ResultError as e:
+            error = str(e)
+        stage.set(invalid=error)
+    if repair:
+        with span("llm.repair") as stage:
+            try:
+                repaired = repair_json(content, error, expected, accept=lambda fixed: response_ok(fixed, validate))
+                return validate(loads_lenient(repaired))
+            except ResultError as e:
+                error = f"{error}; after repair: {e}"
+                stage.set(error=error)
+    print(f"Error: Could not parse LLM response ({error}).", file=sys.stderr)
+    print("Raw response:", content, file=sys.stderr)
+    return None
+
+
+EXAM_FORMAT_HINT = ('{"question_1": {"score": number, "max_score": number, "feedback": string}, ..., '
+                    '"total_score": number, "total_max_score": number}')
+PITCH_FORMAT_HINT = ('{"Problem": 1-10, "Market": 1-10, "Solution": 1-10, "Delivery": 1-10, '
+                     '"Feedback": string}')
+
+
+def parse_exam_response(content: Optional[str], repair: bool = True) -> Optional[dict]:
+    return parse_result(content, validate_exam_result, EXAM_FORMAT_HINT, repair)
+
+
+def parse_pitch_response(content: Optional[str], repair: bool = True) -> Optional[dict]:
+    return parse_result(content, validate_pitch_result, PITCH_FORMAT_HINT, repair)
+
+
+def parse_packed_response(content: Optional[str], labels: Iterable[str],
+                          warn: bool = True) -> Dict[str, Optional[dict]]:
+    """
+    Parses a response grading several submissions at once: one exam result
+    per label, each validated like a single result. Labels that are missing
+    or invalid map to None; there is no repair call, the caller grades those
+    submissions on their own instead.
+    """
+    labels = list(labels)
+    try:
+        data = loads_lenient(content or "")
+    except ResultError as e:
+        if warn:
+            print(f"Warning: packed response is not JSON ({e}).", file=sys.stderr)
+        return {label: None for label in labels}
+    if not isinstance(data, dict):
+        return {label: None for label in labels}
+
+    results = {}
+    for label in labels:
+        try:
+            results[label] = validate_exam_result(data.get(label))
+        except ResultError as e:
+            if warn:
+                print(f"Warning: packed result for {label} is invalid ({e}).", file=sys.stderr)
+            results[label] = None
+    return results
@@ -1,15 +1,10 @@
-import os
-import json
-from typing import Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 
-import openai
-from dotenv import load_dotenv
-
-# Load API key from environment
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-assert api_key, "Missing OPENAI_API_KEY in environment"
-openai.api_key = api_key
+from llm_client import chat_completion, chat_completion_stream
+from structured_output import exam_response_ok, parse_exam_response, response_format_for, stream_exam_result
+from chunked_grading import grade_by_question
+from packed_grading import PACK_TOKEN_BUDGET, grade_pack, plan_packs
+from prompt_layout import assemble_prompt
 
 # Default config
 # DEFAULT_MODEL = "gpt-4o-mini"
@@ -67,16 +62,15 @@ Where:
 Use only numeric values for all scores.
 """.strip()
 
-    user_prompt = f"""
-### Rubric (if available):
-{rubric or "No rubric provided."}
-
-### Exam Questions:
-{questions}
-
-### Student Answers:
-{answers}
-""".strip()
+    # Rubric and questions form a stable prefix shared by the whole cohort;
+    # the student's answers always come last.
+    user_prompt = assemble_prompt(
+        shared=[
+            ("### Rubric (if available):", rubric or "No rubric provided."),
+            ("### Exam Questions:", questions),
+        ],
+        per_submission=[("### Student Answers:", answers)],
+    )
 
     return {
         "system": system_prompt,
@@ -84,43 +78,91 @@ Use only numeric values for all scores.
     }
 
 
-def call_openai_chat(system: str, user: str) -> str:
+def chat_params() -> dict:
     """
-    Sends a message to OpenAI's chat completion API.
+    Model and sampling parameters of every grading request (also used to
+    build Batch API requests, see batch_api).
     """
-    response = openai.chat.completions.create(
-        model=DEFAULT_MODEL,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user}
-        ],
-        temperature=DEFAULT_TEMPERATURE,
-        top_p=1,
-        presence_penalty=0,
-        frequency_penalty=0,
-    )
-    return response.choices[0].message.content
+    return {
+        "model": DEFAULT_MODEL,
+        "temperature": DEFAULT_TEMPERATURE,
+        "top_p": 1,
+        "presence_penalty": 0,
+        "frequency_penalty": 0,
+        "response_format": response_format_for(DEFAULT_MODEL),
+    }
+
+
+def call_openai_chat(system: str, user: str, stream: bool = False, **options):
+    """
+    Sends a message to OpenAI's chat completion API. With `stream`, returns
+    an iterator over the response text as it is generated.
+    `options` (use_cache, accept) go to llm_client; by default only
+    responses that validate as they are get cached.
+    """
+    send = chat_completion_stream if stream else chat_completion
+    return send(system, user, **{"accept": exam_response_ok, **options}, **chat_params())
 
 
 def parse_llm_response(content: str) -> Optional[dict]:
     """
-    Attempts to parse the LLM output into a JSON object.
+    Parses and validates the LLM output (see structured_output), with one
+    repair-only retry if it is malformed.
     """
-    if content.startswith("```"):
-        content = content.split("```")[1].strip()
+    return parse_exam_response(content)
 
-    try:
-        return json.loads(content)
-    except json.JSONDecodeError:
-        print("Error: Could not parse JSON from LLM response.")
-        print("Raw response:", content)
-        return None
+
+def grade_single_request(questions_markdown: str, answers_text: str, rubric_markdown: Optional[str] = None,
+                         **options) -> Optional[dict]:
+    """
+    Grades everything it is given in one LLM request (`options` as for
+    call_openai_chat).
+    """
+    prompts = build_tech_grading_prompt(questions_markdown, answers_text, rubric_markdown)
+    raw_response = call_openai_chat(prompts["system"], prompts["user"], **options)
+    return parse_llm_response(raw_response)
 
 
-def grade_exam(questions_markdown: str, answers_text: str, rubric_markdown: Optional[str] = None) -> Optional[dict]:
+def grade_exam(questions_markdown: str, answers_text: str, rubric_markdown: Optional[str] = None,
+               per_question: bool = False) -> Optional[dict]:
     """
     Main grading function. Sends prompts to the LLM and parses the result.
+    With `per_question`, each question is graded in its own concurrent request
+    (falling back to a single request if the exam can't be split).
+    """
+    if per_question:
+        result = grade_by_question(questions_markdown, answers_text, rubric_markdown, grade_single_request)
+        if result is not None:
+            return result
+    return grade_single_request(questions_markdown, answers_text, rubric_markdown)
+
+
+def grade_exam_stream(questions_markdown: str, answers_text: str,
+                      rubric_markdown: Optional[str] = None) -> Iterator[Tuple[str, Optional[dict]]]:
+    """
+    Streaming variant of grade_exam: yields `(question_N, entry)` as soon as
+    each question's grade has been generated, then `("result", result)` with
+    the complete, validated result.
     """
     prompts = build_tech_grading_prompt(questions_markdown, answers_text, rubric_markdown)
-    raw_response = call_openai_chat(prompts["system"], prompts["user"])
-    return parse_llm_response(raw_response)
+    yield from stream_exam_result(call_openai_chat(prompts["system"], prompts["user"], stream=True))
+
+
+def pack_submissions(questions_markdown: str, submissions: Dict[str, str], rubric_markdown: Optional[str] = None,
+                     pack_size: int = 4, token_budget: Optional[int] = PACK_TOKEN_BUDGET) -> List[List[str]]:
+    """
+    Groups submissions (key -> answers) into packs for grade_exams_packed,
+    sized for DEFAULT_MODEL's context window.
+    """
+    return plan_packs(questions_markdown, submissions, rubric_markdown, build_tech_grading_prompt, pack_size, DEFAULT_MODEL, token_budget)
+
+
+def grade_exams_packed(questions_markdown: str, submissions: Dict[str, str],
+                       rubric_markdown: Optional[str] = None) -> Dict[str, Optional[dict]]:
+    """
+    Grades a pack of submissions (key -> answers) in one request, so the
+    instructions, rubric and questions are sent once for all of them.
+    Submissions the packed response doesn't grade validly are graded alone.
+    """
+    return grade_pack(questions_markdown, submissions, rubric_markdown, build_tech_grading_prompt, call_openai_chat,
+                      grade_single_request)
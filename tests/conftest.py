@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The modules live at the repository root, next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Offline, and never touching the user's caches
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ["EXAMINER_CACHE_DIR"] = tempfile.mkdtemp(prefix="examiner-tests-")
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+import batch_api
+from batch_api import LocalBatchRunner, collect_batch, map_results, submit_batch
+from fake_openai_server import start_fake_server
+from llm_backend import OpenAICompatibleBackend, get_backend, set_backend
+from llm_cache import ResponseCache
+
+VALID = json.dumps({"question_1": {"score": 1, "max_score": 2, "feedback": "ok"},
+                    "total_score": 1, "total_max_score": 2})
+
+
+@pytest.fixture
+def cohort(tmp_path):
+    answers = tmp_path / "answers"
+    answers.mkdir()
+    for i in range(6):
+        (answers / f"student{i}.md").write_text(f"## Question 1\nAnswer number {i}.", encoding="utf-8")
+    questions = tmp_path / "questions.md"
+    questions.write_text("## Question 1\nExplain recursion.", encoding="utf-8")
+    return answers, questions
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    monkeypatch.setattr(batch_api, "response_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def slow_backend():
+    server = start_fake_server(latency=0.2)
+    backend = OpenAICompatibleBackend(server.base_url)
+    # Opens the client up front so the completion window only times requests
+    backend.client()
+    previous = get_backend()
+    set_backend(backend)
+    yield
+    set_backend(previous)
+    server.shutdown()
+    server.server_close()
+
+
+def test_local_batch_round_trip(tmp_path, cohort):
+    answers, questions = cohort
+    runner = LocalBatchRunner(workers=2)
+    manifest = submit_batch("narrative", str(answers), tmp_path / "batch", questions, runner=runner)
+    assert len(manifest["submissions"]) == 6
+
+    records = collect_batch(tmp_path / "batch", output=tmp_path / "out.jsonl", runner=runner, poll_seconds=0.05)
+    assert sorted(record["student"] for record in records) == [f"student{i}" for i in range(6)]
+    assert all(record["result"]["question_1"]["max_score"] for record in records)
+    assert len((tmp_path / "out.jsonl").read_text(encoding="utf-8").splitlines()) == 6
+
+
+def test_expired_batch_keeps_finished_results(tmp_path, cohort, cache, slow_backend):
+    answers, questions = cohort
+    runner = LocalBatchRunner(workers=1, completion_window=0.5)
+    submit_batch("narrative", str(answers), tmp_path / "batch", questions, runner=runner)
+
+    records = collect_batch(tmp_path / "batch", runner=runner, poll_seconds=0.05)
+    graded = [record for record in records if "result" in record]
+    missing = [record for record in records if record.get("error") == "No result in the batch output (batch expired)"]
+    assert graded and missing
+    assert len(graded) + len(missing) == 6
+    # The finished responses validate, so they (and only they) warm the cache
+    assert cache.stats()["entries"] == len(graded)
+
+
+def test_only_valid_responses_are_cached(cache):
+    def line(custom_id, content):
+        return {"custom_id": custom_id, "error": None,
+                "response": {"status_code": 200, "body": {"choices": [{"message": {"content": content}}]}}}
+
+    def request(custom_id):
+        return {"custom_id": custom_id, "body": {"model": "gpt-4o-mini", "temperature": 0,
+                                                 "messages": [{"role": "user", "content": custom_id}]}}
+
+    manifest = {"submissions": {"good": "good.md", "bad": "bad.md"}}
+    records = map_results("narrative", manifest, [request("good"), request("bad")],
+                          [line("good", VALID), line("bad", "not json")], cache_responses=True)
+    assert "result" in records[0]
+    assert cache.stats()["entries"] == 1
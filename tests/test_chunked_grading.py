@@ -0,0 +1,57 @@
+from chunked_grading import grade_by_question, split_into_questions
+
+QUESTIONS = "Final exam\n\nQuestion 1\nWhat?\n\nQuestion 2\nWhy?"
+ANSWERS = "Question 1\nThis.\n\nQuestion 2\nBecause."
+
+
+def unit_result(question, score=3):
+    number = 1 if "Question 1" in question else 2
+    return {f"question_{number}": {"score": score, "max_score": 5, "feedback": "ok"}}
+
+
+def test_split_into_questions():
+    text = "Final exam\n\n## Question 1\nWhat?\n\n**Question 2**\nWhy?\n\nEjercicio 3\nHow?"
+    preamble, sections = split_into_questions(text)
+    assert preamble == "Final exam"
+    assert sections == {1: "## Question 1\nWhat?", 2: "**Question 2**\nWhy?", 3: "Ejercicio 3\nHow?"}
+
+
+def test_split_into_questions_merges_continuations():
+    _, sections = split_into_questions("Question 1\na\n\nQuestion 2\nb\n\nQuestion 1 (continued)\nc")
+    assert list(sections) == [1, 2]
+    assert sections[1] == "Question 1\na\n\nQuestion 1 (continued)\nc"
+
+
+def test_split_into_questions_without_headings():
+    assert split_into_questions("  Just an essay.  ") == ("Just an essay.", {})
+
+
+def test_questions_are_graded_separately_and_totalled():
+    graded = []
+
+    def grade_unit(question, answer, rubric, **options):
+        graded.append(answer)
+        return unit_result(question)
+
+    result = grade_by_question(QUESTIONS, ANSWERS, None, grade_unit)
+    assert sorted(graded) == ["Question 1\nThis.", "Question 2\nBecause."]
+    assert (result["total_score"], result["total_max_score"]) == (6, 10)
+
+
+def test_failed_questions_are_retried_uncached():
+    calls = []
+
+    def grade_unit(question, answer, rubric, **options):
+        calls.append(options)
+        if "Question 2" in question and options.get("use_cache", True):
+            return None
+        return unit_result(question)
+
+    result = grade_by_question(QUESTIONS, ANSWERS, None, grade_unit)
+    assert result["question_2"]["score"] == 3
+    assert calls.count({"use_cache": False}) == 1
+
+
+def test_a_question_that_keeps_failing_fails_the_exam():
+    assert grade_by_question(QUESTIONS, ANSWERS, None, lambda question, *args, **options: (
+        None if "Question 2" in question else unit_result(question))) is None
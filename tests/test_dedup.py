@@ -0,0 +1,30 @@
+from dedup import NearDuplicateIndex, duplicate_clusters
+
+ANSWER = ("A hash table stores keys in buckets chosen by a hash function, so lookups take constant "
+          "time on average. Collisions are resolved by chaining or open addressing, and the table "
+          "is resized when the load factor grows too large.")
+OTHER = ("Binary search halves the sorted range at every step by comparing the middle element with "
+         "the target, which gives logarithmic running time but requires random access to the data.")
+
+
+def test_index_finds_near_duplicates():
+    index = NearDuplicateIndex(threshold=0.8)
+    assert index.add("a", ANSWER) == []
+    assert index.add("b", OTHER) == []
+    matches = index.add("c", ANSWER.replace("constant", "Constant").replace(".", "!") + " Thanks.")
+    assert [key for key, _ in matches] == ["a"]
+    assert matches[0][1] >= 0.8
+    assert index.clusters() == [["a", "c"]]
+    assert index.similarity("a", "b") < 0.1
+
+
+def test_page_markers_are_ignored():
+    index = NearDuplicateIndex(threshold=0.99)
+    index.add("a", ANSWER)
+    assert index.add("b", f"## Page 1\n{ANSWER}") == [("a", 1.0)]
+
+
+def test_short_and_blank_answers_are_not_clustered():
+    texts = {"blank_1": "", "blank_2": "  \n## Page 1\n", "short_1": "True", "short_2": "True",
+             "a": ANSWER, "b": ANSWER}
+    assert duplicate_clusters(texts) == [{"representative": "a", "members": [{"file": "b", "similarity": 1.0}]}]
@@ -0,0 +1,53 @@
+import pytest
+
+from grading_server import DONE, FAILED, GradingService
+
+QUESTIONS = "## Question 1\nExplain recursion."
+
+
+@pytest.fixture
+def service():
+    service = GradingService(workers=2, extract_workers=1, max_jobs=2)
+    yield service
+    service.shutdown()
+
+
+def submission(job_id=None, answers="A function calling itself."):
+    payload = {"questions": QUESTIONS, "answers": answers}
+    if job_id:
+        payload["id"] = job_id
+    return payload
+
+
+def test_submit_and_get(service):
+    job_id = service.submit("technical", submission("one"))
+    assert job_id == "one"
+    job = service.get(job_id, wait=10)
+    assert job["status"] == DONE
+    assert job["result"]["question_1"]["max_score"] == 10
+    assert service.get("missing") is None
+
+
+def test_invalid_submissions_are_rejected(service, tmp_path):
+    service.submit("technical", submission("one"))
+    for agent, payload in [("technical", submission("one")),
+                           ("technical", {"questions": QUESTIONS}),
+                           ("technical", {**submission(), "rubric_file": str(tmp_path / "missing.md")}),
+                           ("technical", {**submission(), "id": 7}),
+                           ("vc", {}),
+                           ("chemistry", submission())]:
+        with pytest.raises(ValueError):
+            service.submit(agent, payload)
+    assert list(service.jobs) == ["one"]
+
+
+def test_oldest_finished_jobs_are_dropped(service):
+    job_ids = [service.submit("technical", submission(answers=f"Answer {i}")) for i in range(2)]
+    for job_id in job_ids:
+        service.get(job_id, wait=10)
+    newest = service.submit("technical", submission(answers="Answer 2"))
+
+    assert service.get(job_ids[0]) is None
+    finished = {job["job_id"]: job for job in service.as_completed([job_ids[0], newest])}
+    assert finished[job_ids[0]]["status"] == FAILED
+    assert finished[newest]["status"] == DONE
@@ -0,0 +1,67 @@
+import json
+
+import run_example
+from job_store import EXTRACTED, FAILED, GRADED, PENDING, JobStore
+
+RESULT = {"question_1": {"score": 1, "max_score": 2, "feedback": "ok"}, "total_score": 1, "total_max_score": 2}
+
+
+def submissions(tmp_path, count):
+    files = []
+    for i in range(count):
+        path = tmp_path / f"student{i}.md"
+        path.write_text(f"## Question 1\nAnswer {i}", encoding="utf-8")
+        files.append(path)
+    return files
+
+
+def test_progress_survives_reopening(tmp_path):
+    files = [str(path) for path in submissions(tmp_path, 3)]
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    store.create_job("job", "technical", {})
+    store.add_submissions("job", files)
+    store.mark_extracted("job", files[0], "markdown")
+    store.mark_graded("job", files[1], RESULT)
+    store.mark_failed("job", files[2], "boom")
+    store.close()
+
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    store.add_submissions("job", files)
+    assert store.counts("job") == {EXTRACTED: 1, GRADED: 1, FAILED: 1}
+    assert store.get("job", files[0])["markdown"] == "markdown"
+    assert store.get("job", files[1])["result"] == RESULT
+    assert store.get("job", files[2])["attempts"] == 1
+
+
+def test_changed_file_starts_over(tmp_path):
+    path = submissions(tmp_path, 1)[0]
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    store.add_submissions("job", [str(path)])
+    store.mark_graded("job", str(path), RESULT)
+    path.write_text("## Question 1\nA different answer", encoding="utf-8")
+    store.add_submissions("job", [str(path)])
+    record = store.get("job", str(path))
+    assert (record["status"], record["result"], record["attempts"]) == (PENDING, None, 0)
+
+
+def test_resumed_batch_only_grades_the_rest(tmp_path, monkeypatch):
+    files = submissions(tmp_path, 3)
+    questions = tmp_path / "questions.md"
+    questions.write_text("## Question 1\nWhy?", encoding="utf-8")
+    graded = []
+
+    def grade(questions, answers, rubric, per_question=False):
+        graded.append(answers)
+        return RESULT
+
+    monkeypatch.setattr(run_example, "load_grader", lambda agent, function_name=None: grade)
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    store.add_submissions("job", [str(files[0])])
+    store.mark_graded("job", str(files[0]), RESULT)
+
+    output = tmp_path / "out.jsonl"
+    run_example.run_batch("technical", files, questions, output=str(output), job_store=store, job_id="job")
+    records = [json.loads(line) for line in output.read_text(encoding="utf-8").splitlines()]
+    assert sorted(graded) == ["## Question 1\nAnswer 1", "## Question 1\nAnswer 2"]
+    assert [record.get("resumed", False) for record in records] == [True, False, False]
+    assert store.counts("job") == {GRADED: 3}
@@ -0,0 +1,41 @@
+import json
+
+from llm_backend import FakeBackend, RecordingBackend
+
+MESSAGES = [{"role": "system", "content": "Grade the exam."},
+            {"role": "user", "content": "## Question 1\nWhy?\n\n## Question 2\nHow?"}]
+
+
+def test_fake_backend_is_deterministic():
+    first, usage = FakeBackend().chat(MESSAGES, "gpt-4o", 0, seed=42)
+    second, _ = FakeBackend().chat(MESSAGES, "gpt-4o", 0, seed=42)
+    assert first == second
+    result = json.loads(first)
+    assert sorted(result) == ["question_1", "question_2", "total_max_score", "total_score"]
+    assert result["total_score"] == sum(result[key]["score"] for key in ("question_1", "question_2"))
+    assert usage.prompt_tokens > 0
+
+
+def test_fake_stream_reassembles_to_the_completion():
+    backend = FakeBackend()
+    content, _ = backend.chat(MESSAGES, "gpt-4o", 0)
+    pieces = list(backend.chat_stream(MESSAGES, "gpt-4o", 0))
+    assert "".join(delta for delta, _ in pieces[:-1]) == content
+    assert pieces[-1][0] is None and pieces[-1][1] is not None
+
+
+def test_recorded_responses_are_replayed(tmp_path):
+    record_file = tmp_path / "recorded.jsonl"
+
+    class Scripted(FakeBackend):
+        def chat(self, messages, model, temperature, **params):
+            return '{"recorded": true}', None
+
+    recorder = RecordingBackend(Scripted(), str(record_file))
+    assert recorder.chat(MESSAGES, "gpt-4o", 0, seed=42)[0] == '{"recorded": true}'
+
+    replay = FakeBackend(str(record_file))
+    assert replay.chat(MESSAGES, "gpt-4o", 0, seed=42)[0] == '{"recorded": true}'
+    # A different request isn't in the recording, so it's synthesized
+    assert replay.chat(MESSAGES, "gpt-4o", 0, seed=7)[0] != '{"recorded": true}'
+    assert replay.metrics() == {"calls": 2, "replayed": 1}
@@ -0,0 +1,91 @@
+import time
+
+import pytest
+
+import llm_client
+from llm_backend import LLMBackend, get_backend, set_backend
+from llm_cache import ResponseCache
+
+
+class ScriptedBackend(LLMBackend):
+    """Cacheable backend answering with the given responses in turn."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def chat(self, messages, model, temperature, **params):
+        self.calls += 1
+        return self.responses.pop(0), None
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    monkeypatch.setattr(llm_client, "response_cache", cache)
+    return cache
+
+
+@pytest.fixture
+def scripted():
+    previous = get_backend()
+
+    def use(*responses):
+        backend = ScriptedBackend(*responses)
+        set_backend(backend)
+        return backend
+
+    yield use
+    set_backend(previous)
+
+
+def test_key_covers_every_sampling_parameter():
+    messages = [{"role": "user", "content": "hi"}]
+    key = ResponseCache.make_key("gpt-4o", messages, 0.2, 7)
+    assert ResponseCache.make_key("gpt-4o", list(messages), 0.2, 7) == key
+    assert ResponseCache.make_key("gpt-4o", messages, 0.2, 8) != key
+    assert ResponseCache.make_key("gpt-4o", messages, 0.2, 7, max_tokens=10) != key
+
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), ttl_seconds=0.05)
+    cache.put("key", "gpt-4o", "response")
+    assert cache.get("key") == "response"
+    time.sleep(0.1)
+    assert cache.get("key") is None
+    cache.evict()
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 0}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), max_entries=2)
+    for key in ("a", "b", "c"):
+        cache.put(key, "gpt-4o", key)
+        time.sleep(0.01)
+    cache.get("a")
+    cache.evict()
+    assert [cache.get(key) for key in ("a", "b", "c")] == ["a", None, "c"]
+
+
+def test_only_accepted_responses_are_cached(cache, scripted):
+    backend = scripted("not json", '{"score": 1}', "unused")
+    accept = lambda content: content.startswith("{")
+    assert llm_client.chat_completion("system", "user", "gpt-4o", 0, accept=accept) == "not json"
+    # The rejected response isn't replayed: the retry reaches the model again
+    assert llm_client.chat_completion("system", "user", "gpt-4o", 0, accept=accept) == '{"score": 1}'
+    assert llm_client.chat_completion("system", "user", "gpt-4o", 0, accept=accept) == '{"score": 1}'
+    assert backend.calls == 2
+    assert cache.stats()["entries"] == 1
+
+
+def test_only_accepted_streams_are_cached(cache, scripted):
+    backend = scripted("not json", '{"score": 1}', "unused")
+    accept = lambda content: content.startswith("{")
+
+    def stream():
+        return "".join(llm_client.chat_completion_stream("system", "user", "gpt-4o", 0, accept=accept))
+
+    assert stream() == "not json"
+    assert stream() == '{"score": 1}'
+    assert stream() == '{"score": 1}'
+    assert backend.calls == 2
@@ -0,0 +1,62 @@
+from llm_backend import COMPLETION_TOKEN_ALLOWANCE
+from packed_grading import completion_allowance, grade_pack, plan_packs
+from structured_output import model_info
+
+
+def build_prompt(questions, answers, rubric):
+    return {"system": "Grade the exam.", "user": f"{questions}\n\n{rubric or ''}\n\n{answers}"}
+
+
+def answers(tokens):
+    return "x" * (tokens * 4)
+
+
+def test_model_info_uses_longest_prefix():
+    assert model_info("gpt-4")["context_window"] == 8192
+    assert model_info("gpt-4-0613")["context_window"] == 8192
+    assert model_info("gpt-4o-mini")["context_window"] == 128000
+    assert model_info("some-local-model")["context_window"] == 8192
+
+
+def test_completion_allowance_grows_with_the_questions():
+    assert completion_allowance("Question 1") == COMPLETION_TOKEN_ALLOWANCE
+    many = "\n".join(f"Question {i}\nWhy?" for i in range(1, 21))
+    assert completion_allowance(many) > COMPLETION_TOKEN_ALLOWANCE
+
+
+def test_packs_respect_pack_size():
+    submissions = {f"s{i}": answers(10) for i in range(5)}
+    assert plan_packs("Question 1", submissions, None, build_prompt, 2, "gpt-4o") == [
+        ["s0", "s1"], ["s2", "s3"], ["s4"]]
+
+
+def test_packs_leave_room_for_each_students_completion():
+    # Each student takes its answers plus COMPLETION_TOKEN_ALLOWANCE of gpt-4's
+    # 8k window, so only three of them fit alongside the shared prompt
+    submissions = {f"s{i}": answers(2500 - COMPLETION_TOKEN_ALLOWANCE) for i in range(4)}
+    packs = plan_packs("Question 1", submissions, None, build_prompt, 10, "gpt-4")
+    assert [len(pack) for pack in packs] == [3, 1]
+    assert plan_packs("Question 1", submissions, None, build_prompt, 10, "gpt-4o") == [list(submissions)]
+
+
+def test_prompt_too_large_for_the_model_gets_its_own_pack():
+    questions = answers(7000)
+    submissions = {f"s{i}": answers(100) for i in range(3)}
+    assert plan_packs(questions, submissions, None, build_prompt, 4, "gpt-4") == [["s0"], ["s1"], ["s2"]]
+
+
+def test_token_budget_caps_the_prompt():
+    submissions = {f"s{i}": answers(500) for i in range(4)}
+    packs = plan_packs("Question 1", submissions, None, build_prompt, 4, "gpt-4o", token_budget=1200)
+    assert packs == [["s0", "s1"], ["s2", "s3"]]
+
+
+def test_grade_pack_caps_the_completion():
+    sent = {}
+
+    def send(system, user, accept, max_tokens):
+        sent["max_tokens"] = max_tokens
+        return None
+
+    grade_pack("Question 1", {"a": "x", "b": "y"}, None, build_prompt, send, lambda *args: {"graded": True})
+    assert sent["max_tokens"] == 2 * COMPLETION_TOKEN_ALLOWANCE
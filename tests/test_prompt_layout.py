@@ -0,0 +1,35 @@
+from narrative_agent.narrative_grader_agent import build_narrative_prompt
+from prompt_layout import assemble_prompt, normalize_section
+from technical_agent.tech_grader_agent import build_tech_grading_prompt
+
+QUESTIONS = "## Question 1\nExplain recursion.\n\n## Question 2\nWhat is a hash table?"
+RUBRIC = "Question 1: 5 points\nQuestion 2: 5 points"
+
+
+def shared_prefix(first: str, second: str) -> str:
+    length = 0
+    while length < min(len(first), len(second)) and first[length] == second[length]:
+        length += 1
+    return first[:length]
+
+
+def test_sections_are_normalized():
+    assert normalize_section("  \r\nLine one   \r\nLine two\t\n\n") == "Line one\nLine two"
+    assert normalize_section(None) == ""
+
+
+def test_per_submission_sections_come_last():
+    prompt = assemble_prompt([("# Rubric", RUBRIC)], [("# Answers", "42")])
+    assert prompt == f"# Rubric\n{RUBRIC}\n\n# Answers\n42"
+
+
+def test_shared_prefix_is_identical_across_students():
+    # The same rubric loaded from different sources differs in line endings and trailing spaces
+    for build in (build_tech_grading_prompt, build_narrative_prompt):
+        first = build(QUESTIONS, "Recursion is a function calling itself.", RUBRIC)
+        second = build(QUESTIONS.replace("\n", "\r\n"), "A hash table maps keys to buckets.", RUBRIC + "  \n")
+        assert first["system"] == second["system"]
+        prefix = shared_prefix(first["user"], second["user"])
+        assert QUESTIONS in prefix and RUBRIC in prefix
+        assert "Recursion is" not in prefix
+        assert first["user"][len(prefix):].startswith("Recursion is")
@@ -0,0 +1,100 @@
+import time
+
+import openai
+import pytest
+
+import request_scheduler
+from fake_openai_server import start_fake_server
+from llm_backend import OpenAICompatibleBackend
+from request_scheduler import RequestScheduler, TokenBucket, parse_reset_duration
+
+MESSAGES = [{"role": "user", "content": "## Question 1\nWhat is 2 + 2?"}]
+
+
+@pytest.fixture
+def fake_server():
+    servers = []
+
+    def start(**options):
+        server = start_fake_server(**options)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(request_scheduler, "BACKOFF_BASE_SECONDS", 0.001)
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("20ms", 0.02),
+    ("1s", 1),
+    ("6m0s", 360),
+    ("1h2m3.5s", 3723.5),
+    ("1.5", 1.5),
+])
+def test_parse_reset_duration(value, seconds):
+    assert parse_reset_duration(value) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize("value", [None, "", "soon"])
+def test_parse_reset_duration_unparseable(value):
+    assert parse_reset_duration(value) is None
+
+
+def test_unlimited_bucket_never_waits():
+    assert TokenBucket(0).acquire(10 ** 9) == 0
+
+
+def test_bucket_waits_once_drained():
+    bucket = TokenBucket(6000)
+    assert bucket.acquire(6000) == 0
+    assert bucket.acquire(10) == pytest.approx(0.1, abs=0.05)
+
+
+def test_unlimited_bucket_adopts_reported_limit():
+    bucket = TokenBucket(0)
+    bucket.observe(limit=3000, remaining=3000, reset_seconds=None)
+    assert bucket.rate_per_minute == 3000
+    assert bucket.acquire(3000) == 0
+
+
+def test_bucket_blocks_until_reported_reset():
+    bucket = TokenBucket(6000)
+    bucket.observe(limit=None, remaining=0, reset_seconds=0.1)
+    start = time.monotonic()
+    bucket.acquire(1)
+    assert time.monotonic() - start >= 0.09
+
+
+def test_scheduler_retries_rate_limited_requests(fake_server):
+    server = fake_server(fail_rate=0.5)
+    backend = OpenAICompatibleBackend(server.base_url, scheduler=RequestScheduler(max_retries=30))
+
+    for _ in range(20):
+        content, _ = backend.chat(MESSAGES, "gpt-4o-mini", 0)
+        assert "question_1" in content
+
+    metrics = backend.scheduler.metrics()
+    assert metrics["calls"] == 20
+    assert metrics["failures"] == 0
+    assert metrics["retries"] > 0
+    assert server.requests == metrics["calls"] + metrics["retries"]
+    assert metrics["latency_p50"] <= metrics["latency_p95"] <= metrics["latency_max"]
+
+
+def test_scheduler_gives_up_after_max_retries(fake_server):
+    server = fake_server(fail_rate=1.0)
+    backend = OpenAICompatibleBackend(server.base_url, scheduler=RequestScheduler(max_retries=2))
+
+    with pytest.raises(openai.RateLimitError):
+        backend.chat(MESSAGES, "gpt-4o-mini", 0)
+
+    metrics = backend.scheduler.metrics()
+    assert server.requests == 3
+    assert (metrics["calls"], metrics["retries"], metrics["failures"]) == (0, 2, 1)
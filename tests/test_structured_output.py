@@ -0,0 +1,67 @@
+import json
+
+from structured_output import (QuestionStreamParser, exam_response_ok, loads_lenient, parse_exam_response,
+                               pitch_response_ok, stream_exam_result)
+
+RESULT = {
+    "question_1": {"score": 2, "max_score": 3, "feedback": "Use ```prolog\nfoo(X) :- bar(X).\n``` instead."},
+    "question_2": {"score": 1, "max_score": 1, "feedback": "Correct."},
+    "total_score": 3,
+    "total_max_score": 4,
+}
+
+
+def test_loads_lenient_keeps_fences_inside_feedback():
+    assert loads_lenient(json.dumps(RESULT)) == RESULT
+
+
+def test_loads_lenient_strips_wrapping_fence_and_prose():
+    assert loads_lenient(f"```json\n{json.dumps(RESULT)}\n```") == RESULT
+    assert loads_lenient(f"Here are the grades:\n```json\n{json.dumps(RESULT)}\n```\nDone.") == RESULT
+
+
+def test_loads_lenient_drops_trailing_commas():
+    assert loads_lenient('```\n{"a": [1, 2,], "b": {"c": "x,"},}\n```') == {"a": [1, 2], "b": {"c": "x,"}}
+
+
+def test_totals_must_add_up():
+    assert exam_response_ok(json.dumps(RESULT))
+    assert not exam_response_ok(json.dumps({**RESULT, "total_score": 4}))
+    assert not exam_response_ok(json.dumps({key: value for key, value in RESULT.items() if key != "total_score"}))
+    assert parse_exam_response(json.dumps({**RESULT, "total_score": 4}), repair=False) is None
+
+
+def test_pitch_scores_are_range_checked():
+    card = {"Problem": 7, "Market": 6, "Solution": 7, "Delivery": 8, "Feedback": "Clear ask."}
+    assert pitch_response_ok(json.dumps(card))
+    assert not pitch_response_ok(json.dumps({**card, "Market": 11}))
+
+
+def test_stream_parser_yields_each_question_as_it_closes():
+    text = json.dumps(RESULT)
+    parser = QuestionStreamParser()
+    closed = []
+    for i in range(0, len(text), 7):
+        closed += [key for key, _ in parser.feed(text[i:i + 7])]
+        if closed == ["question_1"]:
+            # question_2 is still being generated
+            assert '"question_2": {"score": 1, "max_score": 1, "feedback": "Correct."}' not in parser.text
+    assert closed == ["question_1", "question_2"]
+
+
+def test_stream_parser_skips_invalid_entries():
+    parser = QuestionStreamParser()
+    assert parser.feed('{"question_1": {"score": "high"}, "question_2": ') == []
+    assert parser.feed('{"score": 1, "max_score": 1, "feedback": "ok"}}') == [
+        ("question_2", {"score": 1, "max_score": 1, "feedback": "ok"})]
+
+
+def test_stream_with_unquoted_keys_falls_back_to_the_full_parse():
+    events = list(stream_exam_result(['{question_1: {"score": 1, "max_score": 2}}'], repair=False))
+    assert events == [("result", None)]
+
+
+def test_stream_result_is_validated():
+    events = list(stream_exam_result([json.dumps(RESULT)], repair=False))
+    assert [key for key, _ in events] == ["question_1", "question_2", "result"]
+    assert events[-1][1]["total_score"] == 3
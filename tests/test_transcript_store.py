@@ -0,0 +1,33 @@
+import json
+import os
+
+from vc_pitch_agent.transcript_store import TranscriptStore
+
+
+def test_round_trip_merges_fields(tmp_path):
+    store = TranscriptStore(str(tmp_path))
+    assert store.get("abc", "whisper-1") is None
+    store.update("abc", "whisper-1", text="Hello investors", segments=[{"start": 0.0, "end": 1.5, "text": "Hello"}])
+    store.update("abc", "whisper-1", duration=90.0)
+
+    record = TranscriptStore(str(tmp_path)).get("abc", "whisper-1")
+    assert record["text"] == "Hello investors"
+    assert record["segments"][0]["end"] == 1.5
+    assert record["duration"] == 90.0
+    assert record["audio_sha256"] == "abc"
+    # Another model's transcript of the same recording is a separate entry
+    assert store.get("abc", "gpt-4o-transcribe") is None
+
+
+def test_least_recently_used_records_are_pruned(tmp_path):
+    text = "x" * 300
+    record_size = len(json.dumps(TranscriptStore(str(tmp_path / "probe")).update("used", "whisper-1", text=text)))
+    # Room for three records
+    store = TranscriptStore(str(tmp_path / "store"), max_bytes=record_size * 7 // 2)
+    for i, audio_hash in enumerate(["used", "old"]):
+        store.update(audio_hash, "whisper-1", text=text)
+        os.utime(tmp_path / "store" / f"{audio_hash}.whisper-1.json", (i, i))
+    assert store.get("used", "whisper-1")["text"] == text
+    store.update("new", "whisper-1", text=text)
+    store.update("newest", "whisper-1", text=text)
+    assert sorted(os.listdir(tmp_path / "store")) == ["new.whisper-1.json", "newest.whisper-1.json", "used.whisper-1.json"]
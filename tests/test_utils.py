@@ -0,0 +1,123 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+import utils
+from utils import (MarkdownCache, _page_to_markdown, extract_pdf_to_markdown, iter_pdf_markdown,
+                   parse_page_range, pdf_cache_key)
+
+SAMPLE_PDF = Path(__file__).resolve().parent.parent / "narrative_agent" / "test_input_files" / "student_answers" / "exam1_student2.pdf"
+
+
+class FakePage:
+    """Just enough of a pdfplumber page for _page_to_markdown."""
+
+    def __init__(self, edges=()):
+        self.edges = [{"orientation": orientation} for orientation in edges]
+        self.lines = self.edges
+        self.rects = self.curves = []
+        self.table_calls = 0
+
+    def extract_text(self):
+        return "Some text"
+
+    def extract_tables(self):
+        self.table_calls += 1
+        return [[["a", "b"], ["1", None]]]
+
+
+def test_markdown_cache_round_trip(tmp_path):
+    cache = MarkdownCache(str(tmp_path), max_bytes=1024 * 1024, memory_size=1)
+    assert cache.get("a") is None
+    cache.put("a", "# A")
+    cache.put("b", "# B")
+    # "a" fell out of the in-memory LRU but is still read back from disk
+    assert cache.get("a") == "# A"
+    assert MarkdownCache(str(tmp_path)).get("b") == "# B"
+
+
+def test_markdown_cache_evicts_least_recently_used_files(tmp_path):
+    cache = MarkdownCache(str(tmp_path), max_bytes=350, memory_size=0)
+    for i, key in enumerate(["used", "old", "new"]):
+        cache.put(key, "x" * 100)
+        os.utime(tmp_path / f"{key}.md", (i, i))
+    # Reading "used" bumps it past the others, so "old" is the one evicted
+    assert cache.get("used") == "x" * 100
+    cache.put("newest", "x" * 100)
+    assert sorted(os.listdir(tmp_path)) == ["new.md", "newest.md", "used.md"]
+
+
+def test_extraction_is_cached_by_content(tmp_path, monkeypatch):
+    extracted = []
+    extract = utils._extract_pdf_uncached
+
+    def counting(pdf_path, *args):
+        extracted.append(pdf_path)
+        return extract(pdf_path, *args)
+
+    monkeypatch.setattr(utils, "pdf_markdown_cache", MarkdownCache(str(tmp_path / "cache")))
+    monkeypatch.setattr(utils, "_extract_pdf_uncached", counting)
+    copy = tmp_path / "renamed.pdf"
+    shutil.copy(SAMPLE_PDF, copy)
+    markdown = extract_pdf_to_markdown(str(SAMPLE_PDF))
+    assert extract_pdf_to_markdown(str(copy)) == markdown
+    assert extracted == [str(SAMPLE_PDF)]
+
+
+def test_cache_key_follows_content_pages_and_table_mode(tmp_path):
+    copy = tmp_path / "renamed.pdf"
+    shutil.copy(SAMPLE_PDF, copy)
+    key = pdf_cache_key(SAMPLE_PDF)
+    assert pdf_cache_key(copy) == key
+    assert pdf_cache_key(SAMPLE_PDF, pages="1") != key
+    assert pdf_cache_key(SAMPLE_PDF, pages=[2, 1, 2]) == pdf_cache_key(SAMPLE_PDF, pages=[1, 2])
+    assert pdf_cache_key(SAMPLE_PDF, table_mode="always") != pdf_cache_key(SAMPLE_PDF, table_mode="never")
+
+
+def test_parse_page_range():
+    assert parse_page_range(None, 3) == [1, 2, 3]
+    assert parse_page_range("1-3, 7,2", 10) == [1, 2, 3, 7]
+    assert parse_page_range([3, 1, 3], 3) == [1, 3]
+    with pytest.raises(ValueError):
+        parse_page_range("2-4", 3)
+
+
+def test_page_selection_is_extracted_and_cached_separately():
+    first_page = extract_pdf_to_markdown(str(SAMPLE_PDF), pages="1")
+    assert first_page.startswith("## Page 1") and "## Page 2" not in first_page
+    assert extract_pdf_to_markdown(str(SAMPLE_PDF)).startswith(first_page)
+
+
+def test_parallel_extraction_keeps_page_order(monkeypatch):
+    monkeypatch.setattr(utils, "PDF_WORKERS", 2)
+    monkeypatch.setattr(utils, "PDF_PARALLEL_MIN_PAGES", 2)
+    serial = extract_pdf_to_markdown(str(SAMPLE_PDF), workers=1, use_cache=False)
+    assert extract_pdf_to_markdown(str(SAMPLE_PDF), workers=2, use_cache=False) == serial
+
+
+def test_page_stream_matches_full_extraction():
+    chunks = list(iter_pdf_markdown(str(SAMPLE_PDF)))
+    assert chunks[0].startswith("\n\n## Page 1\n")
+    assert "".join(chunks).strip() == extract_pdf_to_markdown(str(SAMPLE_PDF), use_cache=False)
+    assert list(iter_pdf_markdown(str(SAMPLE_PDF), pages="1")) == chunks[:1]
+
+
+def test_auto_table_mode_skips_pages_without_ruling_edges():
+    plain = FakePage()
+    assert "| a | b |" not in _page_to_markdown(plain, 1, "auto")
+    assert plain.table_calls == 0
+
+    ruled = FakePage(edges="vvhh")
+    assert "| a | b |\n| --- | --- |\n| 1 |  |" in _page_to_markdown(ruled, 1, "auto")
+    assert ruled.table_calls == 1
+
+    always = FakePage()
+    _page_to_markdown(always, 1, "always")
+    assert always.table_calls == 1
+
+
+def test_unknown_table_mode_is_rejected():
+    with pytest.raises(ValueError):
+        extract_pdf_to_markdown(str(SAMPLE_PDF), table_mode="sometimes")
@@ -0,0 +1,23 @@
+from vc_pitch_agent.vc_grader_agent import plan_transcription_chunks
+
+
+def test_short_recording_is_one_chunk():
+    assert plan_transcription_chunks([[0, 50]], 60, max_seconds=300) == [(0.0, 60)]
+
+
+def test_chunks_are_cut_in_pauses():
+    chunks = plan_transcription_chunks([[0, 100], [110, 200], [210, 290], [300, 500]], 520, max_seconds=300)
+    assert chunks == [(0.0, 295.0), (295.0, 520)]
+
+
+def test_long_speech_is_hard_cut():
+    assert plan_transcription_chunks([[0, 700]], 700, max_seconds=300) == [
+        (0.0, 300.0), (300.0, 600.0), (600.0, 700)]
+
+
+def test_chunks_cover_the_recording():
+    intervals = [[i * 37.0, i * 37.0 + 30] for i in range(40)]
+    chunks = plan_transcription_chunks(intervals, 1500, max_seconds=120)
+    assert chunks[0][0] == 0 and chunks[-1][1] == 1500
+    assert all(end - start <= 120 for start, end in chunks)
+    assert all(first[1] == second[0] for first, second in zip(chunks, chunks[1:]))
@@ -1,4 +1,42 @@
-import pdfplumber
+import os
+import hashlib
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+
+from instrumentation import span
+
+# Bump whenever the markdown produced by extract_pdf_to_markdown changes,
+# so stale cache entries are never served.
+EXTRACTOR_VERSION = "2"
+
+# Shared on-disk cache root for derived artifacts (extracted PDFs, ...)
+CACHE_ROOT = os.getenv(
+    "EXAMINER_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "examiner_agents"),
+)
+PDF_CACHE_DIR = os.path.join(CACHE_ROOT, "pdf_markdown")
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+PDF_MEMORY_CACHE_SIZE = 64
+
+# Page-parallel extraction: documents shorter than PDF_PARALLEL_MIN_PAGES are
+# parsed in-process, since handing pages to workers would cost more than it saves.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", os.cpu_count() or 1))
+PDF_PARALLEL_MIN_PAGES = 8
+
+# One pool of PDF_WORKERS processes for the whole process, created on first use.
+# Workers are spawned rather than forked: extraction is called from worker
+# threads (batch runs, Gradio, the grading server), and a child forked from a
+# multi-threaded process can inherit locks held by other threads.
+_extract_pool = None
+_extract_pool_lock = Lock()
+
+# Table extraction is the most expensive step per page. "auto" only runs it on
+# pages whose ruling lines could form a table, "always" on every page and
+# "never" on none.
+PDF_TABLE_MODES = ("auto", "always", "never")
+PDF_TABLE_MODE = os.getenv("PDF_TABLE_MODE", "auto")
 
 def clean_text_formatting(text):
     """
@@ -31,8 +69,8 @@ def convert_table_to_markdown(table):
     header = table[0]
     rows = table[1:]
 
-    # Build the header row
-    md_table = "| " + " | ".join(header) + " |\n"
+    # Build the header row (merged or empty header cells come back as None)
+    md_table = "| " + " | ".join(cell if cell else "" for cell in header) + " |\n"
     md_table += "| " + " | ".join(["---"] * len(header)) + " |\n"
 
     # Add data rows
@@ -41,26 +79,283 @@ def convert_table_to_markdown(table):
 
     return md_table
 
-def extract_pdf_to_markdown(pdf_path):
-    markdown_output = ""
+def file_digest(path, chunk_size=1024 * 1024) -> str:
+    """
+    Returns the SHA-256 hex digest of a file's content.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def prune_cache_dir(directory, max_bytes, suffix=""):
+    """
+    Deletes the least recently used files in `directory` until the total size
+    of files ending in `suffix` fits within `max_bytes`. Recency is the file's
+    mtime, which cache readers bump on every hit.
+    """
+    entries = []
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.is_file() and entry.name.endswith(suffix):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except FileNotFoundError:
+            pass
+
+
+class MarkdownCache:
+    """
+    Two-level cache for extracted markdown: an in-process LRU in front of a
+    size-bounded directory of `<key>.md` files.
+    """
+
+    def __init__(self, directory=PDF_CACHE_DIR, max_bytes=PDF_CACHE_MAX_BYTES,
+                 memory_size=PDF_MEMORY_CACHE_SIZE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".md")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                markdown = f.read()
+            os.utime(path)  # mark as recently used for eviction
+        except FileNotFoundError:
+            return None
+
+        self._remember(key, markdown)
+        return markdown
+
+    def put(self, key, markdown):
+        self._remember(key, markdown)
+
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(markdown)
+        os.replace(tmp_path, self._path(key))
+        prune_cache_dir(self.directory, self.max_bytes, suffix=".md")
+
+    def _remember(self, key, markdown):
+        with self._lock:
+            self._memory[key] = markdown
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_size:
+                self._memory.popitem(last=False)
+
+
+pdf_markdown_cache = MarkdownCache()
+
+
+def parse_page_range(spec, page_count):
+    """
+    Resolves a page selection into a sorted list of 1-based page numbers.
+    `spec` is None (all pages), an iterable of page numbers, or a string
+    such as "1-3,7".
+    """
+    if spec is None:
+        return list(range(1, page_count + 1))
+
+    if isinstance(spec, str):
+        pages = set()
+        for part in spec.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            if "-" in part:
+                first, last = part.split("-", 1)
+                pages.update(range(int(first), int(last) + 1))
+            else:
+                pages.add(int(part))
+    else:
+        pages = set(int(p) for p in spec)
+
+    out_of_range = [p for p in pages if p < 1 or p > page_count]
+    if out_of_range:
+        raise ValueError(f"Page(s) {sorted(out_of_range)} out of range for a {page_count}-page PDF")
+    return sorted(pages)
+
+
+def resolve_table_mode(table_mode=None):
+    table_mode = table_mode or PDF_TABLE_MODE
+    if table_mode not in PDF_TABLE_MODES:
+        raise ValueError(f"Unknown table mode {table_mode!r}; expected one of {', '.join(PDF_TABLE_MODES)}")
+    return table_mode
+
+
+def pdf_cache_key(pdf_path, pages=None, table_mode=None):
+    """
+    Cache key for the markdown of a PDF: content hash, extractor version,
+    page selection and table mode.
+    """
+    page_key = "all" if pages is None else str(pages if isinstance(pages, str) else sorted(set(pages)))
+    table_mode = resolve_table_mode(table_mode)
+    return hashlib.sha256(
+        f"{file_digest(pdf_path)}:{EXTRACTOR_VERSION}:{page_key}:{table_mode}".encode()
+    ).hexdigest()
+
+
+def pdf_page_count(pdf_path):
+    """
+    Returns the number of pages in a PDF without extracting any content.
+    """
+    import pdfplumber
 
     with pdfplumber.open(pdf_path) as pdf:
-        for page_number, page in enumerate(pdf.pages, start=1):
-            text = page.extract_text()
-            tables = page.extract_tables()
+        return len(pdf.pages)
+
+
+def iter_pdf_markdown(pdf_path, pages=None, table_mode=None):
+    """
+    Yields the markdown of a PDF one page at a time (see parse_page_range for
+    `pages`). Each page's parsed objects are released before moving on, so
+    peak memory is bounded by a single page. `"".join(chunks).strip()` gives
+    the same result as extract_pdf_to_markdown.
+    """
+    import pdfplumber
+
+    table_mode = resolve_table_mode(table_mode)
+    with pdfplumber.open(pdf_path) as pdf:
+        for page_number in parse_page_range(pages, len(pdf.pages)):
+            page = pdf.pages[page_number - 1]
+            try:
+                yield _page_to_markdown(page, page_number, table_mode)
+            finally:
+                _release_page(page)
+
+
+def _release_page(page):
+    # pdfplumber >= 0.10 exposes close(); older versions only flush_cache().
+    if hasattr(page, "close"):
+        page.close()
+    else:
+        page.flush_cache()
+
+
+def extract_pdf_to_markdown(pdf_path, pages=None, workers=None, use_cache=True, table_mode=None):
+    """
+    Converts a PDF (or a page range of it, see parse_page_range) into markdown.
+    Long documents are split across a process pool, one contiguous block of
+    pages per worker. Results are cached by file content, so the same exam or
+    rubric PDF is only parsed once across a cohort run. `table_mode` is one
+    of PDF_TABLE_MODES (default PDF_TABLE_MODE).
+    """
+    table_mode = resolve_table_mode(table_mode)
+    with span("pdf.extract", file=os.path.basename(str(pdf_path))) as stage:
+        if not use_cache:
+            return _extract_pdf_uncached(pdf_path, pages, workers, table_mode)
+
+        key = pdf_cache_key(pdf_path, pages, table_mode)
+        markdown = pdf_markdown_cache.get(key)
+        stage.set(cache="miss" if markdown is None else "hit")
+        if markdown is None:
+            markdown = _extract_pdf_uncached(pdf_path, pages, workers, table_mode)
+            pdf_markdown_cache.put(key, markdown)
+        return markdown
+
+
+def page_may_have_tables(page):
+    """
+    Cheap pre-check for page.extract_tables(). With pdfplumber's default
+    "lines" strategy a table is built from the cells formed by ruling edges
+    (lines, rectangle sides, curves), so a page without at least two
+    vertical and two horizontal edges cannot yield one.
+    """
+    if not (page.lines or page.rects or page.curves):
+        return False
+    vertical = horizontal = 0
+    for edge in page.edges:
+        if edge["orientation"] == "v":
+            vertical += 1
+        elif edge["orientation"] == "h":
+            horizontal += 1
+        if vertical >= 2 and horizontal >= 2:
+            return True
+    return False
+
+
+def _page_to_markdown(page, page_number, table_mode="always"):
+    """
+    Renders one pdfplumber page as a markdown chunk.
+    """
+    text = page.extract_text()
+    if table_mode == "always" or (table_mode == "auto" and page_may_have_tables(page)):
+        tables = page.extract_tables()
+    else:
+        tables = []
+
+    parts = [f"\n\n## Page {page_number}\n"]
+
+    # 1. Add extracted text (already respects bullets and numbers)
+    if text:
+        parts.append(clean_text_formatting(text))
+
+    # 2. Add extracted tables in markdown
+    for table in tables:
+        parts.append("\n\n" + convert_table_to_markdown(table))
+
+    return "".join(parts)
+
+
+def _extract_page_chunks(pdf_path, page_numbers, table_mode=None):
+    """
+    Extracts the given 1-based pages, in order, as a list of markdown chunks.
+    Runs in worker processes, so it opens its own handle on the PDF.
+    """
+    return list(iter_pdf_markdown(pdf_path, page_numbers, table_mode))
+
+
+def extraction_pool():
+    """
+    The shared page-extraction process pool (see PDF_WORKERS).
+    """
+    global _extract_pool
+    with _extract_pool_lock:
+        if _extract_pool is None:
+            _extract_pool = ProcessPoolExecutor(max_workers=max(1, PDF_WORKERS),
+                                                mp_context=multiprocessing.get_context("spawn"))
+        return _extract_pool
 
-            markdown_output += f"\n\n## Page {page_number}\n"
 
-            # 1. Add extracted text (already respects bullets and numbers)
-            if text:
-                cleaned_text = clean_text_formatting(text)
-                markdown_output += cleaned_text
+def _extract_pdf_uncached(pdf_path, pages=None, workers=None, table_mode=None):
+    page_numbers = parse_page_range(pages, pdf_page_count(pdf_path))
 
-            # 2. Add extracted tables in markdown
-            for table in tables:
-                markdown_output += "\n\n" + convert_table_to_markdown(table)
+    workers = min(workers or PDF_WORKERS, PDF_WORKERS, len(page_numbers))
+    if workers <= 1 or len(page_numbers) < PDF_PARALLEL_MIN_PAGES:
+        chunks = _extract_page_chunks(pdf_path, page_numbers, table_mode)
+    else:
+        # Contiguous blocks keep each worker's page-tree lookups local,
+        # and map() returns the blocks in submission order.
+        block_size = -(-len(page_numbers) // workers)
+        blocks = [page_numbers[i:i + block_size] for i in range(0, len(page_numbers), block_size)]
+        pool = extraction_pool()
+        chunks = [chunk for block in pool.map(_extract_page_chunks, [pdf_path] * len(blocks), blocks,
+                                              [table_mode] * len(blocks))
+                  for chunk in block]
 
-    return markdown_output.strip()
+    return "".join(chunks).strip()
 
 # Create PDF report #TODO
 # def create_pdf_report(results: dict, output_path: Path):
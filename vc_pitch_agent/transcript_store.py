@@ -0,0 +1,63 @@
+import os
+import json
+import time
+import threading
+from typing import Optional
+
+from utils import CACHE_ROOT, prune_cache_dir
+
+# Config
+TRANSCRIPT_CACHE_DIR = os.getenv("TRANSCRIPT_CACHE_DIR", os.path.join(CACHE_ROOT, "transcripts"))
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.getenv("TRANSCRIPT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+
+class TranscriptStore:
+    """
+    Per-recording store of Whisper transcripts and audio analysis results.
+
+    Records are JSON files named after the audio content hash and the
+    transcription model, so identical recordings share an entry regardless of
+    their filename or the working directory, and different recordings never
+    collide. Writes are atomic (temp file + rename); once the directory grows
+    beyond `max_bytes` the least recently used records are evicted.
+    """
+
+    def __init__(self, root: str = TRANSCRIPT_CACHE_DIR, max_bytes: int = TRANSCRIPT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, audio_hash: str, model: str) -> str:
+        return os.path.join(self.root, f"{audio_hash}.{model}.json")
+
+    def get(self, audio_hash: str, model: str) -> Optional[dict]:
+        path = self._path(audio_hash, model)
+        try:
+            with open(path, encoding="utf-8") as f:
+                record = json.load(f)
+            os.utime(path)  # mark as recently used for eviction
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return record
+
+    def update(self, audio_hash: str, model: str, **fields) -> dict:
+        """
+        Merges `fields` into the recording's entry and writes it back.
+        """
+        with self._lock:
+            record = self.get(audio_hash, model) or {
+                "audio_sha256": audio_hash,
+                "model": model,
+                "created": time.time(),
+            }
+            record.update(fields)
+            record["updated"] = time.time()
+
+            os.makedirs(self.root, exist_ok=True)
+            path = self._path(audio_hash, model)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            prune_cache_dir(self.root, self.max_bytes, suffix=".json")
+        return record
@@ -1,23 +1,40 @@
 import os
-import json
-from typing import Optional, Tuple
+import queue
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from typing import Iterable, Iterator, List, Optional, Tuple
 
-import openai
-import librosa
-from dotenv import load_dotenv
-
-# Load API key
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-assert api_key, "Missing OPENAI_API_KEY in environment"
-openai.api_key = api_key
+from instrumentation import span
+from llm_client import chat_completion, transcribe
+from structured_output import PITCH_JSON_SCHEMA, parse_pitch_response, pitch_response_ok, response_format_for
+from utils import file_digest
+from vc_pitch_agent.transcript_store import TranscriptStore
 
 # Config
 DEFAULT_MODEL = "gpt-4o-mini"
 DEFAULT_TEMPERATURE = 0
 DEFAULT_SEED = 42
-CACHE_DIR = os.path.join(os.getcwd(), "cache")
-os.makedirs(CACHE_DIR, exist_ok=True)
+WHISPER_MODEL = "whisper-1"
+SYSTEM_PROMPT = "You are a helpful pitch grader."
+
+# Audio analysis: silence detection uses librosa.effects.split's frame
+# geometry at 16 kHz, rescaled to the file's native rate when streaming.
+ANALYSIS_SR = 16000
+FRAME_LENGTH = 2048
+HOP_LENGTH = 512
+SILENCE_TOP_DB = 30
+STREAM_BLOCK_FRAMES = 256
+
+# Long recordings are transcribed as parallel chunks cut at pauses
+WHISPER_MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+TRANSCRIPTION_CHUNK_SECONDS = 600
+TRANSCRIPTION_WORKERS = 4
+
+# grade_pitches stage concurrency
+PIPELINE_TRANSCRIPTION_WORKERS = 4
+PIPELINE_ANALYSIS_WORKERS = 2
+PIPELINE_GRADING_WORKERS = 4
 
 # VC grading rubric
 RUBRIC_TEMPLATE = """
@@ -58,45 +75,290 @@ Return valid JSON EXACTLY in this format (no extra keys):
 """
 
 
-def transcribe_audio(mp3_path: str) -> str:
+transcript_store = TranscriptStore()
+
+
+def transcribe_audio(mp3_path: str, audio_hash: Optional[str] = None, chunked: Optional[bool] = None,
+                     profile: Optional[Future] = None) -> str:
     """
-    Transcribes the MP3 using Whisper and caches the result.
+    Transcribes the MP3 using Whisper and caches the text and timestamped
+    segments by audio content.
+    Recordings over the upload limit or TRANSCRIPTION_CHUNK_SECONDS long are
+    transcribed in parallel chunks (see transcribe_chunked); `chunked`
+    forces either path. The chunks are cut at the pauses of the audio
+    profile: pass `profile`, a Future of the one being computed alongside,
+    so the recording isn't decoded a second time for it.
     """
-    cache_file = os.path.join(CACHE_DIR, os.path.basename(mp3_path) + ".txt")
-    if os.path.exists(cache_file):
-        return open(cache_file).read()
+    audio_hash = audio_hash or file_digest(mp3_path)
+    with span("audio.transcribe", file=os.path.basename(mp3_path)) as stage:
+        record = transcript_store.get(audio_hash, WHISPER_MODEL)
+        if record and record.get("text") is not None:
+            stage.set(cache="hit")
+            return record["text"]
+        stage.set(cache="miss")
 
-    with open(mp3_path, "rb") as f:
-        response = openai.audio.transcriptions.create(
-            model="whisper-1",
-            file=f,
-            response_format="text"
-        )
-    transcript = response if isinstance(response, str) else response.get("text", "")
-    with open(cache_file, "w") as f:
-        f.write(transcript)
+        if chunked is None:
+            chunked = _needs_chunking(mp3_path)
+        if chunked:
+            audio_profile = profile.result() if profile is not None else load_audio_profile(mp3_path, audio_hash)
+            result = transcribe_chunked(mp3_path, audio_profile)
+        else:
+            response = transcribe(mp3_path, model=WHISPER_MODEL, response_format="verbose_json")
+            result = {"text": (response.text or "").strip(), "segments": whisper_segments(response)}
+        transcript_store.update(audio_hash, WHISPER_MODEL, text=result["text"],
+                                word_count=len(result["text"].split()), segments=result["segments"])
+        return result["text"]
 
-    return transcript
 
+def whisper_segments(response, offset: float = 0.0) -> List[dict]:
+    """
+    The timestamped segments of a verbose_json transcription, shifted by
+    `offset` seconds.
+    """
+    return [{"start": offset + segment.start, "end": offset + segment.end, "text": segment.text.strip()}
+            for segment in response.segments or []]
 
-def analyze_audio(mp3_path: str) -> Tuple[float, float, str, float]:
+
+def _needs_chunking(mp3_path: str) -> bool:
+    import soundfile
+
+    if os.path.getsize(mp3_path) > WHISPER_MAX_UPLOAD_BYTES:
+        return True
+    try:
+        return soundfile.info(mp3_path).duration > TRANSCRIPTION_CHUNK_SECONDS
+    except RuntimeError:
+        return False
+
+
+def plan_transcription_chunks(intervals: List[List[float]], duration: float,
+                              max_seconds: float = TRANSCRIPTION_CHUNK_SECONDS) -> List[Tuple[float, float]]:
     """
-    Returns WPM, silence ratio, transcript, and duration.
+    Splits a recording into consecutive [start, end) chunks of at most
+    `max_seconds`, cutting in the middle of the pauses between non-silent
+    intervals so no word is split. A single stretch of speech longer than
+    `max_seconds` is hard-cut.
+    """
+    chunks = []
+    chunk_start = 0.0
+    previous_end = 0.0
+    for start, end in intervals:
+        if end - chunk_start > max_seconds and start > chunk_start:
+            cut = (previous_end + start) / 2 if previous_end > chunk_start else start
+            chunks.append((chunk_start, cut))
+            chunk_start = cut
+        while end - chunk_start > max_seconds:
+            chunks.append((chunk_start, chunk_start + max_seconds))
+            chunk_start += max_seconds
+        previous_end = end
+    if duration > chunk_start:
+        chunks.append((chunk_start, duration))
+    return chunks
+
+
+def transcribe_chunked(mp3_path: str, profile: dict, max_seconds: float = TRANSCRIPTION_CHUNK_SECONDS,
+                       workers: int = TRANSCRIPTION_WORKERS) -> dict:
     """
-    y, sr = librosa.load(mp3_path, sr=16000, mono=True)
-    duration = len(y) / sr
+    Transcribes a long recording as concurrent Whisper requests over chunks
+    cut at silence boundaries. Each chunk is decoded to 16 kHz mono FLAC
+    (well under the upload limit for TRANSCRIPTION_CHUNK_SECONDS of audio).
+    Returns the stitched text and the Whisper segments shifted to their
+    offsets in the full recording.
+    """
+    import librosa
+    import soundfile
+
+    chunks = plan_transcription_chunks(profile["intervals"], profile["duration"], max_seconds)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        def transcribe_chunk(index: int):
+            start, end = chunks[index]
+            y, sr = librosa.load(mp3_path, sr=ANALYSIS_SR, mono=True, offset=start, duration=end - start)
+            chunk_path = os.path.join(tmp_dir, f"chunk_{index:04d}.flac")
+            soundfile.write(chunk_path, y, sr)
+            del y
+            return transcribe(chunk_path, model=WHISPER_MODEL, response_format="verbose_json")
+
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks)))) as pool:
+            responses = list(pool.map(transcribe_chunk, range(len(chunks))))
+
+    texts = []
+    segments = []
+    for (offset, _), response in zip(chunks, responses):
+        texts.append((response.text or "").strip())
+        segments += whisper_segments(response, offset)
+    return {"text": " ".join(text for text in texts if text), "segments": segments}
+
+
+def load_audio_profile(mp3_path: str, audio_hash: Optional[str] = None) -> dict:
+    """
+    Returns the audio profile (see profile_audio), computing it only if the
+    transcript store doesn't already hold one for this recording.
+    """
+    audio_hash = audio_hash or file_digest(mp3_path)
+    with span("audio.profile", file=os.path.basename(mp3_path)) as stage:
+        record = transcript_store.get(audio_hash, WHISPER_MODEL)
+        if record and record.get("duration") is not None:
+            stage.set(cache="hit")
+            return {key: record[key] for key in ("duration", "sample_rate", "voiced_seconds", "intervals")}
+        stage.set(cache="miss")
+
+        profile = profile_audio(mp3_path)
+        stage.set(audio_seconds=profile["duration"])
+    transcript_store.update(
+        audio_hash,
+        WHISPER_MODEL,
+        silence_segments=_silence_segments(profile["intervals"], profile["duration"]),
+        **profile
+    )
+    return profile
+
+
+def _silence_segments(intervals: List[List[float]], duration: float) -> List[List[float]]:
+    """
+    Complements non-silent intervals into [start, end] pauses.
+    """
+    segments = []
+    cursor = 0.0
+    for start, end in intervals:
+        if start > cursor:
+            segments.append([cursor, start])
+        cursor = max(cursor, end)
+    if duration > cursor:
+        segments.append([cursor, duration])
+    return segments
+
+
+def _nonsilent_intervals(non_silent, frame_offset: float, hop_seconds: float, duration: float) -> List[List[float]]:
+    """
+    Converts a per-frame non-silent mask into [start, end] intervals in
+    seconds, the same way librosa.effects.split turns frames into samples.
+    """
+    import numpy as np
+
+    edges = np.flatnonzero(np.diff(non_silent.astype(int))) + 1
+    if non_silent.size and non_silent[0]:
+        edges = np.concatenate(([0], edges))
+    if non_silent.size and non_silent[-1]:
+        edges = np.concatenate((edges, [non_silent.size]))
+    times = np.clip(frame_offset + edges * hop_seconds, 0, duration)
+    return [[float(start), float(end)] for start, end in times.reshape(-1, 2)]
+
+
+def profile_audio(mp3_path: str, top_db: float = SILENCE_TOP_DB) -> dict:
+    """
+    Measures duration, voiced time and non-silent intervals without decoding
+    the whole file into memory.
+
+    Duration comes from the stream metadata. The audio is decoded at its
+    native rate in blocks of STREAM_BLOCK_FRAMES analysis frames, keeping
+    only each frame's mean energy, and frames within `top_db` of the
+    loudest one count as voiced (librosa.effects.split's criterion, with
+    the frame geometry it uses at 16 kHz scaled to the native rate).
+    Formats libsndfile can't stream fall back to a full librosa.load.
+    """
+    import librosa
+    import numpy as np
+    import soundfile
+
+    try:
+        info = soundfile.info(mp3_path)
+    except RuntimeError:
+        return _profile_audio_full_decode(mp3_path, top_db)
 
-    transcript = transcribe_audio(mp3_path)
+    sr = info.samplerate
+    duration = info.frames / sr
+    frame_length = max(1, round(FRAME_LENGTH * sr / ANALYSIS_SR))
+    hop_length = max(1, round(HOP_LENGTH * sr / ANALYSIS_SR))
+
+    # Frames straddling a block boundary are completed from a carried-over
+    # tail instead of re-reading (MP3 seeks are expensive).
+    energies = []
+    downmix = np.full(info.channels, 1 / info.channels, dtype=np.float32)  # faster than mean(axis=1)
+    carry = np.zeros(0, dtype=np.float64)
+    for block in soundfile.blocks(mp3_path, blocksize=STREAM_BLOCK_FRAMES * hop_length,
+                                  dtype="float32", always_2d=True):
+        squared = np.concatenate((carry, np.square(block @ downmix, dtype=np.float64)))
+        n_frames = (squared.size - frame_length) // hop_length + 1 if squared.size >= frame_length else 0
+        if n_frames:
+            cumulative = np.concatenate(([0.0], np.cumsum(squared)))
+            starts = np.arange(n_frames) * hop_length
+            energies.append((cumulative[starts + frame_length] - cumulative[starts]) / frame_length)
+        carry = squared[n_frames * hop_length:]
+
+    # Pad the tail with silence like librosa does, so the last samples are framed too
+    if carry.size:
+        tail = np.concatenate((carry, np.zeros(frame_length)))
+        cumulative = np.concatenate(([0.0], np.cumsum(tail)))
+        starts = np.arange((carry.size - 1) // hop_length + 1) * hop_length
+        energies.append((cumulative[starts + frame_length] - cumulative[starts]) / frame_length)
+
+    mse = np.concatenate(energies) if energies else np.zeros(0)
+    db = librosa.power_to_db(mse, ref=np.max, top_db=None) if mse.size else mse
+    intervals = _nonsilent_intervals(db > -top_db, frame_offset=frame_length / 2 / sr,
+                                     hop_seconds=hop_length / sr, duration=duration)
+    return {
+        "duration": duration,
+        "sample_rate": sr,
+        "voiced_seconds": sum(end - start for start, end in intervals),
+        "intervals": intervals,
+    }
+
+
+def _profile_audio_full_decode(mp3_path: str, top_db: float) -> dict:
+    import librosa
+
+    y, sr = librosa.load(mp3_path, sr=ANALYSIS_SR, mono=True)
+    segments = librosa.effects.split(y, top_db=top_db, frame_length=FRAME_LENGTH, hop_length=HOP_LENGTH)
+    intervals = [[start / sr, end / sr] for start, end in segments.tolist()]
+    return {
+        "duration": len(y) / sr,
+        "sample_rate": sr,
+        "voiced_seconds": sum(end - start for start, end in intervals),
+        "intervals": intervals,
+    }
+
+
+def pitch_metrics(transcript: str, profile: dict) -> Tuple[float, float, str, float]:
+    """
+    Combines a transcript and an audio profile into WPM, silence ratio,
+    transcript, and duration.
+    """
+    duration = profile["duration"]
     words = transcript.split()
     wpm = len(words) / (duration / 60) if duration else 0
 
-    segments = librosa.effects.split(y, top_db=30)
-    voiced = sum((end - start) for start, end in segments) / sr
+    voiced = profile["voiced_seconds"]
     silence_ratio = (duration - voiced) / duration if duration else 0
 
     return wpm, silence_ratio, transcript, duration
 
 
+def analysis_stages(mp3_path: str) -> Iterator[Tuple[str, object]]:
+    """
+    Yields ("transcript", text) and ("profile", profile) as each finishes.
+    The Whisper request is sent first and the local signal analysis runs
+    while it is in flight.
+    """
+    audio_hash = file_digest(mp3_path)
+    profile_future = Future()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        transcript_future = pool.submit(transcribe_audio, mp3_path, audio_hash, profile=profile_future)
+        try:
+            profile_future.set_result(load_audio_profile(mp3_path, audio_hash))
+        except Exception as e:
+            profile_future.set_exception(e)
+        for future in as_completed([transcript_future, profile_future]):
+            yield ("transcript" if future is transcript_future else "profile"), future.result()
+
+
+def analyze_audio(mp3_path: str) -> Tuple[float, float, str, float]:
+    """
+    Returns WPM, silence ratio, transcript, and duration.
+    """
+    stages = dict(analysis_stages(mp3_path))
+    return pitch_metrics(stages["transcript"], stages["profile"])
+
+
 def build_vc_prompt(transcript: str, wpm: float, silence: float, duration: float) -> str:
     """
     Composes the full prompt with transcript and metrics.
@@ -114,43 +376,100 @@ Audio metrics:
 """.strip()
 
 
+def chat_params() -> dict:
+    """
+    Model and sampling parameters of the grading request (also used to
+    build Batch API requests, see batch_api).
+    """
+    return {
+        "model": DEFAULT_MODEL,
+        "temperature": DEFAULT_TEMPERATURE,
+        "seed": DEFAULT_SEED,
+        "response_format": response_format_for(DEFAULT_MODEL, PITCH_JSON_SCHEMA),
+    }
+
+
 def call_openai_chat(system: str, user: str) -> str:
     """
-    Sends the prompt to OpenAI and returns the raw response.
+    Sends the prompt to OpenAI and returns the raw response. Only score
+    cards that validate as they are get cached.
     """
-    response = openai.chat.completions.create(
-        model=DEFAULT_MODEL,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user}
-        ],
-        temperature=DEFAULT_TEMPERATURE,
-        seed=DEFAULT_SEED
-    )
-    return response.choices[0].message.content
+    return chat_completion(system, user, accept=pitch_response_ok, **chat_params())
 
 
 def parse_llm_response(content: str) -> Optional[dict]:
     """
-    Parses JSON response from the LLM.
+    Parses and validates the score card (see structured_output), with one
+    repair-only retry if it is malformed.
     """
-    content = content.replace("\n", " ").strip()
-    if content.startswith("```"):
-        content = content.split("```")[1].strip()
+    return parse_pitch_response(content)
 
-    try:
-        return json.loads(content)
-    except json.JSONDecodeError:
-        print("Error: Could not parse LLM response.")
-        print("Raw response:", content)
-        return None
+
+def grade_from_metrics(wpm: float, silence: float, transcript: str, duration: float) -> Optional[dict]:
+    """
+    Grades an already analyzed pitch.
+    """
+    prompt = build_vc_prompt(transcript, wpm, silence, duration)
+    raw_response = call_openai_chat(SYSTEM_PROMPT, prompt)
+    return parse_llm_response(raw_response)
 
 
 def grade_pitch(mp3_path: str) -> Optional[dict]:
     """
     Main grading function for VC pitches.
     """
-    wpm, silence, transcript, duration = analyze_audio(mp3_path)
-    prompt = build_vc_prompt(transcript, wpm, silence, duration)
-    raw_response = call_openai_chat("You are a helpful pitch grader.", prompt)
-    return parse_llm_response(raw_response)
+    return grade_from_metrics(*analyze_audio(mp3_path))
+
+
+def grade_pitches(mp3_paths: Iterable[str], transcription_workers: int = PIPELINE_TRANSCRIPTION_WORKERS,
+                  analysis_workers: int = PIPELINE_ANALYSIS_WORKERS,
+                  grading_workers: int = PIPELINE_GRADING_WORKERS) -> Iterator[Tuple[str, Optional[dict], Optional[str]]]:
+    """
+    Grades many pitches as a pipeline and yields `(path, result, error)` as
+    each one finishes.
+
+    Every pitch is submitted to the transcription and analysis stages at
+    once; as soon as both are done it moves on to the grading stage. Each
+    stage has its own bounded worker pool, so Whisper uploads, local decoding
+    and chat requests of different pitches overlap.
+    """
+    finished: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+    paths = list(mp3_paths)
+
+    # The grading pool is entered first so it outlives the stages feeding it.
+    with ThreadPoolExecutor(max_workers=grading_workers) as grader, \
+            ThreadPoolExecutor(max_workers=analysis_workers) as analyzer, \
+            ThreadPoolExecutor(max_workers=transcription_workers) as transcriber:
+
+        def start(path: str):
+            profile_future = analyzer.submit(load_audio_profile, path)
+            # A long recording's transcription waits for this profile to cut its chunks
+            transcript_future = transcriber.submit(transcribe_audio, path, profile=profile_future)
+            pending = [2]
+            lock = threading.Lock()
+
+            def on_stage_done(_):
+                with lock:
+                    pending[0] -= 1
+                    if pending[0]:
+                        return
+                try:
+                    metrics = pitch_metrics(transcript_future.result(), profile_future.result())
+                    grade_future = grader.submit(grade_from_metrics, *metrics)
+                except Exception as e:
+                    grade_future = Future()
+                    grade_future.set_exception(e)
+                grade_future.add_done_callback(lambda f: finished.put((path, f)))
+
+            transcript_future.add_done_callback(on_stage_done)
+            profile_future.add_done_callback(on_stage_done)
+
+        for path in paths:
+            start(path)
+
+        for _ in paths:
+            path, future = finished.get()
+            try:
+                yield path, future.result(), None
+            except Exception as e:
+                yield path, None, f"{type(e).__name__}: {e}"